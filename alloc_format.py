@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Reader for the binary allocation histograms of the heaptrack and stacktrack
+runtimes, see runtime/alloc_format.h for the layout
+
+Files are memory mapped and the records of every block are exposed as numpy
+structured arrays backed by the mapping, so no record is copied or parsed
+until it is used.
+"""
+import os
+import numpy as np
+
+MAGIC = b"ALLOCHST"
+VERSION = 1
+NAME_LEN = 64
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("version", "<u4"),
+    ("header_size", "<u4"),
+    ("record_size", "<u4"),
+    ("num_types", "<u4"),
+    ("num_records", "<u8"),
+    ("pid", "<u8"),
+    ("benchmark", f"S{NAME_LEN}"),
+    ("instance", f"S{NAME_LEN}"),
+])
+
+RECORD_DTYPE = np.dtype([
+    ("count", "<u8"),
+    ("size", "<i8"),
+    ("type", "<u4"),
+    ("reserved", "<u4"),
+])
+
+
+class AllocFormatError(Exception):
+    """Raised for files that are not valid allocation histograms."""
+    pass
+
+
+class AllocBlock:
+    """
+    Histogram written by a single process: ``records`` is a structured array
+    with ``count``, ``size`` and ``type`` fields, where ``type`` indexes
+    ``types``.
+    """
+
+    def __init__(self, benchmark, instance, pid, types, records):
+        self.benchmark = benchmark
+        self.instance = instance
+        self.pid = pid
+        self.types = types
+        self.records = records
+
+    def type_names(self):
+        return np.asarray(self.types, dtype=object)[self.records["type"]]
+
+
+def is_alloc_file(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_blocks(path):
+    """
+    Memory map an allocation histogram file.
+
+    :raises AllocFormatError: if the file is not a valid histogram
+    :returns: list of :class:`AllocBlock`, one per process that wrote to it
+    """
+    if os.path.getsize(path) == 0:
+        return []
+
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+
+    blocks = []
+    offset = 0
+    while offset < len(data):
+        if offset + HEADER_DTYPE.itemsize > len(data):
+            raise AllocFormatError(f"{path} is truncated")
+
+        header = data[offset:offset + HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0]
+        if header["magic"] != MAGIC:
+            raise AllocFormatError(f"{path} has no histogram at offset {offset}")
+        if header["version"] != VERSION or header["record_size"] != RECORD_DTYPE.itemsize:
+            raise AllocFormatError(f"{path} has unsupported version {header['version']}")
+
+        types_start = offset + HEADER_DTYPE.itemsize
+        types_end = types_start + int(header["num_types"]) * NAME_LEN
+        records_start = offset + int(header["header_size"])
+        records_end = records_start + int(header["num_records"]) * RECORD_DTYPE.itemsize
+        if records_end > len(data):
+            raise AllocFormatError(f"{path} is truncated")
+
+        types = [name.decode() for name in data[types_start:types_end].view(f"S{NAME_LEN}")]
+        records = data[records_start:records_end].view(RECORD_DTYPE)
+
+        blocks.append(AllocBlock(header["benchmark"].decode(), header["instance"].decode(),
+                                 int(header["pid"]), types, records))
+        offset = records_end
+
+    return blocks
+
+
+def iter_records(path):
+    """Yield ``(size, type_name, count)`` for all records in a histogram file."""
+    for block in read_blocks(path):
+        yield from zip(block.records["size"].tolist(), block.type_names().tolist(),
+                       block.records["count"].tolist())
@@ -7,64 +7,25 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib as mpl
 import numpy as np
+from result_store import ResultStore
+from overhead import (ResultMatrix, relative_overhead, improvement, mean_confidence_interval,
+                      alloc_count_overhead, alloc_type_percentages)
 
 RES_DIR = os.path.join(os.getcwd(), "results", "figures")
 graph_counter = 0
 
-def collect_stack_results(result_dir, valid_benches):
-    result_dict = {}
-    for (_, __, files) in os.walk(result_dir):
-        for test_file in files:
-            bench_name = test_file.split('.')
-            bench_name = '.'.join([bench_name[0], bench_name[1]])
-
-            if bench_name not in valid_benches:
-                continue
-            
-            if bench_name not in result_dict.keys():
-                result_dict[bench_name] = {}
-
-            with open(os.path.join(result_dir, test_file), 'r', encoding='utf-8') as f:
-                results = f.readlines()
+# Parsed results are cached in results/store, see result_store.py
+STORE = ResultStore()
 
-                for line in results:
-                    toks = line.split(',')
+def collect_stack_results(result_dir, valid_benches):
+    return STORE.stack_results(result_dir, valid_benches)
 
-                    result_dict[bench_name][int(toks[0].split(':')[1].strip())] = {
-                        'count': int(toks[0].split(' ')[0].strip()),
-                        'type': toks[1].split(':')[1].strip()
-                    }
-        break
-    
-    return result_dict
+# Only available for runs instrumented by the site-indexed AllocTracker pass
+def collect_stack_function_results(result_dir, valid_benches):
+    return STORE.stack_function_results(result_dir, valid_benches)
 
 def collect_malloc_results(result_dir, valid_benches):
-
-    result_dict = {}
-    for (_, __, files) in os.walk(result_dir):
-        for test_file in files:
-            bench_name = test_file.split('.')
-            bench_name = '.'.join([bench_name[0], bench_name[1]])
-
-            if bench_name not in valid_benches:
-                continue
-            
-            if bench_name not in result_dict.keys():
-                result_dict[bench_name] = {}
-
-            with open(os.path.join(result_dir, test_file), 'r', encoding='utf-8') as f:
-                results = f.readlines()
-
-                for line in results:
-                    toks = line.split(',')
-
-                    result_dict[bench_name][int(toks[1].split(':')[1].strip())] = {
-                        'count': int(toks[0].split(':')[1].strip()),
-                        'type': toks[2].split(':')[1].strip()
-                    }
-        break
-    
-    return result_dict
+    return STORE.heap_results(result_dir, valid_benches)
 
 def sum_heap_allocations(allocations, benchmark, types, sum_size):
 
@@ -81,89 +42,33 @@ def sum_heap_allocations(allocations, benchmark, types, sum_size):
     return sum
 
 def collect_perf_results(result_folder, stats, valid_benches):
-    cmd = f"""perf report --stdio --stats \
-    -i {result_folder}"""
-
-    result_dict = {}
-    for (_, __, files) in os.walk(result_folder):
-        for test_file in files:
-            bench_name = test_file.split('.')
-            bench_name = '.'.join([bench_name[0], bench_name[1]])
-
-            if bench_name not in valid_benches:
-                continue
-
-            result = subprocess.run(cmd + "/" + test_file, shell=True, capture_output=True, check=False)
-            result = result.stdout.decode('utf-8').split('\n');
-
-            result_dict[bench_name] = {}
-            for i, line in enumerate(result):
-                stat_name = line.split(':')[0]
-                if stat_name in stats:
-                    stat_value = float(result[i + 1].split(':')[1].strip())
-                    result_dict[bench_name][stat_name] = stat_value
-        break
-    
-    return result_dict
+    return STORE.perf_results(result_folder, stats, valid_benches)
 
 def collect_spec_results(result_file, stats, aggregate):
-    stat_list = map(lambda x:":".join([x, aggregate]), stats)
-
-    cmd = f"""./setup.py report spec2006 {result_file} \
-    --table tsv \
-    -f {" ".join(stat_list)}"""
-
-    result = subprocess.run(cmd, shell=True, capture_output=True, check=False)
-
-    output_table = result.stdout.decode("utf-8").split('\n')
-    output_table = output_table[1:-1]
-
-    result_dict = {}
-    for entry in output_table:
-        res = list(map(lambda x: x.strip('\r'), entry.split("\t")))
-        result_dict[res[0]] = dict(zip(stats, list(map(lambda x: float(x) if "-" not in x else x, res[1:]))))
-
-    return result_dict
+    return STORE.spec_results(result_file, stats, aggregate)
 
 def is_valid_result_file(name):
     return (".err" in name or '.stderr' in name) and "spec" not in name and "compare" not in name
 
 # Overhead of test a over test b
 def heap_overhead_as_percent(test_a, test_b):
+    return alloc_count_overhead(test_a, test_b).to_dict()
 
-    overheads = {}
-    for size, vals in test_a.items():
-        if size not in test_b.keys():
-            overheads[size] = vals['count']
-        else:
-            diff = test_b[size]['count'] - test_a[size]['count']
-            overheads[size] = (diff / vals['count']) * 100
+def overhead_as_percent(base_res, san_res):
+    # Failed tests have "-" values and are left out
+    valid = {bench: stats for bench, stats in san_res.items()
+             if "-" not in stats.values() and bench in base_res}
+    metrics = list(dict.fromkeys(name for stats in valid.values() for name in stats))
 
-    return overheads
+    matrix = ResultMatrix.from_results({'base': base_res, 'san': valid},
+                                       benchmarks=list(valid), metrics=metrics)
+    san_values = matrix.instance('san')
 
-def overhead_as_percent(base_res, san_res):
-    overheads = {}
-
-    for bench, san_stats in san_res.items():
-        if "-" not in san_stats.values():
-            base_values = base_res[bench]
-            for name, value in san_stats.items():
-                if bench not in overheads.keys():
-                    overheads[bench] = {}
-                
-                # This is mainly here for major-faults in perf stats which is sometimes 0 so not included
-                if name not in base_values.keys():
-                    base_values[name] = 0
-
-                if base_values[name] != 0:
-                    diff = value - base_values[name]
-                    overheads[bench][name] = (diff / base_values[name]) * 100
-                else:
-                    overheads[bench][name] = value
-        # else:
-        #     print(f"Failed test: {bench}")
+    # Metrics missing from the baseline (e.g. major-faults which is sometimes
+    # 0 so not included) count as 0
+    overheads = relative_overhead(san_values, matrix.instance('base'))
 
-    return overheads
+    return matrix.to_dict(overheads, mask=~np.isnan(san_values))
 
 def generate_bench_bar(base_res, san_res, desired_bench, desired_stats, instance_name, ax=None):
     overhead = overhead_as_percent(base_res, san_res)
@@ -368,7 +273,9 @@ def generate_heap_sum_bar(heap_res, instance_name, valid_types, ax=None):
         plt.subplots_adjust(left=0.25)
         plt.savefig(os.path.join(RES_DIR, f"heap-sum-bar-{instance_name}.pdf"))
 
-def generate_stack_sum_bar(stack_res, instance_name, valid_types, ax=None):
+# Pass function_res (from collect_stack_function_results) to split the bars by
+# the top_functions functions with the most allocations instead of by type
+def generate_stack_sum_bar(stack_res, instance_name, valid_types, ax=None, function_res=None, top_functions=8):
     plot = ax is None
     
     mpl.style.use('seaborn-v0_8')
@@ -381,28 +288,39 @@ def generate_stack_sum_bar(stack_res, instance_name, valid_types, ax=None):
     mpl.rcParams['ytick.major.size'] = '8.0'
     mpl.rcParams['ytick.minor.size'] = '5.0'
 
-    type_sorted = {}
-    for bench, stats in stack_res.items():
-        type_sorted[bench] = {}
+    if function_res is not None:
+        df = pd.DataFrame.from_dict({
+            bench: {function: sum(count for type, count in types.items() if type in valid_types)
+                    for function, types in functions.items()}
+            for bench, functions in function_res.items()
+        }, orient='index').fillna(0)
 
-        # Sum by type
-        for size, stat in stats.items():
-            if stat['type'] not in type_sorted[bench].keys():
-                type_sorted[bench][stat['type']] = stat['count']
-            else:
-                type_sorted[bench][stat['type']] += stat['count']
+        top = df.sum().nlargest(top_functions).index
+        df = pd.concat([df[top], df.drop(columns=top).sum(axis=1).rename('other')], axis=1)
+        df = df.loc[df.sum(axis=1).sort_values().index]
+    else:
+        type_sorted = {}
+        for bench, stats in stack_res.items():
+            type_sorted[bench] = {}
+
+            # Sum by type
+            for size, stat in stats.items():
+                if stat['type'] not in type_sorted[bench].keys():
+                    type_sorted[bench][stat['type']] = stat['count']
+                else:
+                    type_sorted[bench][stat['type']] += stat['count']
 
 
-    res = dict(sorted(type_sorted.items(), key=lambda x: sum(x[1].values())))
-    print_stack_table(res)
+        res = dict(sorted(type_sorted.items(), key=lambda x: sum(x[1].values())))
+        print_stack_table(res)
     
-    df_stats = {}
-    for type in valid_types:
-        df_stats[type] = list(map(lambda x: x[type] if type in x.keys() else 0, res.values()))
+        df_stats = {}
+        for type in valid_types:
+            df_stats[type] = list(map(lambda x: x[type] if type in x.keys() else 0, res.values()))
 
-    df_stats = dict(filter(lambda x: sum(x[1]) != 0, df_stats.items()))
+        df_stats = dict(filter(lambda x: sum(x[1]) != 0, df_stats.items()))
 
-    df = pd.DataFrame(df_stats, index=res.keys())
+        df = pd.DataFrame(df_stats, index=res.keys())
 
     if ax is not None:
         df.plot.barh(rot=0, legend=True, ax=ax, stacked=True)
@@ -416,7 +334,8 @@ def generate_stack_sum_bar(stack_res, instance_name, valid_types, ax=None):
 
     if plot:
         plt.subplots_adjust(left=0.25)
-        plt.savefig(os.path.join(RES_DIR, f"stack-sum-{instance_name}.pdf"))
+        suffix = "-functions" if function_res is not None else ""
+        plt.savefig(os.path.join(RES_DIR, f"stack-sum-{instance_name}{suffix}.pdf"))
 
 def generate_lib_scatter(bench_heap_res, instance_name, valid_types, lib, cumulative, ax=None):
     plot = ax is None
@@ -745,25 +664,9 @@ def print_heap_sum_table(result):
             print(f"\t - {percent_allocs} are {type}")
 
 def sum_stack_allocations(result):
-    type_sorted = {}
-    for bench, stats in result.items():
-        type_sorted[bench] = {}
+    percents = alloc_type_percentages(result)
 
-        # Sum total
-        total_allocations = sum(list(map(lambda x: x[1]['count'], result[bench].items())))
-
-        # Sum by type
-        for size, stat in stats.items():
-            if stat['type'] not in type_sorted[bench].keys():
-                type_sorted[bench][stat['type']] = stat['count']
-            else:
-                type_sorted[bench][stat['type']] += stat['count']
-
-        # Calculate percents
-        for type, count in type_sorted[bench].items():
-            type_sorted[bench][type] = (count / total_allocations) * 100
-
-    return type_sorted
+    return {bench: row.dropna().to_dict() for bench, row in percents.iterrows()}
 
 def print_stack_table(results):
     for bench, stats in results.items():
@@ -775,35 +678,32 @@ def print_stack_table(results):
 
 
 def print_overhead_compare_table(before_overhead, after_overhead, agg=None):
-    
-    total = {}
-    for bench, stats in before_overhead.items():
-        if bench not in after_overhead.keys():
-            continue
+    agg = agg or []
 
-        print(f"BENCHMARK: {bench}")
-        for name, value in stats.items():
-            if name not in after_overhead[bench].keys():
-                after_overhead[bench][name] = 0
+    benches = [bench for bench in before_overhead if bench in after_overhead]
+    metrics = list(dict.fromkeys(name for bench in benches for name in before_overhead[bench]))
 
-            diff = value - after_overhead[bench][name]
-            if value != 0:
-                improve = (diff / value) * 100
-            else:
-                improve = 100 - diff
+    matrix = ResultMatrix.from_results({'before': before_overhead, 'after': after_overhead},
+                                       benchmarks=benches, metrics=metrics)
+    before = matrix.instance('before')
+    # Stats missing after the change count as 0
+    after = np.nan_to_num(matrix.instance('after'), nan=0.0)
 
-            if name not in total.keys():
-                total[name] = [improve]
-            else:
-                total[name] += [improve]
+    improve = improvement(before, after)
+    valid = ~np.isnan(before)
+    improve[~valid] = np.nan
 
-            print(f"{name} before: {value} - after: {after_overhead[bench][name]} - improvement: {improve}")
+    for b, bench in enumerate(benches):
+        print(f"BENCHMARK: {bench}")
+        for m in np.nonzero(valid[b])[0]:
+            print(f"{metrics[m]} before: {before[b, m]} - after: {after[b, m]} - improvement: {improve[b, m]}")
 
-    for stat, values in total.items():
+    mean, low, high = mean_confidence_interval(improve, axis=0)
+    for m, stat in enumerate(metrics):
         if 'mean' in agg:
-            print(f"The average improvement of {stat} is: {sum(values) / len(values)}")
+            print(f"The average improvement of {stat} is: {mean[m]} (95% CI {low[m]} - {high[m]})")
         # if 'geo' in agg:
-        #     print(f"The geomean improvement of {stat} is: {geomean(values)}")
+        #     print(f"The geomean improvement of {stat} is: {geomean(improve[:, m])}")
 
 styles = ['seaborn-v0_8', 'seaborn-v0_8-bright', 'seaborn-v0_8-colorblind', 'seaborn-v0_8-dark', 'seaborn-v0_8-dark-palette', 'seaborn-v0_8-darkgrid', 'seaborn-v0_8-deep', 'seaborn-v0_8-muted', 'seaborn-v0_8-notebook', 'seaborn-v0_8-paper', 'seaborn-v0_8-pastel', 'seaborn-v0_8-poster', 'seaborn-v0_8-talk', 'seaborn-v0_8-ticks', 'seaborn-v0_8-white', 'seaborn-v0_8-whitegrid']
 
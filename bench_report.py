@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the log parsers of the report command
+
+Generates large synthetic logs and compares the parsers in infra against their
+previous implementations (kept below as reference):
+
+- [setup-report] result lines: parse_all_results against a line-by-line parser
+- SPEC runspec logs (--speclog): the shared one-pass SPEC log parser against
+  the per-benchmark regex search it replaced
+"""
+import argparse
+import logging
+import os
+import re
+import tempfile
+import time
+from collections import defaultdict
+from infra.infra.commands.report import parse_all_results, result_prefix, _unbox_value
+from infra.infra.packages import RusageCounters
+from infra.infra.targets import speclogs
+from infra.infra.util import Namespace
+
+def legacy_parse_all_results(ctx, path):
+    with open(path) as f:
+        result = bname = None
+
+        for line in f:
+            line = line.rstrip()
+            if line.startswith(result_prefix):
+                statement = line[len(result_prefix) + 1:]
+                if re.match(r'begin \w+', statement):
+                    bname = statement[6:]
+                    result = Namespace()
+                elif re.match(r'end \w+', statement):
+                    if result is None:
+                        ctx.log.error('missing start for "%s" end '
+                                      'statement in %s' % (bname, path))
+                    else:
+                        yield bname, result
+                        result = bname = None
+                elif result is not None:
+                    name, value = statement.split(': ', 1)
+                    result[name] = _unbox_value(value)
+
+def legacy_parse_speclog(ctx, logpath):
+    with open(logpath) as f:
+        logcontents = f.read()
+
+    m = re.match(r'^runspec .+ started at .+ on "(.*)"', logcontents)
+    hostname = m.group(1)
+
+    pat = re.compile(r'([^ ]+) ([^ ]+) base (\w+) ratio=(-?[0-9.]+), '
+                     r'runtime=([0-9.]+).*', re.M)
+    m = pat.search(logcontents)
+    while m:
+        status, benchmark, workload, ratio, runtime = m.groups()
+        rusage_counters = defaultdict(int)
+
+        rpat = r'Running %s.+?-C (.+?$)(.+?)^Specinvoke:' % benchmark
+        rundir, arglist = re.search(rpat, logcontents, re.M | re.S).groups()
+        errfiles = re.findall(r'-e ([^ ]+err) \.\./run_', arglist)
+        for errfile in errfiles:
+            for result in RusageCounters.parse_results(ctx, os.path.join(rundir, errfile)):
+                for counter, value in result.items():
+                    rusage_counters[counter] += value
+
+        yield {
+            'benchmark': benchmark,
+            'status': 'ok' if status == 'Success' else 'invalid',
+            'workload': workload,
+            'hostname': hostname,
+            'runtime': float(runtime),
+            'inputs': len(errfiles),
+            **rusage_counters
+        }
+
+        m = pat.search(logcontents, m.end())
+
+def parse_speclog(ctx, logpath):
+    speclogs._read_log.cache_clear()
+    outfile = logpath + '.out'
+    for result in speclogs.parse_outfile(ctx, outfile, 'runspec', ''):
+        if result['status'] != 'error':
+            yield result
+
+def write_speclog(path, size_mb, benchmarks, inputs=3):
+    rundir = os.path.join(os.path.dirname(path), 'run_base_ref.0000')
+    os.makedirs(rundir, exist_ok=True)
+    for i in range(inputs):
+        with open(os.path.join(rundir, f"in{i}.err"), 'w') as f:
+            f.write(f"{result_prefix} begin rusage-counters\n")
+            f.write(f"{result_prefix} maxrss: {1000 + i}\n")
+            f.write(f"{result_prefix} end rusage-counters\n")
+
+    names = [f"{400 + i}.bench{i}" for i in range(benchmarks)]
+    noise = "".join(f"specmake output line {i}: compiling {i * 7}.c\n" for i in range(100))
+    section_size = max(1, size_mb * 1024 * 1024 // benchmarks)
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('runspec v6674 started at 2024-01-01 on "node1"\n')
+        f.write(f"Benchmarks selected: {', '.join(names)}\n")
+        for name in names:
+            f.write(f"  Running {name} ref base infra default\n")
+            for _ in range(max(1, section_size // len(noise))):
+                f.write(noise)
+            f.write(f"Commands to run:\n    -C {rundir}\n")
+            for i in range(inputs):
+                f.write(f"    -o in{i}.out -e in{i}.err ../run_base_ref.0000/{name}_base in{i}\n")
+            f.write(f"Specinvoke: /spec/bin/specinvoke -d {rundir}\n")
+            f.write(f" Success {name} base ref ratio=10.00, runtime=123.456000\n")
+
+    with open(path + '.out', 'w') as f:
+        f.write(f"The log for this run is in {path}\n")
+
+def write_log(path, size_mb, blocks):
+    noise = "".join(f"benchmark output line {i}: some values {i * 7} {i / 3:.4f}\n" for i in range(1000))
+    chunks = max(1, size_mb * 1024 * 1024 // len(noise))
+
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(chunks):
+            f.write(noise)
+            if i % max(1, chunks // blocks) == 0:
+                f.write(f"{result_prefix} begin rusage-counters\n")
+                f.write(f"{result_prefix} benchmark: 400.perlbench\n")
+                f.write(f"{result_prefix} runtime: {i * 1.5}\n")
+                f.write(f"{result_prefix} maxrss: {i * 100}\n")
+                f.write(f"{result_prefix} end rusage-counters\n")
+
+def timed(fn, ctx, path, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = list(fn(ctx, path))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--size', type=int, default=64, help='log size in MB')
+    parser.add_argument('--blocks', type=int, default=100,
+                        help='number of result blocks, or benchmarks with --speclog')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--speclog', action='store_true',
+                        help='benchmark the SPEC log parser instead of result lines')
+    args = parser.parse_args()
+
+    ctx = Namespace(log=logging.getLogger("bench"))
+
+    if args.speclog:
+        write, legacy, new = write_speclog, legacy_parse_speclog, parse_speclog
+        labels = ("regex per benchmark", "one pass")
+    else:
+        write, legacy, new = write_log, legacy_parse_all_results, parse_all_results
+        labels = ("line by line", "mmap + find")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "bench.log")
+        write(path, args.size, args.blocks)
+        size = os.path.getsize(path) / 2**20
+
+        legacy_time, legacy_results = timed(legacy, ctx, path, args.repeat)
+        new_time, new_results = timed(new, ctx, path, args.repeat)
+
+        assert legacy_results == new_results, "parsers disagree"
+
+        width = max(map(len, labels)) + 1
+        print(f"log: {size:.1f} MB, {len(new_results)} results")
+        print(f"{labels[0] + ':':{width}} {legacy_time:.3f}s ({size / legacy_time:.0f} MB/s)")
+        print(f"{labels[1] + ':':{width}} {new_time:.3f}s ({size / new_time:.0f} MB/s, "
+              f"{legacy_time / new_time:.1f}x)")
@@ -5,7 +5,7 @@ from argparse import ArgumentParser
 from collections import OrderedDict
 from inspect import signature
 from multiprocessing import cpu_count
-from .parallel import ProcessPool, SSHPool, PrunPool
+from .parallel import ProcessPool, SSHPool, PrunPool, cpu_slots
 from .util import FatalError, Namespace, Index, param_attrs
 
 
@@ -53,18 +53,66 @@ class Command(metaclass=ABCMeta):
             default="",
             help="ssh remotes to run jobs on (for --parallel=ssh)",
         )
+        parser.add_argument(
+            "--ssh-weighted",
+            action="store_true",
+            help="run as many jobs on each ssh node as it has idle cores (for --parallel=ssh)",
+        )
         parser.add_argument(
             "--prun-opts", default="", help="additional options for prun (for --parallel=prun)"
         )
+        parser.add_argument(
+            "--pin-cpus",
+            action="store_true",
+            help="pin each job to dedicated cores within a NUMA node (for --parallel=proc)",
+        )
+        parser.add_argument(
+            "--cpus-per-job",
+            metavar="N",
+            type=int,
+            default=None,
+            help="number of cores to pin each job to (for --pin-cpus, default: 1)",
+        )
+        parser.add_argument(
+            "--no-smt",
+            action="store_true",
+            help="leave SMT siblings of pinned cores idle (for --pin-cpus)",
+        )
 
     def make_pool(self, ctx):
+        pool = self._make_pool(ctx)
+        if pool:
+            pool.load_durations(os.path.join(ctx.paths.log, "job-durations.json"))
+        return pool
+
+    def _make_pool(self, ctx):
         prun_opts = shlex.split(ctx.args.prun_opts)
 
+        if ctx.args.ssh_weighted and ctx.args.parallel != "ssh":
+            raise FatalError("--ssh-weighted only supported for --parallel=ssh")
+
+        if not ctx.args.pin_cpus:
+            if ctx.args.cpus_per_job is not None:
+                raise FatalError("--cpus-per-job requires --pin-cpus")
+            if ctx.args.no_smt:
+                raise FatalError("--no-smt requires --pin-cpus")
+        elif ctx.args.parallel != "proc":
+            raise FatalError("--pin-cpus only supported for --parallel=proc")
+
         if ctx.args.parallel == "proc":
             if len(prun_opts):
                 raise FatalError("--prun-opts not supported for --parallel=proc")
             if ctx.args.ssh_nodes:
                 raise FatalError("--ssh-nodes not supported for --parallel=proc")
+            if ctx.args.pin_cpus:
+                cpus_per_job = 1 if ctx.args.cpus_per_job is None else ctx.args.cpus_per_job
+                if cpus_per_job < 1:
+                    raise FatalError("--cpus-per-job must be at least 1")
+                slots = cpu_slots(cpus_per_job, not ctx.args.no_smt)
+                if not slots:
+                    raise FatalError("not enough cores for --cpus-per-job=%d" % cpus_per_job)
+                pmax = len(slots) if ctx.args.parallelmax is None else ctx.args.parallelmax
+                return ProcessPool(ctx.log, pmax, slots)
             pmax = cpu_count() if ctx.args.parallelmax is None else ctx.args.parallelmax
             return ProcessPool(ctx.log, pmax)
 
@@ -73,6 +121,10 @@ class Command(metaclass=ABCMeta):
                 raise FatalError("--prun-opts not supported for --parallel=ssh")
             if not ctx.args.ssh_nodes:
                 raise FatalError("--ssh-nodes required for --parallel=ssh")
+            if ctx.args.ssh_weighted:
+                # limited by the capacity of the nodes unless specified
+                return SSHPool(ctx, ctx.log, ctx.args.parallelmax, ctx.args.ssh_nodes,
+                               weighted=True)
             pmax = len(ctx.args.ssh_nodes) if ctx.args.parallelmax is None else ctx.args.parallelmax
             return SSHPool(ctx, ctx.log, pmax, ctx.args.ssh_nodes)
 
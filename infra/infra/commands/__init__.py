@@ -2,4 +2,5 @@ from .build import BuildCommand, ExecHookCommand, PkgBuildCommand
 from .clean import CleanCommand
 from .config import ConfigCommand, PkgConfigCommand
 from .report import ReportCommand
+from .results import ResultsCommand
 from .run import RunCommand
@@ -1,13 +1,18 @@
+import json
 import os
 from multiprocessing import cpu_count
 from ..command import Command, get_deps
 from ..package import Package
+from ..target import Target
+from ..instance import Instance
 from ..util import FatalError, Namespace
 from .clean import clean_package, clean_target
 
 
 default_jobs = min(cpu_count(), 64)
 
+instance_flags_filename = '.instance-flags.json'
+
 
 class BuildCommand(Command):
     name = "build"
@@ -121,6 +126,7 @@ class BuildCommand(Command):
                     target.run_hooks_pre_build(ctx, instance)
                     self.call_with_pool(target.build, (ctx, instance), pool)
                     target.run_hooks_post_build(ctx, instance)
+                    write_instance_flags(ctx, target, instance)
 
             ctx = oldctx
 
@@ -276,3 +282,40 @@ def load_package(ctx: Namespace, package: Package):
 def load_deps(ctx: Namespace, obj):
     for package in get_deps(obj):
         load_package(ctx, package)
+
+
+def write_instance_flags(ctx: Namespace, target: Target, instance: Instance):
+    """
+    Record the compiler flags that an instance of a target was configured
+    with in the target's build directory, so that runs can refer to them
+    without configuring the instance again (see :func:`read_instance_flags`).
+
+    :param ctx: the configuration context, configured for the instance
+    :param target: target that was built
+    :param instance: instance that was built
+    """
+    flags = read_instance_flags(ctx, target)
+    flags[instance.name] = {key: ctx.get(key) for key in
+                            ('cc', 'cxx', 'cflags', 'cxxflags', 'ldflags',
+                             'lib_ldflags')}
+
+    path = target.path(ctx, instance_flags_filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(flags, f, indent=4)
+
+
+def read_instance_flags(ctx: Namespace, target: Target) -> dict:
+    """
+    Read the flags recorded by :func:`write_instance_flags`.
+
+    :param ctx: the configuration context
+    :param target: target that was built
+    :returns: ``{<instance_name>: {<variable>: <value>}}`` of all instances
+              of ``target`` built so far
+    """
+    try:
+        with open(target.path(ctx, instance_flags_filename)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
@@ -1,19 +1,31 @@
 import argparse
 import csv
+import ctypes
+import datetime
 import io
+import json
+import math
+import mmap
+import multiprocessing
 import os
 import re
+import select
+import sqlite3
+import struct
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import redirect_stdout
 from decimal import Decimal
-from functools import reduce
+from functools import lru_cache, reduce
 from itertools import chain, zip_longest
 from statistics import median, pstdev, pvariance, mean
-from typing import Dict, Iterator, Iterable, Tuple, Union
+from typing import Any, Dict, Iterator, Iterable, List, Optional, Tuple, Union
 from ..command import Command
 from ..instance import Instance
 from ..target import Target
 from ..util import FatalError, Namespace
+from .build import default_jobs
 
 # pylint: disable=E1101
 
@@ -64,9 +76,332 @@ _aggregate_fns = {'mean': mean, 'median': median,
                   'geomean': geomean}
 
 
+class _Aggregator:
+    """
+    Online aggregate over a stream of values, the counterpart of an entry in
+    ``_aggregate_fns`` that does not need the whole series in memory. Values
+    are passed one at a time to :func:`add`, :func:`result` may be called at
+    any point.
+    """
+
+    def add(self, value):
+        raise NotImplementedError
+
+    def result(self):
+        raise NotImplementedError
+
+
+class _Moments(_Aggregator):
+    """
+    Count, mean and variance with Welford's algorithm. Integer series are also
+    summed exactly, so that results are converted back to ``int`` when they
+    are integral, like the :mod:`statistics` functions do.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.avg = 0.0
+        self.m2 = 0.0
+        self.ints = True
+        self.total = 0
+        self.total_sq = 0
+
+    def add(self, value):
+        self.n += 1
+        if self.ints and isinstance(value, int) and not isinstance(value, bool):
+            self.total += value
+            self.total_sq += value * value
+        else:
+            self.ints = False
+        delta = value - self.avg
+        self.avg += delta / self.n
+        self.m2 += delta * (value - self.avg)
+
+    def mean(self):
+        if self.n == 0:
+            raise FatalError('mean of empty series')
+        if self.ints:
+            return _int_if_integral(self.total, self.n)
+        return self.avg
+
+    def variance(self):
+        if self.n == 0:
+            raise FatalError('variance of empty series')
+        if self.ints:
+            return _int_if_integral(self.n * self.total_sq - self.total ** 2,
+                                    self.n ** 2)
+        return self.m2 / self.n
+
+    def stdev(self):
+        return self.variance() ** 0.5
+
+
+def _int_if_integral(numerator: int, denominator: int) -> Union[int, float]:
+    if numerator % denominator == 0:
+        return numerator // denominator
+    return numerator / denominator
+
+
+class _Mean(_Moments):
+    def result(self):
+        return self.mean()
+
+
+class _Variance(_Moments):
+    def result(self):
+        return self.variance()
+
+
+class _Stdev(_Moments):
+    def result(self):
+        return self.stdev()
+
+
+class _StdevPercent(_Moments):
+    def result(self):
+        avg = self.mean()
+        return 100 * self.stdev() / avg if avg != 0 else 0
+
+
+class _P2Quantile:
+    """
+    Streaming quantile estimate with the P-square algorithm (Jain and
+    Chlamtac, 1985), which tracks five markers instead of storing the series.
+    """
+
+    def __init__(self, p: float, initial: List[float]):
+        assert len(initial) == 5
+        self.p = p
+        self.q = sorted(initial)
+        self.pos = [1, 2, 3, 4, 5]
+        self.want = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.incr = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        q, pos = self.q, self.pos
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            pos[i] += 1
+        for i in range(5):
+            self.want[i] += self.incr[i]
+
+        for i in (1, 2, 3):
+            d = self.want[i] - pos[i]
+            if (d >= 1 and pos[i + 1] - pos[i] > 1) or \
+                    (d <= -1 and pos[i - 1] - pos[i] < -1):
+                d = 1 if d > 0 else -1
+                qi = self._parabolic(i, d)
+                if not q[i - 1] < qi < q[i + 1]:
+                    qi = q[i] + d * (q[i + d] - q[i]) / (pos[i + d] - pos[i])
+                q[i] = qi
+                pos[i] += d
+
+    def _parabolic(self, i, d):
+        q, n = self.q, self.pos
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def result(self):
+        return self.q[2]
+
+
+class _Median(_Aggregator):
+    """
+    Median that is exact (computed with :func:`statistics.median`) for up to
+    ``exact_limit`` values, and estimated with :class:`_P2Quantile` beyond
+    that so that memory use stays constant.
+    """
+    exact_limit = 10000
+
+    def __init__(self):
+        self.values = []
+        self.estimate = None
+
+    def add(self, value):
+        if self.estimate is not None:
+            self.estimate.add(value)
+        else:
+            self.values.append(value)
+            if len(self.values) > self.exact_limit:
+                self._start_estimate()
+
+    def _start_estimate(self):
+        values = self.values
+        self.estimate = _P2Quantile(0.5, values[:5])
+        for value in values[5:]:
+            self.estimate.add(value)
+        self.values = None
+
+    def result(self):
+        if self.estimate is not None:
+            return self.estimate.result()
+        return median(self.values)
+
+
+class _MedianAbsoluteDeviation(_Median):
+    """
+    Median absolute deviation, exact for up to ``exact_limit`` values. Beyond
+    that the deviations are taken from the running median estimate, which
+    converges to the true median for large series.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.deviations = None
+
+    def add(self, value):
+        # the value that starts the estimate is added by _start_estimate
+        estimating = self.estimate is not None
+        super().add(value)
+        if estimating:
+            self.deviations.add(abs(value - self.estimate.result()))
+
+    def _start_estimate(self):
+        values = self.values
+        super()._start_estimate()
+        med = self.estimate.result()
+        self.deviations = _P2Quantile(0.5, [abs(x - med) for x in values[:5]])
+        for value in values[5:]:
+            self.deviations.add(abs(value - med))
+
+    def result(self):
+        if self.deviations is not None:
+            return self.deviations.result()
+        return median_absolute_deviation(self.values)
+
+
+class _Reduce(_Aggregator):
+    """Running ``min``/``max``/``sum`` that keeps a single value."""
+
+    def __init__(self, fn, empty=None):
+        self.fn = fn
+        self.value = empty
+        self.empty = empty is None
+
+    def add(self, value):
+        if self.empty:
+            self.value = value
+            self.empty = False
+        else:
+            self.value = self.fn(self.value, value)
+
+    def result(self):
+        if self.empty:
+            raise FatalError('aggregate of empty series')
+        return self.value
+
+
+class _Count(_Aggregator):
+    def __init__(self):
+        self.n = 0
+
+    def add(self, value):
+        self.n += 1
+
+    def result(self):
+        return self.n
+
+
+class _Geomean(_Aggregator):
+    """Geometric mean as a sum of logarithms, which does not overflow."""
+
+    def __init__(self):
+        self.n = 0
+        self.log_sum = 0.0
+        self.negative = False
+        self.zero = False
+
+    def add(self, value):
+        self.n += 1
+        if value == 0:
+            self.zero = True
+        else:
+            self.log_sum += math.log(abs(value))
+            self.negative ^= value < 0
+
+    def result(self):
+        assert self.n > 0
+        if self.zero:
+            return 0.0
+        if self.negative:
+            # Keep the complex result of the product based implementation
+            return (-math.exp(self.log_sum)) ** (1.0 / self.n)
+        return math.exp(self.log_sum / self.n)
+
+
+class _Same(_Aggregator):
+    def __init__(self, name, many):
+        self.name = name
+        self.many = many
+        self.values = []
+
+    def add(self, value):
+        if not self.values:
+            self.values.append(value)
+        elif self.many or value != self.values[0]:
+            self.values.append(value)
+            raise FatalError('multiple values for "%s" field: %s' %
+                             (self.name, self.values))
+
+    def result(self):
+        assert len(self.values) > 0
+        return self.values[0]
+
+
+class _First(_Aggregator):
+    def __init__(self):
+        self.values = []
+
+    def add(self, value):
+        if not self.values:
+            self.values.append(value)
+
+    def result(self):
+        return first(self.values)
+
+
+class _Collect(_Aggregator):
+    """Fallback for aggregates that need the whole series, e.g., ``sort``."""
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.values = []
+
+    def add(self, value):
+        self.values.append(value)
+
+    def result(self):
+        return self.fn(self.values)
+
+
+_online_aggregators = {
+    'mean': _Mean, 'median': _Median,
+    'stdev': _Stdev, 'stdev_percent': _StdevPercent,
+    'variance': _Variance, 'mad': _MedianAbsoluteDeviation,
+    'min': lambda: _Reduce(min), 'max': lambda: _Reduce(max),
+    'sum': lambda: _Reduce(lambda x, y: x + y, 0), 'count': _Count,
+    'same': lambda: _Same('same', False), 'one': lambda: _Same('one', True),
+    'first': _First, 'all': lambda: _Collect(list),
+    'sort': lambda: _Collect(sorted), 'geomean': _Geomean,
+}
+
+
 Result = Dict[str, Union[bool, int, float, str]]
 result_prefix = '[setup-report]'
 
+# --table modes that write typed values instead of formatted text
+_columnar_tables = ('jsonl', 'parquet', 'arrow')
+
 
 class ReportCommand(Command):
     name = 'report'
@@ -89,9 +424,19 @@ class ReportCommand(Command):
                     help=' | '.join(self.instances))
             tparser.add_argument('--no-cache', action='store_false',
                     dest='cache',
-                    help='cached results in the bottom of log files')
+                    help='do not read or write the cache of parsed results '
+                         'in the run directories')
             tparser.add_argument('--refresh', action='store_true',
-                    help='refresh cached results in logs')
+                    help='parse all logs again and refresh cached results')
+            tparser.add_argument('-j', '--jobs', type=int,
+                    default=default_jobs,
+                    help='maximum number of processes parsing logs '
+                         '(default %d)' % default_jobs)
+            tparser.add_argument('--watch', nargs='?', type=float,
+                    const=5.0, metavar='SECONDS',
+                    help='keep watching the run directories and update the '
+                         'report when logs change, waiting SECONDS for more '
+                         'changes before updating (default 5)')
 
             add_table_report_args(tparser)
 
@@ -101,6 +446,17 @@ class ReportCommand(Command):
             report_modes.add_argument('--overhead', metavar='INSTANCE',
                     choices=self.instances,
                     help='report each field as overhead relative to this baseline')
+            tparser.add_argument('--compare', action='store_true',
+                    help='with --overhead, report bootstrap confidence '
+                         'intervals and Mann-Whitney p-values for each '
+                         'overhead and flag insignificant differences')
+            tparser.add_argument('--resamples', type=int, default=10000,
+                    metavar='N',
+                    help='bootstrap resamples for --compare (default 10000)')
+            tparser.add_argument('--confidence', type=float, default=0.95,
+                    help='confidence level for --compare, differences with '
+                         'p >= 1 - CONFIDENCE are insignificant '
+                         '(default 0.95)')
 
             tparser.add_argument('--groupby', metavar='FIELD',
                     choices=_reportable_fields(target),
@@ -152,18 +508,89 @@ class ReportCommand(Command):
             uniq_instances.add(a.overhead)
         instances = self.instances.select(uniq_instances)
 
+        if a.compare and not a.overhead:
+            raise FatalError('--compare needs a baseline, pass --overhead')
+        if not 0 < a.confidence < 1:
+            raise FatalError('--confidence must be between 0 and 1')
+
+        if a.raw:
+            fn = self.report_raw
+        elif a.compare:
+            fn = self.report_compare
+        else:
+            fn = self.report_aggregate
+
+        if a.watch is not None:
+            self.watch(ctx, target, instances, fields, fn)
+            return
+
         # collect results: {instance: [{field:value}]}
         results = parse_logs(ctx, target, instances, a.rundirs,
                              write_cache=a.cache,
-                             read_cache=a.cache and not a.refresh)
+                             read_cache=a.cache and not a.refresh,
+                             jobs=a.jobs,
+                             fields=self._field_names(ctx, fields))
 
-        fn = self.report_raw if a.raw else self.report_aggregate
         fn(ctx, target, results, fields)
 
+    def watch(self, ctx, target, instances, fields, fn):
+        a = ctx.args
+        watcher = RundirWatcher(ctx, target, a.rundirs)
+        read_cache = a.cache and not a.refresh
+        terminal_table = a.table in ('fancy', 'ascii')
+        clear = a.outfile.isatty()
+
+        # other tables are rewritten in full on every update, a file that is
+        # not a terminal must therefore be truncated each time
+        truncate = not clear and not terminal_table
+        if a.table in ('parquet', 'arrow'):
+            raise FatalError('--watch cannot write --table %s' % a.table)
+        if truncate and not a.outfile.seekable():
+            raise FatalError('--watch can only write --table %s to a terminal '
+                             'or a file' % a.table)
+
+        if not a.cache:
+            ctx.log.warning('all logs are parsed again on every change '
+                            'without the result cache')
+
+        try:
+            while True:
+                # only new and changed logs miss the cache
+                results = parse_logs(ctx, target, instances, a.rundirs,
+                                     write_cache=a.cache,
+                                     read_cache=read_cache, jobs=a.jobs,
+                                     fields=self._field_names(ctx, fields))
+                read_cache = a.cache
+
+                if clear:
+                    a.outfile.write('\033[H\033[J')
+                elif truncate:
+                    a.outfile.seek(0)
+                    a.outfile.truncate()
+                if terminal_table:
+                    a.outfile.write('%s: watching %d run directories\n' %
+                                    (datetime.datetime.now().strftime('%H:%M:%S'),
+                                     len(a.rundirs)))
+                fn(ctx, target, results, fields)
+                a.outfile.flush()
+
+                watcher.wait(a.watch)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+
     def report_raw(self, ctx, target, results, fields):
         fields = [f for f, aggr in fields]
         instances = sorted(results)
 
+        # typed columns are written in long format, one row per result
+        if ctx.args.table in _columnar_tables:
+            data = [[instance] + [r.get(f) for f in fields]
+                    for instance in instances for r in results[instance]]
+            report_columns(ctx, ['instance'] + fields, data)
+            return
+
         header = []
         human_header = []
         for instance in instances:
@@ -187,28 +614,14 @@ class ReportCommand(Command):
         report_table(ctx, header, human_header, joined_rows, title)
 
     def report_aggregate(self, ctx, target, results, fields):
-        def keep(result):
-            return not ctx.args.filter or \
-                str(result[ctx.args.groupby]) in ctx.args.filter
-
         baseline_instance = ctx.args.overhead
+        if baseline_instance:
+            _warn_missing_baseline(ctx, results, ctx.args.groupby,
+                                   ctx.args.filter, baseline_instance)
 
         instances = sorted(results)
-        groupby_values = sorted(set(
-            result[ctx.args.groupby]
-            for instance_results in results.values()
-            for result in instance_results
-            if keep(result)
-        ))
-        grouped = {}
-        for instance, instance_results in results.items():
-            for result in instance_results:
-                if not keep(result):
-                    continue
-                key = result[ctx.args.groupby], instance
-                for f, aggr in fields:
-                    if f in result:
-                        grouped.setdefault((key, f), []).append(result[f])
+        aggregated = aggregate_results(results, fields, ctx.args.groupby,
+                                       ctx.args.filter, baseline_instance)
 
         header = [ctx.args.groupby]
         human_header = ['\n\n' + ctx.args.groupby]
@@ -224,32 +637,16 @@ class ReportCommand(Command):
                     prefix = '\n\n'
 
         data = []
-        for groupby_value in groupby_values:
-            baseline_results = {}
-            if baseline_instance:
-                key = groupby_value, baseline_instance
-                for f, aggr in fields:
-                    for ag in aggr:
-                        series = grouped.get((key, f), [-1])
-                        value = _aggregate_fns[ag](series)
-                        baseline_results[(groupby_value, f)] = value
-
+        for groupby_value, instance_values in aggregated.items():
             row = [groupby_value]
             for instance in instances:
                 if instance == baseline_instance:
                     continue
 
-                key = groupby_value, instance
+                values = instance_values.get(instance, {})
                 for f, aggr in fields:
                     for ag in aggr:
-                        series = grouped.get((key, f), None)
-                        if series is None:
-                            value = None
-                        else:
-                            value = _aggregate_fns[ag](series)
-                            if baseline_results and isinstance(value, (int, float)):
-                                value /= baseline_results[(groupby_value, f)]
-                        row.append(value)
+                        row.append(values.get((f, ag), None))
             data.append(row)
 
         if baseline_instance:
@@ -273,25 +670,55 @@ class ReportCommand(Command):
 
         report_table(ctx, header, human_header, data, title, **table_options)
 
-    def _parse_fields(self, ctx, target):
-        for arg in chain.from_iterable(ctx.args.field):
-            parts = arg.split(':')
-            field = parts[0]
+    def report_compare(self, ctx, target, results, fields):
+        baseline_instance = ctx.args.overhead
+        _warn_missing_baseline(ctx, results, ctx.args.groupby,
+                               ctx.args.filter, baseline_instance)
 
-            if not ctx.args.raw and len(parts) == 1:
-                raise FatalError('need aggregation methods for "%s"' % field)
-            elif ctx.args.raw and len(parts) > 1:
-                raise FatalError('cannot aggregate when reporting raw results')
+        instances = [i for i in sorted(results) if i != baseline_instance]
+        compared = compare_results(results, fields, ctx.args.groupby,
+                                   baseline_instance, ctx.args.filter,
+                                   ctx.args.resamples, ctx.args.confidence)
 
-            if field not in _reportable_fields(target):
-                raise FatalError('unknown field "%s"' % field)
+        columns = ('', 'ci_low', 'ci_high', 'p', 'significant')
+        header = [ctx.args.groupby]
+        human_header = ['\n\n\n' + ctx.args.groupby]
+        for instance in instances:
+            for i, (f, aggr) in enumerate(fields):
+                for j, ag in enumerate(aggr):
+                    for k, column in enumerate(columns):
+                        header.append('_'.join(filter(None, (instance, f, ag,
+                                                             column))))
+                        human_header.append('%s\n%s\n%s\n%s' % (
+                            '' if i or j or k else instance,
+                            '' if j or k else f, '' if k else ag,
+                            column or 'overhead'))
 
-            for aggr in parts[1:]:
-                if aggr not in _aggregate_fns:
-                    raise FatalError('unknown aggregator "%s" for %s' %
-                                     (aggr, field))
+        data = []
+        for groupby_value, instance_values in compared.items():
+            row = [groupby_value]
+            for instance in instances:
+                values = instance_values.get(instance, {})
+                for f, aggr in fields:
+                    for ag in aggr:
+                        c = values.get((f, ag))
+                        if c is None:
+                            row += [None] * len(columns)
+                        else:
+                            row += [c.ratio, c.ci_low, c.ci_high, c.pvalue,
+                                    c.significant]
+            data.append(row)
+
+        title = '%s overhead vs %s (%g%% confidence)' % \
+                (target.name, baseline_instance, 100 * ctx.args.confidence)
+        report_table(ctx, header, human_header, data, title)
+
+    def _parse_fields(self, ctx, target):
+        return parse_fields(target, chain.from_iterable(ctx.args.field),
+                            ctx.args.raw)
 
-            yield field, tuple(parts[1:])
+    def _field_names(self, ctx, fields):
+        return [ctx.args.groupby] + [f for f, aggr in fields]
 
 
 class _FieldCompleter:
@@ -314,16 +741,18 @@ class _FieldCompleter:
 
 
 def add_table_report_args(parser):
-    parser.add_argument('-o', '--outfile',
+    parser.add_argument('-o', '--outfile', '--output',
             type=argparse.FileType('w'), default=sys.stdout,
             help='outfile (default: stdout)')
 
     can_fancy = sys.stdout.encoding == 'UTF-8' and sys.stdout.name == '<stdout>'
     parser.add_argument('--table',
-            choices=('fancy', 'ascii', 'csv', 'tsv', 'ssv'),
+            choices=('fancy', 'ascii', 'csv', 'tsv', 'ssv') + _columnar_tables,
             default='fancy' if can_fancy else 'ascii',
             help='output mode for tables: UTF-8 formatted (default) / '
-                 'ASCII tables / {comma,tab,space}-separated')
+                 'ASCII tables / {comma,tab,space}-separated / '
+                 'typed columns as JSON lines, Parquet or Arrow IPC '
+                 '(Parquet and Arrow need pyarrow)')
 
     parser.add_argument('--precision', type=int, default=3,
             help='least significant digits to round numbers to (default 3)')
@@ -337,6 +766,10 @@ def add_table_report_args(parser):
 
 def report_table(ctx, nonhuman_header, human_header, data_rows, title,
                  **table_options):
+    if ctx.args.table in _columnar_tables:
+        report_columns(ctx, nonhuman_header, data_rows)
+        return
+
     # don't align numbers for non-human reporting
     if ctx.args.table in ('csv', 'tsv', 'ssv'):
         data_rows = [[_to_string(ctx, v) for v in row] for row in data_rows]
@@ -402,6 +835,430 @@ def report_table(ctx, nonhuman_header, human_header, data_rows, title,
         print(table.table)
 
 
+def report_columns(ctx: Namespace, header: List[str],
+                   data_rows: List[List[Any]]):
+    """
+    Write table rows with their original types instead of formatted strings,
+    for ``--table jsonl|parquet|arrow``. JSON lines has one object per row
+    keyed by ``header``, Parquet and Arrow IPC files have one column per
+    header entry so that they can be loaded directly by pandas or DuckDB.
+    Columns that mix strings and numbers are written as strings.
+
+    :param ctx: the configuration context
+    :param header: column names
+    :param data_rows: rows of values, ``None`` for missing values
+    """
+    outfile = ctx.args.outfile
+
+    if ctx.args.table == 'jsonl':
+        for row in data_rows:
+            json.dump(dict(zip(header, row)), outfile, default=str)
+            outfile.write('\n')
+        return
+
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise FatalError('--table %s needs pyarrow, install it with '
+                         '"pip install pyarrow"' % ctx.args.table)
+
+    if outfile.isatty():
+        raise FatalError('refusing to write a binary table to a terminal, '
+                         'pass --output FILE')
+
+    columns = []
+    for col in range(len(header)):
+        values = [row[col] for row in data_rows]
+        try:
+            columns.append(pa.array(values))
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            columns.append(pa.array([None if v is None else str(v)
+                                     for v in values], pa.string()))
+    table = pa.Table.from_arrays(columns, names=list(header))
+
+    outfile.flush()
+    if ctx.args.table == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, outfile.buffer)
+    else:
+        assert ctx.args.table == 'arrow'
+        with pa.ipc.new_file(outfile.buffer, table.schema) as writer:
+            writer.write_table(table)
+    outfile.buffer.flush()
+
+
+def parse_fields(target: Target, field_args: Iterable[str], raw=False) -> \
+        Iterator[Tuple[str, Tuple[str, ...]]]:
+    """
+    Parse ``FIELD:AGGR[:AGGR...]`` arguments as passed to ``report -f``.
+
+    :param target: target whose reportable fields are valid
+    :param field_args: field arguments to parse
+    :param raw: whether aggregations are disallowed (as for ``--raw``)
+    :returns: ``(field, (aggr, ...))`` tuples
+    """
+    for arg in field_args:
+        parts = arg.split(':')
+        field = parts[0]
+
+        if not raw and len(parts) == 1:
+            raise FatalError('need aggregation methods for "%s"' % field)
+        elif raw and len(parts) > 1:
+            raise FatalError('cannot aggregate when reporting raw results')
+
+        if field not in _reportable_fields(target):
+            raise FatalError('unknown field "%s"' % field)
+
+        for aggr in parts[1:]:
+            if aggr not in _aggregate_fns:
+                raise FatalError('unknown aggregator "%s" for %s' %
+                                 (aggr, field))
+
+        yield field, tuple(parts[1:])
+
+
+def aggregate_results(results: Dict[str, List[Result]],
+                      fields: List[Tuple[str, Tuple[str, ...]]],
+                      groupby: str,
+                      filter_values: Iterable[str] = (),
+                      baseline_instance: Optional[str] = None) -> \
+        Dict[Any, Dict[str, Dict[Tuple[str, str], Any]]]:
+    """
+    Aggregate parsed results per value of the ``groupby`` field, as done by
+    the :ref:`report <usage-report>` command when ``--raw`` is not passed.
+
+    :param results: ``{<instance_name>: [<result>, ...]}`` as returned by
+                    :func:`parse_logs`
+    :param fields: ``(field, (aggr, ...))`` tuples, see :func:`parse_fields`
+    :param groupby: field to group results by
+    :param filter_values: only keep these (stringified) values of the
+                          ``groupby`` field, leave empty to keep all
+    :param baseline_instance: if set, divide numeric aggregates by those of
+                              this instance, which is itself omitted from the
+                              returned values
+    :returns: ``{<groupby_value>: {<instance>: {(field, aggr): value}}}``
+              ordered by groupby value, where ``value`` is ``None`` if the
+              instance has no results for the field
+    """
+    filter_values = list(filter_values)
+
+    def keep(result):
+        return not filter_values or str(result[groupby]) in filter_values
+
+    # Feed every value into its aggregators as results are visited, so that
+    # no per-group series are kept for the streaming aggregates
+    instances = sorted(results)
+    groupby_values = set()
+    aggregators = {}
+    for instance, instance_results in results.items():
+        for result in instance_results:
+            if not keep(result):
+                continue
+            groupby_value = result[groupby]
+            groupby_values.add(groupby_value)
+            for f, aggr in fields:
+                if f in result:
+                    key = groupby_value, instance, f
+                    field_aggregators = aggregators.get(key)
+                    if field_aggregators is None:
+                        field_aggregators = aggregators[key] = \
+                            [_online_aggregators[ag]() for ag in aggr]
+                    value = result[f]
+                    for aggregator in field_aggregators:
+                        aggregator.add(value)
+
+    aggregated = {}
+    for groupby_value in sorted(groupby_values):
+        baseline_results = {}
+        if baseline_instance:
+            for f, aggr in fields:
+                key = groupby_value, baseline_instance, f
+                if key in aggregators:
+                    for ag, aggregator in zip(aggr, aggregators[key]):
+                        baseline_results[(f, ag)] = aggregator.result()
+                else:
+                    for ag in aggr:
+                        baseline_results[(f, ag)] = _aggregate_fns[ag]([-1])
+
+        instance_values = aggregated[groupby_value] = {}
+        for instance in instances:
+            if instance == baseline_instance:
+                continue
+
+            values = instance_values[instance] = {}
+            for f, aggr in fields:
+                field_aggregators = aggregators.get((groupby_value, instance, f))
+                for i, ag in enumerate(aggr):
+                    if field_aggregators is None:
+                        value = None
+                    else:
+                        value = field_aggregators[i].result()
+                        if baseline_results and isinstance(value, (int, float)):
+                            value /= baseline_results[(f, ag)]
+                    values[(f, ag)] = value
+
+    return aggregated
+
+
+def _warn_missing_baseline(ctx, results, groupby, filter_values,
+                           baseline_instance):
+    baseline_values = set(r[groupby]
+                          for r in results.get(baseline_instance, ()))
+    missing = set(r[groupby]
+                  for instance_results in results.values()
+                  for r in instance_results
+                  if not filter_values or str(r[groupby]) in filter_values)
+    missing -= baseline_values
+    if missing:
+        ctx.log.warning('baseline %s has no results for %s' %
+                        (baseline_instance,
+                         ', '.join(str(v) for v in sorted(missing))))
+
+
+# aggregates that can be compared with a bootstrap, applied to the last axis
+# of a (resamples, values) array
+_bootstrap_stats = {
+    'mean': lambda np, a: a.mean(axis=-1),
+    'median': lambda np, a: np.median(a, axis=-1),
+    'geomean': lambda np, a: np.exp(np.log(a).mean(axis=-1)),
+    'min': lambda np, a: a.min(axis=-1),
+    'max': lambda np, a: a.max(axis=-1),
+}
+
+
+def compare_results(results: Dict[str, List[Result]],
+                    fields: List[Tuple[str, Tuple[str, ...]]],
+                    groupby: str,
+                    baseline_instance: str,
+                    filter_values: Iterable[str] = (),
+                    resamples: int = 10000,
+                    confidence: float = 0.95,
+                    seed: int = 0) -> \
+        Dict[Any, Dict[str, Dict[Tuple[str, str], Optional[Namespace]]]]:
+    """
+    Compare each instance to a baseline instance per value of the
+    ``groupby`` field, as done by ``report --overhead INSTANCE --compare``.
+
+    For every field and aggregate, the overhead is the aggregate of the
+    instance divided by that of the baseline. Its confidence interval is the
+    percentile interval of the same ratio over ``resamples`` bootstrap
+    resamples of both series, which are drawn at once as NumPy arrays. The
+    p-value is that of a two-sided Mann-Whitney U test between the series
+    (see :func:`mann_whitney_u`). A difference is significant if the p-value
+    is below ``1 - confidence`` and the interval does not contain 1.
+
+    :param results: ``{<instance_name>: [<result>, ...]}`` as returned by
+                    :func:`parse_logs`
+    :param fields: ``(field, (aggr, ...))`` tuples, see :func:`parse_fields`,
+                   where each ``aggr`` is one of mean, median, geomean, min
+                   or max
+    :param groupby: field to group results by
+    :param baseline_instance: instance to compare to, which is itself
+                              omitted from the returned values
+    :param filter_values: only keep these (stringified) values of the
+                          ``groupby`` field, leave empty to keep all
+    :param resamples: number of bootstrap resamples
+    :param confidence: confidence level of the intervals
+    :param seed: seed for the resampling, so that reports are reproducible
+    :returns: ``{<groupby_value>: {<instance>: {(field, aggr): comparison}}}``
+              ordered by groupby value, where ``comparison`` is a
+              :class:`Namespace` with ``ratio``, ``ci_low``, ``ci_high``,
+              ``pvalue`` and ``significant``, or ``None`` if the instance or
+              the baseline has no results for the field
+    :raises FatalError: if NumPy is not installed or an aggregate cannot be
+                        compared
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        raise FatalError('--compare needs numpy, install it with '
+                         '"pip install numpy"')
+
+    for f, aggr in fields:
+        for ag in aggr:
+            if ag not in _bootstrap_stats:
+                raise FatalError('cannot compare %s aggregates, use one of %s'
+                                 % (ag, ', '.join(_bootstrap_stats)))
+
+    filter_values = list(filter_values)
+    series = {}
+    for instance, instance_results in results.items():
+        for result in instance_results:
+            if filter_values and str(result[groupby]) not in filter_values:
+                continue
+            for f, aggr in fields:
+                if f in result:
+                    key = result[groupby], instance, f
+                    series.setdefault(key, []).append(result[f])
+
+    rng = np.random.default_rng(seed)
+    alpha = 1 - confidence
+    instances = sorted(i for i in results if i != baseline_instance)
+    groupby_values = sorted(set(key[0] for key in series))
+
+    def resample(values):
+        indices = rng.integers(0, len(values), (resamples, len(values)))
+        return values[indices]
+
+    compared = {}
+    for groupby_value in groupby_values:
+        instance_values = compared[groupby_value] = {}
+        for instance in instances:
+            instance_values[instance] = {}
+
+        for f, aggr in fields:
+            base = series.get((groupby_value, baseline_instance, f))
+            if base is not None:
+                # the baseline is resampled once for all instances
+                base = np.asarray(base, dtype=float)
+                base_samples = resample(base)
+                base_stats = {ag: (_bootstrap_stats[ag](np, base),
+                                   _bootstrap_stats[ag](np, base_samples))
+                              for ag in aggr}
+
+            for instance in instances:
+                values = series.get((groupby_value, instance, f))
+                if values is not None and base is not None:
+                    values = np.asarray(values, dtype=float)
+                    samples = resample(values)
+                    pvalue = mann_whitney_u(values, base)
+
+                for ag in aggr:
+                    if values is None or base is None:
+                        instance_values[instance][(f, ag)] = None
+                        continue
+
+                    stat = _bootstrap_stats[ag]
+                    base_stat, base_sample_stats = base_stats[ag]
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        ratio = float(stat(np, values) / base_stat)
+                        ratios = stat(np, samples) / base_sample_stats
+                        low, high = np.nanpercentile(
+                            ratios, [50 * alpha, 100 - 50 * alpha])
+
+                    instance_values[instance][(f, ag)] = Namespace(
+                        ratio=ratio, ci_low=float(low), ci_high=float(high),
+                        pvalue=pvalue,
+                        significant=bool(pvalue < alpha and
+                                         not low <= 1 <= high))
+
+    return compared
+
+
+def mann_whitney_u(x, y) -> float:
+    """
+    Two-sided p-value of the Mann-Whitney U test for samples ``x`` and ``y``
+    (NumPy arrays). The exact distribution of U is used for small samples
+    without ties, the normal approximation with tie and continuity
+    corrections otherwise, as :func:`scipy.stats.mannwhitneyu` does.
+    """
+    import numpy as np
+
+    n1, n2 = len(x), len(y)
+    ranks, ties = _rankdata(np, np.concatenate((x, y)))
+    u = float(ranks[:n1].sum()) - n1 * (n1 + 1) / 2
+
+    if n1 + n2 <= 50 and not ties.any():
+        counts = _mann_whitney_counts(np, n1, n2)
+        k = int(round(u))
+        p = 2 * min(counts[:k + 1].sum(), counts[k:].sum()) / counts.sum()
+        return float(min(p, 1.0))
+
+    n = n1 + n2
+    tie_term = float((ties ** 3 - ties).sum()) / (n * (n - 1))
+    sigma = (n1 * n2 / 12 * ((n + 1) - tie_term)) ** 0.5
+    if sigma == 0:
+        return 1.0
+    z = max(abs(u - n1 * n2 / 2) - 0.5, 0) / sigma
+    return float(math.erfc(z / 2 ** 0.5))
+
+
+def _rankdata(np, values):
+    # average ranks (1-based) and the sizes of groups of tied values
+    sorter = np.argsort(values, kind='mergesort')
+    inverse = np.empty_like(sorter)
+    inverse[sorter] = np.arange(len(sorter))
+    ordered = values[sorter]
+    unique = np.concatenate(([True], ordered[1:] != ordered[:-1]))
+    dense = unique.cumsum()[inverse]
+    bounds = np.concatenate((np.nonzero(unique)[0], [len(unique)]))
+    ranks = 0.5 * (bounds[dense] + bounds[dense - 1] + 1)
+    sizes = np.diff(bounds)
+    return ranks, sizes[sizes > 1]
+
+
+@lru_cache(maxsize=None)
+def _mann_whitney_counts(np, n1, n2):
+    # number of orderings for each value of U: the coefficients of the
+    # Gaussian binomial [n1 + n2 choose n1], built one factor at a time
+    counts = np.zeros(n1 * n2 + 1, dtype=np.int64)
+    counts[0] = 1
+    for i in range(1, n1 + 1):
+        # multiply by (1 - q^(n2 + i)), then divide by (1 - q^i)
+        counts[n2 + i:] -= counts[:-(n2 + i)].copy()
+        for k in range(i, len(counts)):
+            counts[k] += counts[k - i]
+    return counts
+
+
+def load_aggregated(ctx: Namespace, target: Target, rundirs: Iterable[str],
+                    fields: Iterable[str],
+                    instances: Iterable[Instance] = (),
+                    groupby: Optional[str] = None,
+                    filter_values: Iterable[str] = (),
+                    baseline_instance: Optional[str] = None,
+                    cache: bool = True, jobs: int = 1) -> \
+        Dict[Any, Dict[str, Dict[str, Any]]]:
+    """
+    In-process equivalent of ``setup.py report TARGET RUNDIRS -f FIELDS``,
+    for scripts that post-process results. Instead of printing a table, this
+    returns the aggregated values directly, keyed by the ``FIELD:AGGR``
+    strings that were passed in ``fields``::
+
+        load_aggregated(ctx, spec2006, ['results/run.clang'],
+                        ['runtime:median', 'maxrss:median'])
+        # {'400.perlbench': {'clang': {'runtime:median': 202.3,
+        #                              'maxrss:median': 644376}}, ...}
+
+    :param ctx: the configuration context
+    :param target: target whose logs are parsed
+    :param rundirs: run directories to traverse
+    :param fields: ``FIELD:AGGR[:AGGR...]`` strings like the ``-f`` option
+    :param instances: instances to report, leave empty for all instances in
+                      the logs
+    :param groupby: field to group by (default ``target.aggregation_field``)
+    :param filter_values: only report these values of the ``groupby`` field
+    :param baseline_instance: report values as overhead relative to this
+                              instance, like ``--overhead``
+    :param cache: read and write cached results like the report command
+    :param jobs: number of processes parsing logs, like ``--jobs``
+    :returns: ``{<groupby_value>: {<instance>: {'FIELD:AGGR': value}}}``
+    """
+    parsed_fields = list(parse_fields(target, fields))
+    groupby = groupby or target.aggregation_field
+
+    instances = list(instances)
+    if instances and baseline_instance:
+        names = set(instance.name for instance in instances)
+        if baseline_instance not in names:
+            raise FatalError('baseline instance %s is not in the selected '
+                             'instances' % baseline_instance)
+
+    results = parse_logs(ctx, target, instances, rundirs,
+                         write_cache=cache, read_cache=cache, jobs=jobs,
+                         fields=[groupby] + [f for f, aggr in parsed_fields])
+    aggregated = aggregate_results(results, parsed_fields, groupby,
+                                   filter_values, baseline_instance)
+
+    return {
+        groupby_value: {
+            instance: {'%s:%s' % key: value for key, value in values.items()}
+            for instance, values in instance_values.items()
+        }
+        for groupby_value, instance_values in aggregated.items()
+    }
+
+
 def _reportable_fields(target):
     return {
         **target.reportable_fields,
@@ -456,6 +1313,18 @@ def _precise_float(n: float, precision: int) -> str:
     return '%%.%df' % total_decimals % n
 
 
+def rundir_path(ctx: Namespace) -> str:
+    """
+    Returns the path to the run directory of the current invocation, which
+    may not exist yet.
+
+    :param ctx: the configuration context
+    :returns: ``results/run.YY-MM-DD.HH-MM-SS``
+    """
+    rundir = ctx.starttime.strftime('run.%Y-%m-%d.%H-%M-%S')
+    return os.path.join(ctx.paths.pool_results, rundir)
+
+
 def outfile_path(ctx: Namespace, target: Target, instance: Instance,
                  *args: Iterable[str]) -> str:
     """
@@ -469,42 +1338,273 @@ def outfile_path(ctx: Namespace, target: Target, instance: Instance,
     :param args: log file name, optionally preceded by nested directory names
     :returns: ``results/run.YY-MM-DD.HH-MM-SS/<target>/<instance>[/<arg>...]``
     """
-    rundir = ctx.starttime.strftime('run.%Y-%m-%d.%H-%M-%S')
-    path = os.path.join(ctx.paths.pool_results, rundir, target.name,
-                        instance.name, *args)
+    path = os.path.join(rundir_path(ctx), target.name, instance.name, *args)
     os.makedirs(os.path.dirname(path), exist_ok=True)
     return path
 
 
+class ResultCache:
+    """
+    Out-of-band cache of :func:`Target.parse_outfile` results for the log
+    files in a run directory, stored in an SQLite database in the run
+    directory itself. Entries are keyed by the log path relative to the run
+    directory and are only valid for the same file size, modification time,
+    target and :py:attr:`Target.parser_version`, so a cache hit is a single
+    lookup and log files are never modified. Results parsed without the
+    target's :py:attr:`Target.lazy_fields` are marked as partial, and are
+    only used when those fields are not needed.
+
+    The key of a log file is taken by :func:`get`, before the log is parsed,
+    and passed back to :func:`put`. A log that grows while it is parsed, like
+    that of a run in progress, therefore does not get stale results cached
+    under its new size.
+
+    :param ctx: the configuration context
+    :param rundir: run directory to cache results for
+    """
+
+    filename = '.report-cache.sqlite'
+
+    def __init__(self, ctx: Namespace, rundir: str):
+        self.ctx = ctx
+        self.rundir = rundir
+        self.conn = None
+
+        # results cached inside log files by older versions have been
+        # imported when the database was created
+        path = os.path.join(rundir, self.filename)
+        self.read_legacy = not os.path.exists(path)
+
+        try:
+            self.conn = sqlite3.connect(path)
+            self.conn.execute('CREATE TABLE IF NOT EXISTS results ('
+                              'path TEXT PRIMARY KEY, size INTEGER, '
+                              'mtime_ns INTEGER, parser TEXT, results TEXT)')
+        except sqlite3.Error as e:
+            ctx.log.warning('not caching results in %s: %s' % (rundir, e))
+            self.conn = None
+            self.read_legacy = True
+
+    def _parser(self, target):
+        return '%s:%d' % (target.name, target.parser_version)
+
+    def get(self, target: Target, path: str, partial: bool = False) -> \
+            Tuple[Optional[List[Result]], Tuple[str, int, int]]:
+        """
+        Get cached results for a log file.
+
+        :param partial: whether results without lazy fields are sufficient
+        :returns: the cached results, or ``None`` if there are none or the
+                  log file changed since they were cached, and the key of
+                  the log file to pass to :func:`put` for results parsed
+                  after this call
+        """
+        st = os.stat(path)
+        key = os.path.relpath(path, self.rundir), st.st_size, st.st_mtime_ns
+        if self.conn is None:
+            return None, key
+
+        row = self.conn.execute('SELECT size, mtime_ns, parser, results '
+                                'FROM results WHERE path = ?',
+                                (key[0],)).fetchone()
+
+        if row is None or tuple(row[:2]) != key[1:]:
+            return None, key
+        parser = self._parser(target)
+        if row[2] != parser and not (partial and row[2] == parser + ':partial'):
+            return None, key
+
+        return json.loads(row[3]), key
+
+    def put(self, target: Target, key: Tuple[str, int, int],
+            results: List[Result], partial: bool = False):
+        """
+        Cache the results of a log file, replacing any earlier entry.
+
+        :param key: the key returned by :func:`get` before parsing the log
+        :param partial: whether the results were parsed without lazy fields
+        """
+        if self.conn is None:
+            return
+
+        parser = self._parser(target)
+        if partial:
+            parser += ':partial'
+
+        try:
+            self.conn.execute('INSERT OR REPLACE INTO results VALUES '
+                              '(?, ?, ?, ?, ?)',
+                              (*key, parser, json.dumps(results)))
+        except sqlite3.Error as e:
+            self.ctx.log.warning('could not cache results for %s: %s' %
+                                 (key[0], e))
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.commit()
+            except sqlite3.Error as e:
+                self.ctx.log.warning('could not save result cache in %s: %s'
+                                     % (self.rundir, e))
+            self.conn.close()
+            self.conn = None
+
+
+class RundirWatcher:
+    """
+    Waits for log files in run directories to be created or changed, for
+    the ``--watch`` option of the report command. Uses inotify when the C
+    library supports it, and otherwise polls the size and modification time
+    of the log files.
+
+    :param ctx: the configuration context
+    :param target: target whose logs are watched
+    :param rundirs: run directories to watch
+    """
+
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+
+    def __init__(self, ctx: Namespace, target: Target, rundirs: Iterable[str]):
+        self.ctx = ctx
+        self.rundirs = [os.path.abspath(d) for d in rundirs]
+        self.target = target
+        self.fd = None
+        self.watches = set()
+        self.snapshot = None
+
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+            self.fd = fd
+            self._add_watch = libc.inotify_add_watch
+            self._watch_dirs()
+        except (AttributeError, OSError) as e:
+            ctx.log.debug('polling for changes, no inotify: %s' % e)
+
+        if self.fd is None:
+            self.snapshot = self._take_snapshot()
+
+    def _dirs(self) -> Iterator[str]:
+        # run directories, target directories and instance directories
+        for rundir in self.rundirs:
+            yield rundir
+            targetdir = os.path.join(rundir, self.target.name)
+            if os.path.isdir(targetdir):
+                yield targetdir
+                for instance in sorted(os.listdir(targetdir)):
+                    instancedir = os.path.join(targetdir, instance)
+                    if os.path.isdir(instancedir):
+                        yield instancedir
+
+    def _watch_dirs(self):
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        for path in self._dirs():
+            if path not in self.watches:
+                if self._add_watch(self.fd, os.fsencode(path), mask) >= 0:
+                    self.watches.add(path)
+
+    def _take_snapshot(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for path in self._dirs():
+            for entry in os.scandir(path):
+                if entry.is_file() and not entry.name.startswith('.'):
+                    st = entry.stat()
+                    snapshot[entry.path] = st.st_size, st.st_mtime_ns
+        return snapshot
+
+    def _drain(self) -> bool:
+        # Read all pending events, ignoring hidden files like the result
+        # cache which is written by the report itself
+        changed = False
+        while True:
+            try:
+                buf = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return changed
+
+            offset = 0
+            while offset < len(buf):
+                _, _, _, length = struct.unpack_from('iIII', buf, offset)
+                name = buf[offset + 16:offset + 16 + length].rstrip(b'\0')
+                if not name.startswith(b'.'):
+                    changed = True
+                offset += 16 + length
+
+    def wait(self, settle: float):
+        """
+        Block until a log file is created or changes, and then until no
+        other changes happen for ``settle`` seconds.
+        """
+        if self.fd is None:
+            changed = False
+            while True:
+                time.sleep(settle)
+                snapshot = self._take_snapshot()
+                if snapshot != self.snapshot:
+                    self.snapshot = snapshot
+                    changed = True
+                elif changed:
+                    return
+        else:
+            changed = False
+            while True:
+                # new instance directories are picked up on every wakeup
+                self._watch_dirs()
+                select.select([self.fd], [], [], settle if changed else None)
+                if self._drain():
+                    changed = True
+                elif changed:
+                    return
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
 def parse_logs(ctx, target, instances, rundirs,
-               write_cache=True, read_cache=True):
+               write_cache=True, read_cache=True, jobs=1, fields=None):
     """
     Parse logs from specified run directories.
 
     Traverse the directories to find log files, parse each logfile, and
-    optionally append the parsed results to the log file. To get results
-    for a log file, :func:`Target.parse_outfile` is called on the target.
-    This should parse the log file and yield a number of result
-    dictionaries of results found in the log file (e.g., an entry for each
-    benchmark runtime). The parsed results are grouped per instance and
-    returned as an ``{<instance_name>: [<result>, ...]}`` dictionary.
+    optionally cache the parsed results. To get results for a log file,
+    :func:`Target.parse_outfile` is called on the target. This should parse
+    the log file and yield a number of result dictionaries of results found
+    in the log file (e.g., an entry for each benchmark runtime). The parsed
+    results are grouped per instance and returned as an
+    ``{<instance_name>: [<result>, ...]}`` dictionary.
 
     If ``write_cache`` is true (which is the default), the results returned
-    by each invocation of :func:`Target.parse_outfile` are logged into the
-    log file itself and, is ``read_cache is true`` (also default), read
-    from there in the next invocation of the report command. This means
-    that expensive log file parsing is only done on the first invocation,
-    and also that the log files become portable across systems without
-    having to also copy any files referenced by the logs.
+    by each invocation of :func:`Target.parse_outfile` are stored in a
+    :class:`ResultCache` in the run directory and, if ``read_cache is
+    true`` (also default), read from there in the next invocation of the
+    report command. This means that expensive log file parsing is only done
+    on the first invocation, and also that the run directories become
+    portable across systems without having to also copy any files
+    referenced by the logs. Results cached inside log files by older
+    versions of this command are still read when the run directory has no
+    cache yet.
+
+    Log files that are not cached are parsed by ``jobs`` worker processes.
+    Results are returned in the same order regardless of ``jobs``.
 
     :param ctx: the configuration context
     :param instances: list of instances to filter from, leave empty to get
                         results for all instances in the logs
     :param rundirs: run directories to traverse
-    :param write_cache: whether to append log file results to the log file
-                        itself
-    :param read_cache: whether to read existing results from log files
+    :param write_cache: whether to cache parsed log file results
+    :param read_cache: whether to read existing results from the cache
                         instead of calling ``Target.parse_outfile``
+    :param jobs: maximum number of processes calling
+                 ``Target.parse_outfile``
+    :param fields: names of the fields that will be reported, so that
+                   :py:attr:`Target.lazy_fields` are only parsed when needed,
+                   leave ``None`` to parse all fields
     """
     abs_rundirs = []
     for d in rundirs:
@@ -512,6 +1612,9 @@ def parse_logs(ctx, target, instances, rundirs,
             raise FatalError('rundir %s does not exist' % d)
         abs_rundirs.append(os.path.abspath(d))
 
+    partial = fields is not None and bool(target.lazy_fields) and \
+        target.lazy_fields.isdisjoint(fields)
+
     instance_names = [instance.name for instance in instances]
     instance_dirs = []
     results = dict((iname, []) for iname in instance_names)
@@ -523,60 +1626,109 @@ def parse_logs(ctx, target, instances, rundirs,
                 instancedir = os.path.join(targetdir, instance)
                 if os.path.isdir(instancedir):
                     if not instance_names or instance in instance_names:
-                        instance_dirs.append((instance, instancedir))
+                        instance_dirs.append((rundir, instance, instancedir))
         else:
             ctx.log.warning('rundir %s contains no results for target %s' %
                             (rundir, target.name))
 
-    for iname, idir in instance_dirs:
-        instance_results = results.setdefault(iname, [])
-
-        for filename in sorted(os.listdir(idir)):
-            path = os.path.join(idir, filename)
-            if not os.path.isfile(path):
-                continue
-
-            fresults = []
-            if read_cache:
-                fresults = list(parse_results(ctx, path, 'cached'))
+    # (instance, path, cache, results) for every log file, results is None
+    # for files that still need to be parsed
+    outfiles = []
+    caches = {}
+    try:
+        for rundir, iname, idir in instance_dirs:
+            cache = None
+            if read_cache or write_cache:
+                if rundir not in caches:
+                    caches[rundir] = ResultCache(ctx, rundir)
+                cache = caches[rundir]
+
+            for filename in sorted(os.listdir(idir)):
+                path = os.path.join(idir, filename)
+                if not os.path.isfile(path):
+                    continue
 
-            if fresults:
-                ctx.log.debug('using cached results from ' + path)
-            else:
-                ctx.log.debug('parsing outfile ' + path)
-                fresults = list(target.parse_outfile(ctx, iname, path))
+                # stat the log before parsing it, see ResultCache
+                fresults, key = cache.get(target, path, partial) \
+                    if cache else (None, None)
+                if not read_cache:
+                    fresults = None
+
+                if fresults is None and read_cache and cache.read_legacy:
+                    # results cached in the log by older versions, these
+                    # have all lazy fields
+                    fresults = list(parse_results(ctx, path, 'cached')) \
+                        or None
+                    if fresults is not None and write_cache:
+                        cache.put(target, key, fresults)
+
+                if fresults is not None:
+                    ctx.log.debug('using cached results for ' + path)
+
+                outfiles.append((iname, path, cache, key, fresults))
+
+        todo = [(iname, path) for iname, path, cache, key, fresults
+                in outfiles if fresults is None]
+        ctx.report_lazy_fields = not partial
+        try:
+            parsed = iter(_parse_outfiles(ctx, target, todo, jobs))
+        finally:
+            del ctx['report_lazy_fields']
+
+        for iname, path, cache, key, fresults in outfiles:
+            if fresults is None:
+                fresults = next(parsed)
 
                 if write_cache:
-                    try:
-                        if read_cache:
-                            # there were no previous results, just append
-                            f = open(path, 'a')
-                        else:
-                            # there may be previous results, strip them
-                            f = open(path, 'r+')
-                            line = f.readline()
-                            while line:
-                                if line.startswith(result_prefix + ' begin cached'):
-                                    ctx.log.debug('removing cached results')
-                                    f.seek(f.tell() - len(line))
-                                    f.truncate()
-                                    break
-                                line = f.readline()
-
-                        ctx.log.debug('caching %d results' % len(fresults))
-                        for result in fresults:
-                            log_result('cached', result, f)
-                    finally:
-                        f.close()
+                    ctx.log.debug('caching %d results' % len(fresults))
+                    cache.put(target, key, fresults, partial)
 
             for result in fresults:
                 result['outfile'] = _strip_cwd(path)
 
-            instance_results += fresults
+            results.setdefault(iname, []).extend(fresults)
+    finally:
+        for cache in caches.values():
+            cache.close()
 
     return results
 
 
+# (ctx, target) of the parse_logs call that forked the current worker
+_parse_job_state = None
+
+
+def _parse_outfile_job(job: Tuple[str, str]) -> List[Result]:
+    ctx, target = _parse_job_state
+    iname, path = job
+    ctx.log.debug('parsing outfile ' + path)
+    return list(target.parse_outfile(ctx, iname, path))
+
+
+def _parse_outfiles(ctx: Namespace, target: Target,
+                    todo: List[Tuple[str, str]], jobs: int) -> \
+        List[List[Result]]:
+    """
+    Call :func:`Target.parse_outfile` for each ``(instance, path)`` pair in
+    ``todo`` on a process pool, and return the results in the same order.
+    Workers are forked so that the context and target do not need to be
+    picklable, only the results are sent back.
+    """
+    global _parse_job_state
+
+    _parse_job_state = ctx, target
+    try:
+        if jobs <= 1 or len(todo) <= 1:
+            return [_parse_outfile_job(job) for job in todo]
+
+        mp_context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=min(jobs, len(todo)),
+                                 mp_context=mp_context) as pool:
+            return list(pool.map(_parse_outfile_job, todo))
+    finally:
+        _parse_job_state = None
+
+
 def log_result(name: str, result: Result, ofile: io.TextIOWrapper):
     """
     :param name:
@@ -608,54 +1760,108 @@ def parse_results(ctx: Namespace, path: str, name: str) -> Iterator[Result]:
             yield result
 
 
+def has_results(path: str, name: str) -> bool:
+    """
+    Check if a file contains a complete result with the given name, without
+    parsing its fields. This is a cheap alternative to :func:`parse_results`
+    for callers that only need to know whether a result was written.
+
+    :param path: path to file to check
+    :param name: name of the result to look for
+    """
+    begin = '%s begin %s' % (result_prefix, name)
+    end = '%s end %s' % (result_prefix, name)
+    started = False
+
+    for line in _prefixed_lines(path):
+        if line == begin:
+            started = True
+        elif started and line == end:
+            return True
+
+    return False
+
+
 def parse_all_results(ctx: Namespace, path: str) -> \
         Iterator[Tuple[str, Result]]:
     """
-    Parse all results in a file.
+    Parse all results in a file. Only lines starting with the result prefix
+    are read (see :func:`_prefixed_lines`), so this is cheap even for large
+    log files with few results.
 
     :param ctx: the configuration context
     :param path: path to file to parse
     :returns: (name, result) tuples
     """
-    with open(path) as f:
-        result = bname = None
-
-        for line in f:
-            line = line.rstrip()
-            if line.startswith(result_prefix):
-                statement = line[len(result_prefix) + 1:]
-                if re.match(r'begin \w+', statement):
-                    bname = statement[6:]
-                    result = Namespace()
-                elif re.match(r'end \w+', statement):
-                    if result is None:
-                        ctx.log.error('missing start for "%s" end '
-                                      'statement in %s' % (bname, path))
-                    else:
-                        ename = statement[4:]
-                        if ename != bname:
-                            ctx.log.error('begin/end name mismatch in %s: '
-                                          '%s != %s' % (path, ename, bname))
-
-                        yield bname, result
-                        result = bname = None
-                elif result is None:
-                    ctx.log.error('ignoring %s statement outside of begin-end '
-                                  'in %s' % (result_prefix, path))
-                else:
-                    name, value = statement.split(': ', 1)
+    result = bname = None
+
+    for line in _prefixed_lines(path):
+        statement = line[len(result_prefix) + 1:]
+        match = _statement_re.match(statement)
+
+        if match and match.group(1) == 'begin':
+            bname = statement[6:]
+            result = Namespace()
+        elif match:
+            if result is None:
+                ctx.log.error('missing start for "%s" end '
+                              'statement in %s' % (bname, path))
+            else:
+                ename = statement[4:]
+                if ename != bname:
+                    ctx.log.error('begin/end name mismatch in %s: '
+                                  '%s != %s' % (path, ename, bname))
+
+                yield bname, result
+                result = bname = None
+        elif result is None:
+            ctx.log.error('ignoring %s statement outside of begin-end '
+                          'in %s' % (result_prefix, path))
+        else:
+            name, value = statement.split(': ', 1)
 
-                    if name in result:
-                        ctx.log.warning('duplicate metadata entry for "%s" in '
-                                        '%s, using the last one' % (name, path))
+            if name in result:
+                ctx.log.warning('duplicate metadata entry for "%s" in '
+                                '%s, using the last one' % (name, path))
 
-                    result[name] = _unbox_value(value)
+            result[name] = _unbox_value(value)
 
     if result is not None:
         ctx.log.error('%s begin statement without end in %s' %
                       (result_prefix, path))
 
 
+_statement_re = re.compile(r'(begin|end) \w')
+
+
+def _prefixed_lines(path: str) -> Iterator[str]:
+    """
+    Yield the lines of a file that start with :py:data:`result_prefix`, with
+    trailing whitespace stripped. The file is memory mapped and searched for
+    the prefix with ``bytes.find``, other lines are never decoded.
+    """
+    with open(path, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            return
+
+    with data:
+        prefix = result_prefix.encode()
+        pos = data.find(prefix)
+
+        while pos != -1:
+            end = data.find(b'\n', pos)
+            if end == -1:
+                end = len(data)
+
+            if pos == 0 or data[pos - 1] == ord('\n'):
+                yield data[pos:end].decode('utf-8', 'replace').rstrip()
+
+            pos = data.find(prefix, end)
+
+
 def _box_value(value):
     return str(value)
 
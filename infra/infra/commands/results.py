@@ -0,0 +1,358 @@
+import argparse
+import datetime
+import fnmatch
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+from itertools import chain
+from typing import Dict, Iterable, List, Optional
+from ..command import Command
+from ..instance import Instance
+from ..target import Target
+from ..util import FatalError, Namespace
+from .build import default_jobs, read_instance_flags
+from .report import ReportCommand, Result, add_table_report_args, \
+        parse_fields, parse_logs, rundir_path, _aggregate_fns
+
+
+# pylint: disable=E1101
+
+metadata_filename = '.run-metadata.json'
+
+
+class ResultsCommand(Command):
+    name = 'results'
+    description = 'collect results of many runs in a database and query it'
+
+    def add_args(self, parser):
+        subparsers = parser.add_subparsers(
+                title='action', metavar='ACTION', dest='action',
+                help='ingest | query')
+        subparsers.required = True
+
+        iparser = subparsers.add_parser('ingest',
+                help='parse run directories and store their results')
+        iparser.add_argument('target', metavar='TARGET',
+                choices=self.targets,
+                help=' | '.join(self.targets))
+        rundirsarg = iparser.add_argument('rundirs',
+                nargs='+', metavar='RUNDIR',
+                help='run directories to ingest (results/run.XXX), results '
+                     'of run directories that were ingested before are '
+                     'replaced')
+        iparser.add_argument('-i', '--instances', nargs='+',
+                metavar='INSTANCE', default=[], choices=self.instances,
+                help=' | '.join(self.instances))
+        iparser.add_argument('-j', '--jobs', type=int, default=default_jobs,
+                help='number of processes parsing logs (default %d)' %
+                     default_jobs)
+        self.add_db_arg(iparser)
+
+        qparser = subparsers.add_parser('query',
+                help='aggregate stored results, like the report command')
+        qparser.add_argument('target', metavar='TARGET',
+                choices=self.targets,
+                help=' | '.join(self.targets))
+        qparser.add_argument('-f', '--field', nargs='+', action='append',
+                metavar='FIELD:AGGR', default=[], required=True,
+                help='reported field followed by aggregation methods, see '
+                     'the report command')
+        qparser.add_argument('-i', '--instances', nargs='+',
+                metavar='PATTERN', default=[],
+                help='only report instances matching these glob patterns')
+        qparser.add_argument('-r', '--rundirs', nargs='+',
+                metavar='PATTERN', default=[],
+                help='only report run directories whose name matches '
+                     'these glob patterns')
+        qparser.add_argument('--since', type=_parse_date, metavar='DATE',
+                help='only report runs started at or after DATE '
+                     '(YYYY-MM-DD[THH:MM:SS])')
+        qparser.add_argument('--per-run', action='store_true',
+                help='report each run of an instance separately instead '
+                     'of aggregating over all runs')
+        qparser.add_argument('--groupby', metavar='FIELD',
+                help='field to group by (default: the target\'s '
+                     'aggregation field)')
+        qparser.add_argument('--filter', nargs='+', default=[],
+                help='only report these values of the --groupby field')
+        qparser.add_argument('--overhead', metavar='INSTANCE',
+                help='report each field as overhead relative to this '
+                     'instance (or INSTANCE@RUNDIR with --per-run)')
+        qparser.add_argument('--aggregate', choices=_aggregate_fns,
+                help='aggregation method for entire columns')
+        add_table_report_args(qparser)
+        self.add_db_arg(qparser)
+
+        try:
+            from argcomplete.completers import DirectoriesCompleter
+            rundirsarg.completer = DirectoriesCompleter()
+        except ImportError:
+            pass
+
+    def add_db_arg(self, parser):
+        parser.add_argument('--db', metavar='PATH',
+                help='results database (default: results/results.sqlite)')
+
+    def run(self, ctx):
+        a = ctx.args
+        target = self.targets[a.target]
+        path = a.db or os.path.join(ctx.paths.pool_results, 'results.sqlite')
+
+        with ResultDatabase(path) as db:
+            if a.action == 'ingest':
+                instances = self.instances.select(a.instances)
+                for rundir in a.rundirs:
+                    n = db.ingest(ctx, target, rundir, instances, a.jobs)
+                    ctx.log.info('ingested %d results from %s' % (n, rundir))
+            else:
+                self.query(ctx, target, db)
+
+    def query(self, ctx, target, db):
+        a = ctx.args
+        a.groupby = a.groupby or target.aggregation_field
+
+        fields = list(parse_fields(target, chain.from_iterable(a.field)))
+        names = [a.groupby] + [f for f, aggr in fields]
+        results = db.query(target, names, a.instances, a.rundirs, a.since,
+                           a.per_run)
+        if not results:
+            raise FatalError('no results in %s for the given filters' %
+                             db.path)
+
+        if a.overhead and a.overhead not in results:
+            raise FatalError('no results for baseline instance %s' %
+                             a.overhead)
+
+        ReportCommand().report_aggregate(ctx, target, results, fields)
+
+
+class ResultDatabase:
+    """
+    SQLite database of parsed results of many run directories, used by the
+    ``results`` command.
+
+    Each ingested ``(rundir, target)`` pair is a row in the ``runs`` table,
+    together with the run metadata written by :func:`write_run_metadata`
+    (start time, hostname, git revision and command line). The flags of each
+    instance are stored in ``instances``. Results are stored as JSON objects
+    in ``results`` and queried with ``json_extract``, so that only the
+    requested fields are loaded.
+    """
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY,
+            rundir TEXT NOT NULL,
+            target TEXT NOT NULL,
+            starttime TEXT,
+            hostname TEXT,
+            revision TEXT,
+            command TEXT,
+            UNIQUE (rundir, target)
+        );
+        CREATE TABLE IF NOT EXISTS instances (
+            run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+            instance TEXT NOT NULL,
+            flags TEXT,
+            PRIMARY KEY (run_id, instance)
+        );
+        CREATE TABLE IF NOT EXISTS results (
+            run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+            instance TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS runs_target ON runs (target, starttime);
+        CREATE INDEX IF NOT EXISTS results_run
+            ON results (run_id, instance);
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA foreign_keys = ON')
+        self.db.executescript(self.schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def ingest(self, ctx: Namespace, target: Target, rundir: str,
+               instances: Iterable[Instance] = (), jobs: int = 1) -> int:
+        """
+        Parse the logs of ``target`` in ``rundir`` with :func:`parse_logs`
+        and store the results, replacing those of an earlier ingestion of
+        the same run directory.
+
+        :param ctx: the configuration context
+        :param target: target whose logs are parsed
+        :param rundir: run directory to ingest
+        :param instances: instances to ingest, leave empty for all
+        :param jobs: number of processes parsing logs
+        :returns: the number of stored results
+        """
+        results = parse_logs(ctx, target, list(instances), [rundir],
+                             jobs=jobs)
+        rundir = os.path.abspath(rundir)
+        meta = read_run_metadata(rundir)
+        if meta.get('hostname') is None:
+            meta['hostname'] = next((r['hostname']
+                                     for r in chain(*results.values())
+                                     if 'hostname' in r), None)
+
+        with self.db:
+            self.db.execute('DELETE FROM runs WHERE rundir = ? AND target = ?',
+                            (rundir, target.name))
+            run_id = self.db.execute(
+                    'INSERT INTO runs (rundir, target, starttime, hostname, '
+                    'revision, command) VALUES (?, ?, ?, ?, ?, ?)',
+                    (rundir, target.name, meta.get('starttime'),
+                     meta.get('hostname'), meta.get('revision'),
+                     meta.get('command'))).lastrowid
+
+            flags = meta.get('instances', {})
+            self.db.executemany(
+                    'INSERT INTO instances (run_id, instance, flags) '
+                    'VALUES (?, ?, ?)',
+                    [(run_id, iname, json.dumps(flags.get(iname)))
+                     for iname in results])
+            self.db.executemany(
+                    'INSERT INTO results (run_id, instance, data) '
+                    'VALUES (?, ?, ?)',
+                    [(run_id, iname, json.dumps(result, default=str))
+                     for iname, instance_results in results.items()
+                     for result in instance_results])
+
+        return sum(len(r) for r in results.values())
+
+    def query(self, target: Target, fields: List[str],
+              instance_patterns: Iterable[str] = (),
+              rundir_patterns: Iterable[str] = (),
+              since: Optional[datetime.datetime] = None,
+              per_run: bool = False) -> Dict[str, List[Result]]:
+        """
+        Load stored results in the format of :func:`parse_logs`, so that
+        they can be passed to :func:`aggregate_results`.
+
+        :param target: target to load results for
+        :param fields: result fields to load, others are omitted
+        :param instance_patterns: glob patterns of instances to load, leave
+                                  empty for all instances
+        :param rundir_patterns: glob patterns matched against the base names
+                                of run directories, leave empty for all runs
+        :param since: only load runs started at or after this time
+        :param per_run: key results by ``<instance>@<rundir name>`` instead
+                        of merging all runs of an instance
+        :returns: ``{<instance>: [<result>, ...]}``
+        """
+        columns = ', '.join('json_extract(results.data, ?)' for f in fields)
+        query = ('SELECT runs.rundir, results.instance, %s FROM results '
+                 'JOIN runs ON runs.id = results.run_id '
+                 'WHERE runs.target = ?' % columns)
+        params = ['$."%s"' % f for f in fields] + [target.name]
+
+        instance_patterns = list(instance_patterns)
+        if instance_patterns:
+            query += ' AND (%s)' % ' OR '.join(
+                    ['results.instance GLOB ?'] * len(instance_patterns))
+            params += instance_patterns
+
+        if since:
+            query += ' AND runs.starttime >= ?'
+            params.append(since.isoformat())
+
+        rundir_patterns = list(rundir_patterns)
+        query += ' ORDER BY runs.starttime, runs.id, results.rowid'
+
+        results = {}
+        for rundir, instance, *values in self.db.execute(query, params):
+            name = os.path.basename(rundir)
+            if rundir_patterns and not any(fnmatch.fnmatchcase(name, p)
+                                           for p in rundir_patterns):
+                continue
+            if per_run:
+                instance = '%s@%s' % (instance, name)
+            result = {f: v for f, v in zip(fields, values) if v is not None}
+            results.setdefault(instance, []).append(result)
+
+        return results
+
+
+def write_run_metadata(ctx: Namespace, target: Target,
+                       instances: Iterable[Instance]):
+    """
+    Record metadata of the current run in its run directory, to be stored by
+    ``results ingest``: the start and end time, hostname, git revision of
+    the project, command line and the compiler flags of each instance as
+    recorded by the last build. Should be called after all jobs of the run
+    have finished. Does nothing if the run did not create a run directory.
+
+    :param ctx: the configuration context
+    :param target: target that was run
+    :param instances: instances that were run
+    """
+    rundir = rundir_path(ctx)
+    if not os.path.isdir(rundir):
+        return
+
+    try:
+        revision = subprocess.check_output(
+                ['git', '-C', ctx.paths.root, 'rev-parse', 'HEAD'],
+                stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+
+    flags = read_instance_flags(ctx, target)
+    for instance in instances:
+        if instance.name not in flags:
+            ctx.log.warning('no flags recorded for %s-%s, build it again to '
+                            'record them' % (target.name, instance.name))
+
+    meta = {
+        'target': target.name,
+        'starttime': ctx.starttime.isoformat(),
+        'endtime': datetime.datetime.now().isoformat(),
+        'hostname': socket.gethostname(),
+        'revision': revision,
+        'command': ' '.join(sys.argv),
+        'instances': {i.name: flags.get(i.name) for i in instances},
+    }
+
+    with open(os.path.join(rundir, metadata_filename), 'w') as f:
+        json.dump(meta, f, indent=4)
+
+
+def read_run_metadata(rundir: str) -> dict:
+    """
+    Read the metadata written by :func:`write_run_metadata`. For older run
+    directories, only the start time is derived from the directory name.
+
+    :param rundir: run directory
+    :returns: metadata dictionary, possibly empty
+    """
+    path = os.path.join(rundir, metadata_filename)
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+
+    try:
+        starttime = datetime.datetime.strptime(os.path.basename(rundir),
+                                               'run.%Y-%m-%d.%H-%M-%S')
+        return {'starttime': starttime.isoformat()}
+    except ValueError:
+        return {}
+
+
+def _parse_date(value):
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid date "%s"' % value)
@@ -1,6 +1,7 @@
 from ..command import Command
 from ..util import FatalError
 from .build import BuildCommand, default_jobs, load_deps
+from .results import write_run_metadata
 
 
 class RunCommand(Command):
@@ -71,3 +72,7 @@ class RunCommand(Command):
 
         if pool:
             pool.wait_all()
+
+        # only once all jobs have finished, so that an interrupted run has no
+        # metadata
+        write_run_metadata(ctx, target, instances)
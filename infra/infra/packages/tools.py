@@ -1,7 +1,7 @@
 import os
 from os.path import exists, join
 from abc import ABCMeta
-from ..commands.report import parse_results
+from ..commands.report import has_results, parse_results
 from ..package import Package
 from ..util import Namespace, run
 
@@ -106,3 +106,13 @@ class RusageCounters(Tool):
         :returns: counter results
         """
         return parse_results(ctx, path, 'rusage-counters')
+
+    @staticmethod
+    def has_results(path: str) -> bool:
+        """
+        Check if a file contains counter results by this package, without
+        parsing them.
+
+        :param path: path to file to check
+        """
+        return has_results(path, 'rusage-counters')
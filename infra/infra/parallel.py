@@ -7,16 +7,38 @@ import select
 import re
 import io
 import fcntl
+import errno
 import logging
 import random
+import glob
+import heapq
+import json
+from collections import defaultdict, deque
+from concurrent.futures import Future, as_completed, wait
 from subprocess import Popen, STDOUT
 from abc import ABCMeta, abstractmethod
-from typing import Union, List, Optional, Iterator, Callable
+from typing import Union, List, Optional, Iterator, Callable, Iterable, Any
 from .util import Namespace, run, require_program, FatalError
 
 
-# TODO: rewrite this to use
-# https://docs.python.org/3/library/concurrent.futures.html?
+class JobError(Exception):
+    """
+    Exception set on the future returned by :func:`Pool.submit` when a job
+    exits with an error, or when a job it depends on failed.
+
+    :param jobid: ID of the submitted job
+    :param jobs: the job processes that failed, empty if a dependency failed
+    """
+
+    def __init__(self, jobid: str, jobs: List[Popen]):
+        if jobs:
+            msg = 'job %s returned status %s' % \
+                (jobid, ', '.join(str(job.poll()) for job in jobs))
+        else:
+            msg = 'job %s was not started because a dependency failed' % jobid
+        super().__init__(msg)
+        self.jobid = jobid
+        self.jobs = jobs
 
 
 class Pool(metaclass=ABCMeta):
@@ -37,8 +59,32 @@ class Pool(metaclass=ABCMeta):
     ``--parallel=proc`` this is simply the number of parallel processes on the
     current machine. For ``--parallel=prun`` it is the maximum number of
     simultaneous jobs in the job queue (pending or running).
+
+    Finished jobs are removed by a poller thread, which notifies threads
+    waiting in :func:`wait_all` or for a free slot in the queue, so the next
+    job starts as soon as a slot is freed.
+
+    The durations of successful jobs are recorded by job ID and saved by
+    :func:`wait_all` (see :func:`load_durations`), so that later runs can
+    start the jobs that took longest first, see :func:`longest_first`.
+
+    Jobs can be started with :func:`run`, which blocks until there is space in
+    the queue, or with :func:`submit`, which returns a
+    :class:`concurrent.futures.Future` immediately and can wait for other
+    jobs to finish first. The futures work with
+    :func:`concurrent.futures.as_completed` and
+    :func:`concurrent.futures.wait`, which are also exported by this module::
+
+        builds = [pool.submit(ctx, build_cmd(b), 'build-' + b, ...)
+                  for b in benchmarks]
+        runs = [pool.submit(ctx, run_cmd(b), 'run-' + b, ..., after=[f])
+                for b, f in zip(benchmarks, builds)]
+        for future in as_completed(runs):
+            parse(future.result())
     """
-    poll_interval = 0.050  # seconds to wait for blocking actions
+    poll_interval = 0.050  # seconds the poller blocks before checking for exit
+    output_tail_size = 64 * 1024  # bytes of job output kept for error reports
+    pins_cpus = False      # whether jobs are pinned to dedicated cores
 
     @abstractmethod
     def make_jobs(self, ctx: Namespace, cmd: Union[str, List[str]], jobid: str,
@@ -58,6 +104,22 @@ class Pool(metaclass=ABCMeta):
         self.parallelmax = parallelmax
         self.jobs = {}
 
+        # protects jobs and the counters below, notified when a job finishes
+        self._job_done = threading.Condition()
+        self._nodes_in_use = 0
+        self._running_callbacks = 0
+        self._pending_submits = 0
+
+        # submitted jobs whose dependencies have finished, started in order by
+        # the dispatcher thread (kept longest first by _dependencies_done)
+        self._ready = deque()
+
+        # durations of jobs in previous and current runs, by job ID
+        self.durations = {}
+        self._recorded = {}
+        self._durations_path = None
+        self._durations_changed = False
+
     def __del__(self):
         if hasattr(self, 'pollthread'):
             self.done = True
@@ -82,8 +144,8 @@ class Pool(metaclass=ABCMeta):
 
                 if flags & select.EPOLLERR:
                     self.poller.unregister(fd)
-                    job = self.jobs.pop(fd)
-                    self.onerror(job)
+                    job = self._remove_job(fd)
+                    self._run_callback(self.onerror, job)
 
                 if flags & select.EPOLLHUP:
                     job = self.jobs[fd]
@@ -93,27 +155,261 @@ class Pool(metaclass=ABCMeta):
                         continue
 
                     self.poller.unregister(fd)
-                    del self.jobs[fd]
+                    self._remove_job(fd)
 
                     if job.poll() == 0:
-                        self.onsuccess(job)
+                        self._run_callback(self.onsuccess, job)
                     else:
-                        self.onerror(job)
+                        self._run_callback(self.onerror, job)
+
+    def _add_job(self, job):
+        with self._job_done:
+            self.jobs[job.stdout.fileno()] = job
+            self._nodes_in_use += job.nnodes
+
+    def _remove_job(self, fd):
+        # free the slot before running callbacks, which may start new jobs
+        with self._job_done:
+            job = self.jobs.pop(fd)
+            self._nodes_in_use -= job.nnodes
+            self._job_removed(job)
+            self._running_callbacks += 1
+            self._job_done.notify_all()
+        return job
+
+    def _job_removed(self, job):
+        # called with the job lock held when a finished job leaves the queue
+        pass
+
+    def _run_callback(self, callback, job):
+        try:
+            callback(job)
+        finally:
+            with self._job_done:
+                self._running_callbacks -= 1
+                self._job_done.notify_all()
 
     def _wait_for_queue_space(self, nodes_needed):
         if self.parallelmax is not None:
-            nnodes = lambda: sum(job.nnodes for job in self.jobs.values())
-            while nnodes() + nodes_needed > self.parallelmax:
-                time.sleep(self.poll_interval)
+            with self._job_done:
+                self._job_done.wait_for(lambda: self._nodes_in_use +
+                                        nodes_needed <= self.parallelmax)
 
     def wait_all(self):
         """
-        Block (busy-wait) until all jobs in the queue have been completed.
-        Called automatically by :class:`Setup` after the ``build`` and ``run``
+        Block until all submitted jobs have been started and all jobs in the
+        queue have been completed and their callbacks have returned. Called
+        automatically by :class:`Setup` after the ``build`` and ``run``
         commands.
         """
-        while len(self.jobs):
-            time.sleep(self.poll_interval)
+        with self._job_done:
+            self._job_done.wait_for(lambda: not self.jobs and
+                                    not self._running_callbacks and
+                                    not self._pending_submits)
+            self._save_durations()
+
+    def load_durations(self, path: str):
+        """
+        Load job durations recorded by previous runs from a JSON file, and
+        save the durations of this run to the same file in :func:`wait_all`.
+
+        :param path: path to the JSON file, need not exist yet
+        """
+        self._durations_path = path
+        try:
+            with open(path) as f:
+                self.durations.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except (TypeError, ValueError):
+            self.log.warning('ignoring invalid job durations in ' + path)
+
+    def _save_durations(self):
+        if self._durations_path is None or not self._durations_changed:
+            return
+        os.makedirs(os.path.dirname(self._durations_path), exist_ok=True)
+        tmp = self._durations_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.durations, f, indent=4, sort_keys=True)
+        os.replace(tmp, self._durations_path)
+        self._durations_changed = False
+
+    def _record_duration(self, job):
+        if not hasattr(job, 'start_time'):
+            return
+        # jobs started by the same call share an ID, record the longest
+        duration = round(time.time() - job.start_time, 3)
+        with self._job_done:
+            if self._recorded.get(job.basejobid, -1) < duration:
+                self._recorded[job.basejobid] = duration
+                self.durations[job.basejobid] = duration
+                self._durations_changed = True
+
+    def expected_duration(self, jobid: str) -> Optional[float]:
+        """
+        :param jobid: ID of the job as passed to :func:`run`
+        :returns: duration in seconds of the job in the last run that
+                  completed it, or ``None`` if it has not run before
+        """
+        return self.durations.get(jobid)
+
+    def longest_first(self, items: Iterable[Any],
+                      jobid: Callable[[Any], str] = str) -> List[Any]:
+        """
+        Order jobs by decreasing :func:`expected_duration`, to reduce the
+        total time of running them in parallel. Jobs that have not run before
+        come first since they may take long, in their original order.
+
+        :param items: the jobs to order
+        :param jobid: function that returns the job ID of an item
+        :returns: the ordered items
+        """
+        return sorted(items, key=lambda item: self._duration_key(jobid(item)))
+
+    def _duration_key(self, jobid):
+        duration = self.expected_duration(jobid)
+        return (0, 0) if duration is None else (1, -duration)
+
+    def submit(self, ctx: Namespace, cmd: Union[str, List[str]],
+               jobid: str, outfile: str, nnodes: int,
+               after: Iterable[Future] = (),
+               onsuccess: Optional[Callable[[Popen], None]] = None,
+               onerror: Optional[Callable[[Popen], None]] = None,
+               **kwargs) -> Future:
+        """
+        Non-blocking variant of :func:`run` that returns a future. The job is
+        started by a dispatcher thread once the jobs in ``after`` have
+        finished successfully and there is space in the queue. Of the jobs
+        whose dependencies have finished, the one with the longest
+        :func:`expected_duration` is started first (see
+        :func:`longest_first`), and otherwise jobs are started in submission
+        order.
+
+        The future's result is the list of finished job processes. If any of
+        them exits with an error, or a dependency fails, its exception is a
+        :class:`JobError`. ``onsuccess`` and ``onerror`` are called for each
+        job process before the future is resolved, like for :func:`run`.
+
+        :param ctx: the configuration context
+        :param cmd: the command to run
+        :param jobid: a human-readable ID for status reporting
+        :param outfile: full path to target file for command output
+        :param nnodes: number of cores or machines to run the command on
+        :param after: futures of jobs that must finish first
+        :param onsuccess: callback when a job finishes successfully
+        :param onerror: callback when a job exits with (typically I/O) error
+        :param kwargs: passed directly to :func:`util.run`
+        :returns: a future that is resolved when all jobs have finished
+        """
+        future = Future()
+        submission = Namespace(ctx=ctx, cmd=cmd, jobid=jobid, outfile=outfile,
+                               nnodes=nnodes, onsuccess=onsuccess,
+                               onerror=onerror, kwargs=kwargs, future=future)
+
+        with self._job_done:
+            self._pending_submits += 1
+        self._start_dispatcher()
+
+        after = list(after)
+        remaining = [len(after)]
+        lock = threading.Lock()
+
+        def dependency_done(dependency):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            self._dependencies_done(submission, after)
+
+        if after:
+            for dependency in after:
+                dependency.add_done_callback(dependency_done)
+        else:
+            self._dependencies_done(submission, after)
+
+        return future
+
+    def _dependencies_done(self, submission, after):
+        failed = [f for f in after if f.cancelled() or f.exception()]
+        if failed:
+            if submission.future.set_running_or_notify_cancel():
+                submission.future.set_exception(JobError(submission.jobid, []))
+            self._submit_done()
+            return
+
+        # keep ready jobs ordered longest first, see longest_first()
+        key = self._duration_key(submission.jobid)
+        with self._job_done:
+            i = len(self._ready)
+            while i and self._duration_key(self._ready[i - 1].jobid) > key:
+                i -= 1
+            self._ready.insert(i, submission)
+            self._job_done.notify_all()
+
+    def _start_dispatcher(self):
+        if not hasattr(self, 'dispatchthread'):
+            self.dispatchthread = threading.Thread(
+                target=self._dispatcher_thread, name='pool-dispatcher')
+            self.dispatchthread.daemon = True
+            self.dispatchthread.start()
+
+    def _dispatcher_thread(self):
+        while True:
+            with self._job_done:
+                self._job_done.wait_for(lambda: self._ready)
+                submission = self._ready.popleft()
+
+            try:
+                if submission.future.set_running_or_notify_cancel():
+                    self._run_submission(submission)
+            except BaseException as e:
+                if not submission.future.done():
+                    submission.future.set_exception(e)
+            finally:
+                self._submit_done()
+
+    def _submit_done(self):
+        with self._job_done:
+            self._pending_submits -= 1
+            self._job_done.notify_all()
+
+    def _run_submission(self, submission):
+        # resolve the future when all jobs have finished, the number of jobs
+        # is only known when run() returns and some may have finished by then
+        finished = []
+        failed = []
+        expected = [None]
+        lock = threading.Lock()
+
+        def resolve():
+            if expected[0] is None or len(finished) < expected[0]:
+                return
+            if failed:
+                submission.future.set_exception(
+                    JobError(submission.jobid, failed))
+            else:
+                submission.future.set_result(finished)
+
+        def done(job, callback, ok):
+            rv = callback(job) if callback else None
+            with lock:
+                finished.append(job)
+                if not ok:
+                    failed.append(job)
+                resolve()
+            return rv
+
+        jobs = self.run(submission.ctx, submission.cmd, submission.jobid,
+                        submission.outfile, submission.nnodes,
+                        onsuccess=lambda job: done(job, submission.onsuccess,
+                                                   True),
+                        onerror=lambda job: done(job, submission.onerror,
+                                                 False),
+                        **submission.kwargs)
+
+        with lock:
+            expected[0] = len(jobs)
+            resolve()
 
     def run(self, ctx: Namespace, cmd: Union[str, List[str]],
             jobid: str, outfile: str, nnodes: int,
@@ -149,7 +445,8 @@ class Pool(metaclass=ABCMeta):
             job.onsuccess = onsuccess
             job.onerror = onerror
             job.output = ''
-            self.jobs[job.stdout.fileno()] = job
+            job.basejobid = jobid
+            self._add_job(job)
             self.poller.register(job.stdout, select.EPOLLIN | select.EPOLLPRI |
                                              select.EPOLLERR | select.EPOLLHUP)
             jobs.append(job)
@@ -157,6 +454,8 @@ class Pool(metaclass=ABCMeta):
         return jobs
 
     def onsuccess(self, job):
+        self._record_duration(job)
+
         # don't log if onsuccess() returns False
         if not job.onsuccess or job.onsuccess(job) is not False:
             self.log.info('job %s finished%s' %
@@ -178,7 +477,44 @@ class Pool(metaclass=ABCMeta):
 
 
 class ProcessPool(Pool):
+    """
+    A ProcessPool runs jobs as processes on the current machine.
+
+    With ``--pin-cpus``, every job is pinned to a dedicated set of cores (a
+    slot, see :func:`cpu_slots`) for its whole lifetime, so concurrent jobs do
+    not compete for cores and caches, which makes measurements less noisy.
+    Jobs are pinned with ``taskset``. A slot is taken from the lowest-numbered
+    free slot when a job starts, and returned when the job finishes.
+    """
+
+    def __init__(self, logger, parallelmax, cpu_slots=None):
+        """
+        :param logger: logging object for status updates (set to ``ctx.log``)
+        :param parallelmax: value of ``--parallelmax``
+        :param cpu_slots: sets of CPUs to pin jobs to, one job per set (no
+                          pinning if ``None``)
+        """
+        if cpu_slots is not None and parallelmax > len(cpu_slots):
+            raise FatalError('parallelmax cannot be greater than number of '
+                             'CPU slots (%d)' % len(cpu_slots))
+        super().__init__(logger, parallelmax)
+        self.cpu_slots = cpu_slots
+        self.pins_cpus = cpu_slots is not None
+        self._free_slots = list(range(len(cpu_slots or [])))
+
+    def _acquire_cpu_slot(self):
+        with self._job_done:
+            self._job_done.wait_for(lambda: self._free_slots)
+            return heapq.heappop(self._free_slots)
+
+    def _job_removed(self, job):
+        if job.cpu_slot is not None:
+            heapq.heappush(self._free_slots, job.cpu_slot)
+
     def make_jobs(self, ctx, cmd, jobid_base, outfile_base, nnodes, **kwargs):
+        if self.pins_cpus:
+            require_program(ctx, 'taskset')
+
         for i in range(nnodes):
             jobid = jobid_base
             outfile = outfile_base
@@ -187,34 +523,51 @@ class ProcessPool(Pool):
                 outfile += '-%d' % i
 
             self._wait_for_queue_space(1)
-            ctx.log.info('running ' + jobid)
 
-            job = run(ctx, cmd, defer=True, stderr=STDOUT,
-                      bufsize=io.DEFAULT_BUFFER_SIZE,
-                      universal_newlines=False, **kwargs)
+            slot = cpus = None
+            job_cmd = cmd
+            if self.pins_cpus:
+                slot = self._acquire_cpu_slot()
+                cpus = self.cpu_slots[slot]
+                cpulist = _format_cpulist(cpus)
+                job_cmd = ['taskset', '-c', cpulist, *cmd]
+                ctx.log.info('running %s on cpus %s' % (jobid, cpulist))
+            else:
+                ctx.log.info('running ' + jobid)
+
+            try:
+                job = run(ctx, job_cmd, defer=True, stderr=STDOUT,
+                          bufsize=0,
+                          universal_newlines=False, **kwargs)
+            except BaseException:
+                if slot is not None:
+                    with self._job_done:
+                        heapq.heappush(self._free_slots, slot)
+                        self._job_done.notify_all()
+                raise
+
             _set_non_blocking(job.stdout)
             job.start_time = time.time()
             job.jobid = jobid
             job.nnodes = 1
+            job.cpu_slot = slot
+            job.cpus = cpus
 
             os.makedirs(os.path.dirname(outfile), exist_ok=True)
             job.outfiles = [outfile]
-            job.outfile_handle = open(outfile, 'wb')
+            job.outfile_handle = open(outfile, 'wb', buffering=0)
 
             yield job
 
     def process_job_output(self, job):
-        buf = job.stdout.read(io.DEFAULT_BUFFER_SIZE)
-        if buf is not None:
-            job.output += buf.decode('ascii', errors='replace')
-            job.outfile_handle.write(buf)
+        _copy_job_output(job)
 
     def onsuccess(self, job):
-        job.outfile_handle.close()
+        _close_job_output(job, self.output_tail_size)
         super().onsuccess(job)
 
     def onerror(self, job):
-        job.outfile_handle.close()
+        _close_job_output(job, self.output_tail_size)
         super().onerror(job)
 
 
@@ -231,6 +584,13 @@ class SSHPool(Pool):
 
     For targets that are being run via an SSHPool additional functionality is
     available, such as distributing files to/from nodes.
+
+    By default, each node runs one job at a time (a node may be listed more
+    than once to run more jobs on it). With ``--ssh-weighted``, the number of
+    jobs per node is its number of cores minus its load average, as discovered
+    over ssh, so that bigger and idler nodes get more jobs. Jobs are started on
+    the node with the largest fraction of its slots free, and idle nodes take
+    the next job from the shared queue as soon as they finish one.
     """
 
     ssh_opts = [
@@ -248,15 +608,22 @@ class SSHPool(Pool):
             '-r',
         ]
 
-    def __init__(self, ctx, logger, parallelmax, nodes):
-        if parallelmax > len(nodes):
+    def __init__(self, ctx, logger, parallelmax, nodes, weighted=False):
+        if not weighted and parallelmax > len(nodes):
             raise FatalError('parallelmax cannot be greater than number of '
                              'available nodes')
         super().__init__(logger, parallelmax)
         self._ctx = ctx
         self.nodes = nodes[:]
-        self.available_nodes = nodes[:]
+        self.weighted = weighted
         self.has_tested_nodes = False
+
+        # number of job slots and running jobs per node, capacities are
+        # discovered by test_nodes() if weighted
+        self.capacity = {}
+        for node in nodes:
+            self.capacity[node] = self.capacity.get(node, 0) + 1
+        self._node_jobs = dict.fromkeys(self.capacity, 0)
         self.has_created_tempdirs = False
 
     @property
@@ -275,16 +642,38 @@ class SSHPool(Pool):
     def test_nodes(self):
         if self.has_tested_nodes:
             return
-        for node in self.nodes:
-            cmd = ['ssh', *self.ssh_opts, node, 'echo -n hi']
-            p = run(self._ctx, cmd, stderr=STDOUT, silent=True)
+        for node in self.capacity:
+            test_cmd = 'nproc; cat /proc/loadavg; echo -n hi' if self.weighted \
+                       else 'echo -n hi'
+            p = run(self._ctx, self._ssh_cmd(node, test_cmd), stderr=STDOUT,
+                    silent=True)
             if p.returncode or not str(p.stdout).endswith('hi'):
                 self._ctx.log.error('Testing SSH node ' + node + ' failed:\n'
                         + p.stdout)
                 sys.exit(-1)
 
+            if self.weighted:
+                self._set_capacity(node, p.stdout)
+
         self.has_tested_nodes = True
 
+    def _set_capacity(self, node, test_output):
+        try:
+            nproc, loadavg = test_output.splitlines()[:2]
+            cores = int(nproc)
+            load = float(loadavg.split()[0])
+        except ValueError:
+            raise FatalError('could not read number of cores and load average '
+                             'of SSH node %s:\n%s' % (node, test_output))
+
+        # cores that are busy with other work are not available
+        capacity = max(1, cores - round(load))
+        self._ctx.log.debug('SSH node %s has %d cores and load %.2f, running '
+                            'up to %d jobs' % (node, cores, load, capacity))
+        with self._job_done:
+            self.capacity[node] = capacity
+            self._job_done.notify_all()
+
     def create_tempdirs(self):
         if self.has_created_tempdirs:
             return
@@ -341,13 +730,34 @@ class SSHPool(Pool):
             run(self._ctx, cmd)
 
     def get_free_node(self, override_node=None):
-        if override_node:
-            assert override_node in self.nodes
-            assert override_node in self.available_nodes
-            self.available_nodes.remove(override_node)
-            return override_node
-        else:
-            return self.available_nodes.pop()
+        """
+        Reserve a job slot on a node, waiting for one to become free. The slot
+        is released when the job started on it is finished.
+
+        :param override_node: node to use instead of the least busy one
+        :returns: the node
+        """
+        def free_slots(node):
+            return self.capacity[node] - self._node_jobs[node]
+
+        def least_busy_node():
+            nodes = [n for n in self.capacity if free_slots(n) > 0]
+            if nodes:
+                return max(nodes, key=lambda n: (free_slots(n) / self.capacity[n],
+                                                  free_slots(n)))
+
+        with self._job_done:
+            if override_node:
+                assert override_node in self.capacity
+                self._job_done.wait_for(lambda: free_slots(override_node) > 0)
+                node = override_node
+            else:
+                node = self._job_done.wait_for(least_busy_node)
+            self._node_jobs[node] += 1
+            return node
+
+    def _job_removed(self, job):
+        self._node_jobs[job.node] -= 1
 
     def make_jobs(self, ctx, cmd, jobid_base, outfile_base, nnodes, nodes=None,
             tunnel_to_nodes_dest=None, **kwargs):
@@ -375,9 +785,16 @@ class SSHPool(Pool):
                         (tunnel_src, tunnel_to_nodes_dest)]
 
             ssh_cmd = self._ssh_cmd(node, cmd, ssh_node_opts)
-            job = run(ctx, ssh_cmd, defer=True, stderr=STDOUT,
-                        bufsize=io.DEFAULT_BUFFER_SIZE,
-                        universal_newlines=False, **kwargs)
+            try:
+                job = run(ctx, ssh_cmd, defer=True, stderr=STDOUT,
+                            bufsize=0,
+                            universal_newlines=False, **kwargs)
+            except BaseException:
+                with self._job_done:
+                    self._node_jobs[node] -= 1
+                    self._job_done.notify_all()
+                raise
+
             _set_non_blocking(job.stdout)
             job.start_time = time.time()
             job.jobid = jobid
@@ -390,24 +807,19 @@ class SSHPool(Pool):
 
             os.makedirs(os.path.dirname(outfile), exist_ok=True)
             job.outfiles = [outfile]
-            job.outfile_handle = open(outfile, 'wb')
+            job.outfile_handle = open(outfile, 'wb', buffering=0)
 
             yield job
 
     def process_job_output(self, job):
-        buf = job.stdout.read(io.DEFAULT_BUFFER_SIZE)
-        if buf is not None:
-            job.output += buf.decode('ascii', errors='replace')
-            job.outfile_handle.write(buf)
+        _copy_job_output(job)
 
     def onsuccess(self, job):
-        job.outfile_handle.close()
-        self.available_nodes.append(job.node)
+        _close_job_output(job, self.output_tail_size)
         super().onsuccess(job)
 
     def onerror(self, job):
-        self.available_nodes.append(job.node)
-        job.outfile_handle.close()
+        _close_job_output(job, self.output_tail_size)
         super().onerror(job)
 
 
@@ -519,11 +931,150 @@ class PrunPool(Pool):
             job.logged = True
 
 
+_have_splice = hasattr(os, 'splice')
+_splice_size = 1 << 20
+
+
+def _copy_job_output(job):
+    # move all buffered output from the job's stdout pipe to its outfile,
+    # within the kernel if possible
+    src = job.stdout.fileno()
+    dst = job.outfile_handle.fileno()
+
+    while True:
+        try:
+            if getattr(job, 'splice', _have_splice):
+                try:
+                    n = os.splice(src, dst, _splice_size,
+                                  flags=os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK)
+                except OSError as e:
+                    if e.errno != errno.EINVAL:
+                        raise
+                    # the outfile does not support splicing
+                    job.splice = False
+                    continue
+            else:
+                buf = os.read(src, _splice_size)
+                job.outfile_handle.write(buf)
+                n = len(buf)
+        except BlockingIOError:
+            return
+        if not n:
+            return
+
+
+def _close_job_output(job, tail_size):
+    # the outfile holds the full output, only read back its tail for error
+    # reporting instead of keeping all output in memory
+    job.outfile_handle.close()
+
+    with open(job.outfiles[0], 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - tail_size))
+        tail = f.read()
+
+    if len(tail) < size:
+        # start at a line boundary
+        tail = tail[tail.find(b'\n') + 1:]
+        job.output = '[%d bytes omitted, see %s]\n' % \
+            (size - len(tail), job.outfiles[0])
+    else:
+        job.output = ''
+    job.output += tail.decode('ascii', errors='replace')
+
+
 def _set_non_blocking(f):
     flags = fcntl.fcntl(f, fcntl.F_GETFL)
     fcntl.fcntl(f, fcntl.F_SETFL, flags | os.O_NONBLOCK)
 
 
+_sysfs = '/sys/devices/system'
+
+
+def cpu_slots(cpus_per_job: int = 1, smt: bool = True) -> List[List[int]]:
+    """
+    Divide the CPUs this process may run on into slots of ``cpus_per_job``
+    CPUs, for :class:`ProcessPool`. The topology is read from
+    ``/sys/devices/system``:
+
+    - A slot never spans multiple NUMA nodes, so that the memory of a job is
+      allocated on the node it runs on. Slots are interleaved over the nodes,
+      to spread jobs over them when not all slots are used.
+    - Hardware threads of the same core (SMT siblings) are kept together in a
+      slot where possible. If ``smt`` is false, only the first thread of each
+      core is used and its siblings are left idle. Otherwise, slots that share
+      a core with another slot are ordered last.
+
+    :param cpus_per_job: number of CPUs (or cores if ``smt`` is false) per slot
+    :param smt: whether to use all hardware threads of a core
+    :returns: sorted lists of CPU numbers, most isolated slots first
+    """
+    sysfs = _sysfs
+    allowed = os.sched_getaffinity(0)
+
+    node_of = {}
+    for path in glob.glob(os.path.join(sysfs, 'node', 'node[0-9]*')):
+        node = int(os.path.basename(path)[4:])
+        with open(os.path.join(path, 'cpulist')) as f:
+            for cpu in _parse_cpulist(f.read()):
+                node_of[cpu] = node
+
+    # group the allowed hardware threads by physical core, identified by its
+    # first thread
+    cores = defaultdict(list)
+    for cpu in sorted(allowed):
+        path = os.path.join(sysfs, 'cpu', 'cpu%d' % cpu, 'topology',
+                            'thread_siblings_list')
+        try:
+            with open(path) as f:
+                core = min(_parse_cpulist(f.read()))
+        except (OSError, ValueError):
+            core = cpu
+        cores[node_of.get(core, 0), core].append(cpu)
+
+    # order threads core by core, and divide them into slots per node
+    threads = defaultdict(list)
+    for (node, core), cpus in sorted(cores.items()):
+        for cpu in cpus if smt else cpus[:1]:
+            threads[node].append((cpu, core))
+
+    node_slots = []
+    for node, cpus in sorted(threads.items()):
+        node_slots.append([cpus[i:i + cpus_per_job] for i in
+                           range(0, len(cpus) - cpus_per_job + 1, cpus_per_job)])
+
+    # interleave nodes, then move slots that share a core with an earlier
+    # slot to the end
+    slots = []
+    for i in range(max((len(s) for s in node_slots), default=0)):
+        slots += [s[i] for s in node_slots if i < len(s)]
+
+    seen_cores = set()
+    isolated = []
+    shared = []
+    for slot in slots:
+        slot_cores = set(core for cpu, core in slot)
+        (shared if slot_cores & seen_cores else isolated).append(slot)
+        seen_cores |= slot_cores
+
+    return [sorted(cpu for cpu, core in slot) for slot in isolated + shared]
+
+
+def _parse_cpulist(cpulist):
+    # parse the kernel's list format, e.g., "0-3,8,10-11"
+    cpus = []
+    for part in cpulist.strip().split(','):
+        if part:
+            start, _, end = part.partition('-')
+            cpus += range(int(start), int(end or start) + 1)
+    return cpus
+
+
+def _format_cpulist(cpus):
+    return ','.join(str(s) if s == e else '%d-%d' % (s, e)
+                    for s, e in _find_ranges(cpus))
+
+
 def _find_ranges(numbers):
     ranges = [(i, i) for i in numbers]
     ranges.sort()
@@ -356,6 +356,7 @@ class Setup:
         self.add_command(commands.PkgBuildCommand())
         self.add_command(commands.RunCommand())
         self.add_command(commands.ReportCommand())
+        self.add_command(commands.ResultsCommand())
         self.add_command(commands.CleanCommand())
         self.add_command(commands.ConfigCommand())
         self.add_command(commands.PkgConfigCommand())
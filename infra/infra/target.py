@@ -72,6 +72,17 @@ class Target(metaclass=ABCMeta):
     #               aggregating results.
     aggregation_field = None
 
+    #: :class:`int` Version of :func:`parse_outfile`, part of the key of the
+    #               results cached by the report command. Increment this
+    #               when the parser changes its output.
+    parser_version = 1
+
+    #: :class:`frozenset` Reportable fields that are expensive to parse. When
+    #               the report command reports none of them, it sets
+    #               ``ctx.report_lazy_fields`` to ``False`` while calling
+    #               :func:`parse_outfile`, which may then leave them out.
+    lazy_fields = frozenset()
+
     def __eq__(self, other):
         return isinstance(other, self.__class__) and other.name == self.name
 
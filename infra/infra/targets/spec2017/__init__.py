@@ -5,13 +5,13 @@ import argparse
 import getpass
 import re
 from contextlib import redirect_stdout
-from collections import defaultdict
 from typing import List
 from ...commands.report import outfile_path
 from ...util import FatalError, run, apply_patch, qjoin, require_program
 from ...target import Target
 from ...packages import Bash, Nothp, RusageCounters
 from ...parallel import PrunPool
+from .. import speclogs
 from .benchmark_sets import benchmark_sets
 
 
@@ -87,7 +87,8 @@ class SPEC2017(Target):
     :param nothp: run without transparent huge pages (they tend to introduce
                   noise in performance measurements), implies :class:`Nothp`
                   dependency if ``True``
-    :param force_cpu: bind runspec to this cpu core (-1 to disable)
+    :param force_cpu: bind runspec to this cpu core (-1 to disable), ignored
+                      when the pool pins jobs with ``--pin-cpus``
     :param default_benchmarks: specify benchmarks run by default
     """
 
@@ -103,6 +104,8 @@ class SPEC2017(Target):
         **RusageCounters.reportable_fields,
     }
     aggregation_field = 'benchmark'
+    lazy_fields = frozenset(RusageCounters.reportable_fields)
+    parser_version = 2
 
     def __init__(self, source_type: str,
                        source: str,
@@ -282,7 +285,7 @@ class SPEC2017(Target):
         wrapper =  'killwrap_tree'
         if self.nothp:
             wrapper += ' nothp'
-        if self.force_cpu >= 0:
+        if self.force_cpu >= 0 and not (pool and pool.pins_cpus):
             wrapper += ' taskset -c %d' % self.force_cpu
 
         cmd = '{wrapper} runcpu --config={config} --nobuild {runargs} {{bench}}'
@@ -365,8 +368,10 @@ class SPEC2017(Target):
                 # $ for bash variables and \" instead of "
                 cmd = cmd.replace('$', '\$').replace('"', '\\"')
 
-            for bench in benchmarks:
-                jobid = 'run-%s-%s' % (instance.name, bench)
+            # start the benchmarks that took longest in previous runs first
+            jobid_fn = lambda bench: 'run-%s-%s' % (instance.name, bench)
+            for bench in pool.longest_first(benchmarks, jobid_fn):
+                jobid = jobid_fn(bench)
                 outfile = outfile_path(ctx, self, instance, bench)
                 self._run_bash(ctx, cmd.format(bench=bench), pool, jobid=jobid,
                                outfile=outfile, nnodes=ctx.args.iterations)
@@ -503,104 +508,8 @@ class SPEC2017(Target):
     benchmarks = benchmark_sets
 
     def parse_outfile(self, ctx, instance_name, outfile):
-        def fix_specpath(path):
-            if not os.path.exists(path):
-                benchspec_dir = self._install_path(ctx, 'benchspec')
-                path = re.sub(r'.*/benchspec', benchspec_dir, path)
-            assert os.path.exists(path), 'invalid path ' + path
-            return path
-
-        def get_logpaths(contents):
-            matches = re.findall(r'The log for this run is in (.*)$',
-                                 contents, re.M)
-            for match in matches:
-                logpath = match.replace('The log for this run is in ', '')
-                yield logpath
-
-        def parse_logfile(logpath):
-            ctx.log.debug('parsing log file ' + logpath)
-
-            with open(logpath) as f:
-                logcontents = f.read()
-
-            m = re.match(r'^runcpu .+ started at .+ on "(.*)"', logcontents)
-            assert m, 'could not find hostname'
-            hostname = m.group(1)
-
-            m = re.search(r'^Benchmarks selected: (.+)$', logcontents, re.M)
-            assert m, 'could not find benchmark list'
-            error_benchmarks = set(m.group(1).split(', '))
-
-            pat = re.compile(r'([^ ]+) ([^ ]+) base (\w+) ratio=(-?[0-9.]+), '
-                             r'runtime=([0-9.]+).*', re.M)
-            m = pat.search(logcontents)
-            while m:
-                status, benchmark, workload, ratio, runtime = m.groups()
-                rusage_counters = defaultdict(int)
-
-                # find per-input logs by benchutils staticlib
-                rpat = r'Running %s.+?-C (.+?$)(.+?)^Specinvoke:' % benchmark
-                rundir, arglist = re.search(rpat, logcontents, re.M | re.S).groups()
-                errfiles = re.findall(r'-e ([^ ]+err) \.\./run_', arglist)
-                benchmark_error = False
-                for errfile in errfiles:
-                    path = os.path.join(fix_specpath(rundir), errfile)
-                    if not os.path.exists(path):
-                        ctx.log.error('missing errfile %s, there was probably '
-                                      'an error' % path)
-                        benchmark_error = True
-                        continue
-
-                    rusage_results = \
-                        list(RusageCounters.parse_results(ctx, path))
-                    if not rusage_results:
-                        ctx.log.error('no staticlib results in %s, there was '
-                                      'probably an error' % path)
-                        benchmark_error = True
-                        continue
-
-                    for result in rusage_results:
-                        for counter, value in result.items():
-                            rusage_counters[counter] += value
-
-                if benchmark_error:
-                    ctx.log.warning('cancel processing benchmark %s in log file '
-                                    '%s because of errors' % (benchmark, logpath))
-                else:
-                    yield {
-                        'benchmark': benchmark,
-                        'status': 'ok' if status == 'Success' else 'invalid',
-                        'workload': workload,
-                        'hostname': hostname,
-                        'runtime': float(runtime),
-                        'inputs': len(errfiles),
-                        **rusage_counters
-                    }
-                    error_benchmarks.remove(benchmark)
-
-                m = pat.search(logcontents, m.end())
-
-            for benchmark in error_benchmarks:
-                yield {
-                    'benchmark': benchmark,
-                    'status': 'error',
-                    'hostname': hostname,
-                }
-
-            ctx.log.debug('done parsing')
-
-        with open(outfile) as f:
-            outfile_contents = f.read()
-
-        logpaths = list(get_logpaths(outfile_contents))
-        if logpaths:
-            for logpath in logpaths:
-                yield from parse_logfile(logpath)
-        else:
-            yield {
-                'benchmark': re.sub(r'\.\d+$', '', os.path.basename(outfile)),
-                'status': 'timeout',
-            }
+        yield from speclogs.parse_outfile(ctx, outfile, 'runcpu',
+                                          self._install_path(ctx, 'benchspec'))
 
     #: :class:`list` Command line arguments for the built-in ``-allocs`` pass;
     #: Registers custom allocation function wrappers in SPEC benchmarks.
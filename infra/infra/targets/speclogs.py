@@ -0,0 +1,219 @@
+"""
+Parser for the logs of SPEC CPU runs, shared by the :class:`SPEC2006` and
+:class:`SPEC2017` targets.
+
+The outfile of a run refers to one or more logs written by ``runspec``
+(CPU2006) or ``runcpu`` (CPU2017). Each log is tokenized in a single pass
+into the scores of the benchmarks and the rundir and ``.err`` files of their
+inputs, which hold the rusage counters. Tokenized logs are memoised per
+process, so outfiles that refer to the same log only read it once in a serial
+parse. With ``report --jobs`` every worker keeps its own memo, and repeated
+reports rely on the result cache of the report command instead.
+"""
+import os
+import re
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Tuple
+from ..packages import RusageCounters
+from ..util import Namespace
+
+
+_logpath_re = re.compile(r'The log for this run is in (.*)$', re.M)
+_score_re = re.compile(r'([^ ]+) ([^ ]+) base (\w+) ratio=(-?[0-9.]+), '
+                       r'runtime=([0-9.]+)')
+_errfile_re = re.compile(r'-e ([^ ]+err) \.\./run_')
+_hostname_res = {
+    tool: re.compile(r'^%s .+ started at .+ on "(.*)"' % tool)
+    for tool in ('runspec', 'runcpu')
+}
+
+
+class SpecLog:
+    """
+    Tokenized log of a ``runspec``/``runcpu`` invocation.
+
+    :param hostname: host the benchmarks ran on
+    :param selected: names of the selected benchmarks, in order
+    :param scores: ``(status, benchmark, workload, ratio, runtime)`` string
+                   tuples for every score line, in order
+    :param sections: ``{<benchmark>: (<rundir>, [<errfile>, ...])}`` of the
+                     first run of every benchmark
+    """
+
+    def __init__(self, hostname: str, selected: List[str],
+                 scores: List[Tuple[str, str, str, str, str]],
+                 sections: Dict[str, Tuple[str, List[str]]]):
+        self.hostname = hostname
+        self.selected = selected
+        self.scores = scores
+        self.sections = sections
+
+
+def parse_outfile(ctx: Namespace, outfile: str, tool: str,
+                  benchspec_dir: str) -> Iterator[Dict[str, Any]]:
+    """
+    Parse the results of a SPEC run, for :func:`Target.parse_outfile`.
+
+    Yields a result per score in the logs referred to by ``outfile``, with
+    the rusage counters summed over the ``.err`` files of all inputs, and an
+    ``error`` result for each selected benchmark without a score. The
+    counters are left out when ``ctx.report_lazy_fields`` is false (see
+    :py:attr:`Target.lazy_fields`), in which case the ``.err`` files are only
+    checked for a counters result, without parsing it.
+
+    :param ctx: the configuration context
+    :param outfile: path to the outfile of the run
+    :param tool: ``runspec`` or ``runcpu``
+    :param benchspec_dir: ``benchspec`` directory of the installation, to
+                          find rundirs of logs that were moved
+    """
+    with open(outfile) as f:
+        logpaths = _logpath_re.findall(f.read())
+
+    if not logpaths:
+        yield {
+            'benchmark': re.sub(r'\.\d+$', '', os.path.basename(outfile)),
+            'status': 'timeout',
+        }
+        return
+
+    read_errfiles = ctx.get('report_lazy_fields', True)
+
+    for logpath in logpaths:
+        ctx.log.debug('parsing log file ' + logpath)
+        log = read_log(logpath, tool)
+        error_benchmarks = dict.fromkeys(log.selected)
+
+        for status, benchmark, workload, ratio, runtime in log.scores:
+            rusage_counters = defaultdict(int)
+            benchmark_error = False
+
+            if benchmark in log.sections:
+                rundir, errfiles = log.sections[benchmark]
+            else:
+                ctx.log.error('no run of %s in %s' % (benchmark, logpath))
+                rundir, errfiles = None, []
+                benchmark_error = True
+
+            for errfile in errfiles:
+                path = os.path.join(_fix_specpath(rundir, benchspec_dir),
+                                    errfile)
+                if not os.path.exists(path):
+                    ctx.log.error('missing errfile %s, there was probably '
+                                  'an error' % path)
+                    benchmark_error = True
+                    continue
+
+                # without counters, only check that there are results so that
+                # the same benchmarks are reported as by a full parse
+                if read_errfiles:
+                    rusage_results = list(RusageCounters.parse_results(ctx,
+                                                                       path))
+                elif RusageCounters.has_results(path):
+                    continue
+                else:
+                    rusage_results = []
+
+                if not rusage_results:
+                    ctx.log.error('no staticlib results in %s, there was '
+                                  'probably an error' % path)
+                    benchmark_error = True
+                    continue
+
+                for result in rusage_results:
+                    for counter, value in result.items():
+                        rusage_counters[counter] += value
+
+            if benchmark_error:
+                ctx.log.warning('cancel processing benchmark %s in log file '
+                                '%s because of errors' % (benchmark, logpath))
+            else:
+                yield {
+                    'benchmark': benchmark,
+                    'status': 'ok' if status == 'Success' else 'invalid',
+                    'workload': workload,
+                    'hostname': log.hostname,
+                    'runtime': float(runtime),
+                    'inputs': len(errfiles),
+                    **rusage_counters
+                }
+                error_benchmarks.pop(benchmark, None)
+
+        for benchmark in error_benchmarks:
+            yield {
+                'benchmark': benchmark,
+                'status': 'error',
+                'hostname': log.hostname,
+            }
+
+        ctx.log.debug('done parsing')
+
+
+def read_log(path: str, tool: str) -> SpecLog:
+    """
+    Tokenize a ``runspec``/``runcpu`` log, or return the memoised result if
+    the file did not change since it was last read by this process. The
+    returned object is shared and must not be modified.
+
+    :param path: path to the log file
+    :param tool: ``runspec`` or ``runcpu``
+    """
+    st = os.stat(path)
+    return _read_log(path, st.st_size, st.st_mtime_ns, tool)
+
+
+@lru_cache(maxsize=64)
+def _read_log(path, size, mtime_ns, tool):
+    selected = None
+    scores = []
+    sections = {}
+    section = None
+
+    with open(path) as f:
+        m = _hostname_res[tool].match(f.readline())
+        assert m, 'could not find hostname'
+        hostname = m.group(1)
+
+        for line in f:
+            # inside "Running <benchmark>": find the rundir after -C and the
+            # .err files of its inputs, up to the specinvoke command
+            if section is not None:
+                benchmark, rundir, errfiles = section
+                if rundir is None:
+                    i = line.find('-C ')
+                    if i >= 0:
+                        section[1] = line[i + 3:].rstrip('\n')
+                elif line.startswith('Specinvoke:'):
+                    sections[benchmark] = rundir, errfiles
+                    section = None
+                else:
+                    errfiles += _errfile_re.findall(line)
+                continue
+
+            i = line.find('Running ')
+            if i >= 0:
+                parts = line[i + 8:].split(' ', 1)
+                if len(parts) == 2 and parts[0] not in sections:
+                    section = [parts[0], None, []]
+                    i = parts[1].find('-C ')
+                    if i >= 0:
+                        section[1] = parts[1][i + 3:].rstrip('\n')
+                    continue
+
+            if 'ratio=' in line:
+                m = _score_re.search(line)
+                if m:
+                    scores.append(m.groups())
+            elif selected is None and line.startswith('Benchmarks selected: '):
+                selected = line[21:].rstrip('\n').split(', ')
+
+    assert selected is not None, 'could not find benchmark list'
+    return SpecLog(hostname, selected, scores, sections)
+
+
+def _fix_specpath(path, benchspec_dir):
+    if not os.path.exists(path):
+        path = re.sub(r'.*/benchspec', benchspec_dir, path)
+    assert os.path.exists(path), 'invalid path ' + path
+    return path
@@ -0,0 +1,121 @@
+import math
+import random
+from statistics import mean, median, pvariance
+import numpy as np
+import pytest
+from infra.commands.report import _Geomean, _Median, \
+        _MedianAbsoluteDeviation, _Moments, _P2Quantile, geomean, \
+        mann_whitney_u
+
+
+class _SmallMAD(_MedianAbsoluteDeviation):
+    exact_limit = 10
+
+
+class _SmallMedian(_Median):
+    exact_limit = 10
+
+
+def _exact_mad(values):
+    med = median(values)
+    return median(abs(x - med) for x in values)
+
+
+def test_mad_counts_each_value_once_across_exact_limit():
+    mad = _SmallMAD()
+    for value in range(_SmallMAD.exact_limit + 1):
+        mad.add(value)
+
+    # the last marker position of a P-square estimate is the number of values
+    assert mad.values is None
+    assert mad.deviations.pos[4] == _SmallMAD.exact_limit + 1
+
+    mad.add(100)
+    assert mad.deviations.pos[4] == _SmallMAD.exact_limit + 2
+
+
+def test_mad_estimate_close_to_exact():
+    rng = random.Random(0)
+    values = [rng.gauss(100, 10) for _ in range(5000)]
+
+    mad = _SmallMAD()
+    for value in values:
+        mad.add(value)
+
+    assert abs(mad.result() - _exact_mad(values)) / _exact_mad(values) < 0.05
+
+
+def test_median_exact_up_to_limit():
+    values = [5, 1, 4, 2, 3, 9, 8, 7, 6, 10]
+    med = _SmallMedian()
+    for value in values:
+        med.add(value)
+
+    assert med.estimate is None
+    assert med.result() == median(values) == 5.5
+
+
+def test_p2_quantile_exact_for_five_values():
+    estimate = _P2Quantile(0.5, [3.0, 1.0, 5.0, 2.0, 4.0])
+    assert estimate.result() == 3.0
+    assert estimate.pos[4] == 5
+
+
+def test_median_estimate_close_to_exact():
+    rng = random.Random(1)
+    values = [rng.expovariate(1.0) for _ in range(20000)]
+
+    med = _SmallMedian()
+    for value in values:
+        med.add(value)
+
+    assert med.values is None
+    assert med.estimate.pos[4] == len(values)
+    assert med.result() == pytest.approx(median(values), rel=0.02)
+
+
+def test_moments_match_statistics():
+    ints = [3, 1, 4, 1, 5, 9, 2, 6]
+    moments = _Moments()
+    for value in ints:
+        moments.add(value)
+    assert moments.mean() == mean(ints)
+    assert moments.variance() == pvariance(ints)
+
+    floats = [0.5, 2.25, 1.0, 7.5]
+    moments = _Moments()
+    for value in floats:
+        moments.add(value)
+    assert moments.mean() == pytest.approx(mean(floats))
+    assert moments.variance() == pytest.approx(pvariance(floats))
+
+
+def test_geomean_matches_product():
+    values = [1.5, 2.0, 8.0, 0.25]
+    agg = _Geomean()
+    for value in values:
+        agg.add(value)
+    assert agg.result() == pytest.approx(geomean(values))
+
+    # would overflow as a product
+    agg = _Geomean()
+    for _ in range(400):
+        agg.add(1e300)
+    assert agg.result() == pytest.approx(1e300)
+    assert math.isinf(math.prod([1e300] * 400))
+
+
+@pytest.mark.parametrize('x, y, p', [
+    # exact distribution: U = 0 is 1 of C(6, 3) and C(10, 5) orderings, on
+    # both sides
+    ([1, 2, 3], [4, 5, 6], 2 / 20),
+    ([1, 2, 3, 4, 5], [6, 7, 8, 9, 10], 2 / 252),
+    ([1.5, 3.2, 4.1, 7.7, 9.0, 2.2], [5.5, 6.1, 8.3, 10.4, 11.0], 38 / 462),
+    # normal approximation, values of scipy.stats.mannwhitneyu
+    ([1, 2, 2, 3], [2, 3, 4, 5], 0.1366582477381475),
+    (list(range(0, 60, 2)), list(range(1, 61, 2)), 0.8302552839111963),
+])
+def test_mann_whitney_u(x, y, p):
+    x, y = np.array(x, dtype=float), np.array(y, dtype=float)
+    assert mann_whitney_u(x, y) == pytest.approx(p)
+    assert mann_whitney_u(y, x) == pytest.approx(p)
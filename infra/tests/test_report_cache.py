@@ -0,0 +1,81 @@
+import logging
+import sqlite3
+from infra.commands.report import ResultCache
+from infra.util import Namespace
+
+
+class _Target:
+    name = 'target'
+    parser_version = 1
+
+
+class _FailingConnection:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, *args):
+        if sql.startswith('INSERT'):
+            raise sqlite3.OperationalError('database is locked')
+        return self.conn.execute(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+def _make_log(tmp_path):
+    path = tmp_path / 'target' / 'instance' / 'bench.0'
+    path.parent.mkdir(parents=True)
+    path.write_text('log\n')
+    return str(path)
+
+
+def test_cache_round_trip(tmp_path):
+    ctx = Namespace(log=logging.getLogger('test'))
+    path = _make_log(tmp_path)
+
+    cache = ResultCache(ctx, str(tmp_path))
+    results, key = cache.get(_Target(), path)
+    assert results is None
+    cache.put(_Target(), key, [{'benchmark': 'bench', 'runtime': 1.5}])
+    cache.close()
+
+    cache = ResultCache(ctx, str(tmp_path))
+    results, _ = cache.get(_Target(), path)
+    assert results == [{'benchmark': 'bench', 'runtime': 1.5}]
+
+    # partial results are not used for full requests
+    cache.put(_Target(), key, [{'benchmark': 'bench'}], partial=True)
+    assert cache.get(_Target(), path)[0] is None
+    assert cache.get(_Target(), path, partial=True)[0] == [{'benchmark': 'bench'}]
+    cache.close()
+
+
+def test_cache_ignores_key_of_grown_log(tmp_path):
+    ctx = Namespace(log=logging.getLogger('test'))
+    path = _make_log(tmp_path)
+
+    cache = ResultCache(ctx, str(tmp_path))
+    _, key = cache.get(_Target(), path)
+    with open(path, 'a') as f:
+        f.write('more output\n')
+    cache.put(_Target(), key, [{'benchmark': 'bench'}])
+
+    assert cache.get(_Target(), path)[0] is None
+    cache.close()
+
+
+def test_cache_write_failure_only_warns(tmp_path, caplog):
+    ctx = Namespace(log=logging.getLogger('test'))
+    path = _make_log(tmp_path)
+
+    cache = ResultCache(ctx, str(tmp_path))
+    cache.conn = _FailingConnection(cache.conn)
+    _, key = cache.get(_Target(), path)
+
+    with caplog.at_level(logging.WARNING):
+        cache.put(_Target(), key, [{'benchmark': 'bench'}])
+
+    assert len(caplog.records) == 1
+    assert 'could not cache results for target/instance/bench.0' in \
+        caplog.records[0].getMessage()
+    cache.close()
@@ -0,0 +1,71 @@
+import datetime
+import json
+import logging
+from infra.commands.results import ResultDatabase, metadata_filename
+from infra.util import Namespace
+
+
+class _Target:
+    name = 'target'
+    parser_version = 1
+    lazy_fields = frozenset()
+
+    def parse_outfile(self, ctx, instance_name, outfile):
+        with open(outfile) as f:
+            for line in f:
+                benchmark, runtime = line.split()
+                yield {'benchmark': benchmark, 'runtime': float(runtime),
+                       'hostname': 'host'}
+
+
+def _make_rundir(tmp_path, name, logs, meta=None):
+    rundir = tmp_path / name
+    for instance, lines in logs.items():
+        idir = rundir / 'target' / instance
+        idir.mkdir(parents=True)
+        (idir / 'bench.0').write_text(''.join(l + '\n' for l in lines))
+    if meta is not None:
+        (rundir / metadata_filename).write_text(json.dumps(meta))
+    return str(rundir)
+
+
+def test_ingest_query_round_trip(tmp_path):
+    ctx = Namespace(log=logging.getLogger('test'))
+    old = _make_rundir(tmp_path, 'run.2024-01-01.10-00-00', {
+        'clang': ['a 1.0', 'b 2.0'],
+        'asan': ['a 3.0'],
+    })
+    new = _make_rundir(tmp_path, 'run.2024-02-01.10-00-00', {
+        'clang': ['a 1.5'],
+    }, meta={'starttime': '2024-02-01T10:00:00', 'hostname': 'other',
+             'instances': {'clang': {'cflags': ['-O2']}}})
+
+    with ResultDatabase(str(tmp_path / 'results.sqlite')) as db:
+        assert db.ingest(ctx, _Target(), new) == 1
+        assert db.ingest(ctx, _Target(), old) == 3
+        # ingesting again replaces the results instead of adding them
+        assert db.ingest(ctx, _Target(), old) == 3
+
+        results = db.query(_Target(), ['benchmark', 'runtime'])
+        assert results == {
+            'clang': [{'benchmark': 'a', 'runtime': 1.0},
+                      {'benchmark': 'b', 'runtime': 2.0},
+                      {'benchmark': 'a', 'runtime': 1.5}],
+            'asan': [{'benchmark': 'a', 'runtime': 3.0}],
+        }
+
+        assert db.query(_Target(), ['runtime'], instance_patterns=['as*']) \
+            == {'asan': [{'runtime': 3.0}]}
+        assert db.query(_Target(), ['runtime'],
+                        since=datetime.datetime(2024, 1, 15)) \
+            == {'clang': [{'runtime': 1.5}]}
+        assert db.query(_Target(), ['runtime'], per_run=True,
+                        rundir_patterns=['run.2024-02-*']) \
+            == {'clang@run.2024-02-01.10-00-00': [{'runtime': 1.5}]}
+
+        runs = db.db.execute('SELECT hostname FROM runs ORDER BY starttime')
+        assert [h for h, in runs] == ['host', 'other']
+        flags = db.db.execute('SELECT flags FROM instances JOIN runs '
+                              'ON runs.id = run_id WHERE instance = ? '
+                              'ORDER BY starttime', ('clang',))
+        assert [json.loads(f) for f, in flags] == [None, {'cflags': ['-O2']}]
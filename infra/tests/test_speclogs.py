@@ -0,0 +1,58 @@
+import logging
+from infra.targets.speclogs import parse_outfile
+from infra.util import Namespace
+
+
+_counters = '''\
+[setup-report] begin rusage-counters
+[setup-report] maxrss: 1024
+[setup-report] page_faults: 3
+[setup-report] end rusage-counters
+'''
+
+
+def _make_run(tmp_path, errfiles):
+    rundir = tmp_path / 'run'
+    rundir.mkdir()
+    lines = ['runspec v6 started at 2024-01-01 on "host"',
+             'Benchmarks selected: %s' % ', '.join(errfiles)]
+
+    for benchmark, content in errfiles.items():
+        (rundir / (benchmark + '.err')).write_text(content)
+        lines += ['Running %s ref base x default -C %s' % (benchmark, rundir),
+                  '-o %s.out -e %s.err ../run_base/x' % (benchmark, benchmark),
+                  'Specinvoke: done']
+
+    for benchmark in errfiles:
+        lines.append('Success %s base ref ratio=1.00, runtime=2.5' % benchmark)
+
+    logpath = tmp_path / 'CPU2006.001.log'
+    logpath.write_text('\n'.join(lines) + '\n')
+    outfile = tmp_path / 'spec2006.0'
+    outfile.write_text('The log for this run is in %s\n' % logpath)
+    return str(outfile)
+
+
+def _parse(outfile, lazy_fields):
+    ctx = Namespace(log=logging.getLogger('test'),
+                    report_lazy_fields=lazy_fields)
+    results = parse_outfile(ctx, outfile, 'runspec', '/nonexistent')
+    return {r['benchmark']: r for r in results}
+
+
+def test_partial_parse_reports_same_benchmarks(tmp_path):
+    outfile = _make_run(tmp_path, {
+        '400.perlbench': 'warning\n' + _counters,
+        '401.bzip2': 'crashed\n',
+        '403.gcc': '[setup-report] begin rusage-counters\n',
+    })
+
+    full = _parse(outfile, True)
+    partial = _parse(outfile, False)
+
+    assert {b: r['status'] for b, r in full.items()} == {
+        '400.perlbench': 'ok', '401.bzip2': 'error', '403.gcc': 'error'}
+    assert {b: r['status'] for b, r in partial.items()} == \
+        {b: r['status'] for b, r in full.items()}
+    assert full['400.perlbench']['maxrss'] == 1024
+    assert 'maxrss' not in partial['400.perlbench']
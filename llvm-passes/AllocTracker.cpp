@@ -15,6 +15,9 @@
 #include <llvm/IR/Instruction.h>
 #include <llvm/IR/Instructions.h>
 #include "llvm/IR/IRBuilder.h"
+#include <llvm/IR/GlobalVariable.h>
+#include <llvm/IR/MDBuilder.h>
+#include <llvm/Transforms/Utils/BasicBlockUtils.h>
 #include <llvm/ADT/SmallVector.h>
 #include <llvm/ADT/Twine.h>
 #include "llvm/Support/raw_ostream.h"
@@ -27,42 +30,160 @@ using namespace llvm;
 
 namespace {
 
+    // A tracked alloca, sites that share a counter are always executed
+    // together (static allocas execute once per call of their function)
+    struct AllocSite {
+        uint32_t counter;
+        uint64_t size;
+        Type::TypeID type;
+        Function *function;
+    };
+
     struct AllocTracker : PassInfoMixin<AllocTracker> {
         public:
             PreservedAnalyses run(Module &M, ModuleAnalysisManager &);
         private:
-            Function *AllocRegisterFn;
+            std::vector<AllocSite> Sites;
+            uint32_t NumCounters;
+
+            void collectSites(Function &F, std::vector<std::pair<Instruction *, uint32_t>> &Increments);
+            GlobalVariable *createSiteTable(Module &M);
+            void createIncrement(Instruction *I, uint32_t Counter, GlobalVariable *ThreadCounts,
+                                 FunctionCallee ThreadCountsFn, GlobalVariable *Table);
     };
 
-    PreservedAnalyses AllocTracker::run(Module &M, ModuleAnalysisManager &) {
-        if (!(AllocRegisterFn = M.getFunction(NOINSTRUMENT_PREFIX "register_alloc"))) {
-                Type *VoidTy = Type::getVoidTy(M.getContext());
-                Type *IntTy = Type::getInt32Ty(M.getContext());
-                FunctionType *FnTy = FunctionType::get(VoidTy, {IntTy, IntTy}, false);
-                AllocTracker::AllocRegisterFn = Function::Create(FnTy, GlobalValue::ExternalLinkage,
-                                                NOINSTRUMENT_PREFIX "register_alloc", &M);
-        }
-        
-        for (Function &F : M) {
-            for (BasicBlock &BB : F) {
-                for (Instruction &I : BB) {
-                    if (isa<AllocaInst>(I)) {
-                        std::optional<TypeSize> allocSize = cast<AllocaInst>(I).getAllocationSize(M.getDataLayout());;
-
-                        if (allocSize.has_value()) {
-                            auto FnCallee = M.getOrInsertFunction(NOINSTRUMENT_PREFIX "register_alloc",
-                                            Type::getVoidTy(M.getContext()), Type::getInt32Ty(M.getContext()));
-                            
-                            IRBuilder<> B(&I.getFunction()->getEntryBlock());
-                            B.SetInsertPoint(&I);
-                            Value *size = cast<Value>(ConstantInt::get(Type::getInt32Ty(M.getContext()), allocSize.value().getFixedValue()));
-                            Value *type = cast<Value>(ConstantInt::get(Type::getInt32Ty(M.getContext()), static_cast<int>(cast<AllocaInst>(I).getAllocatedType()->getTypeID())));
-                            B.CreateCall(AllocTracker::AllocRegisterFn->getFunctionType(), FnCallee.getCallee(), {size, type});
-                        }
+    // Static allocas are counted once at function entry, all other allocas
+    // with a known size get their own counter incremented in place
+    void AllocTracker::collectSites(Function &F, std::vector<std::pair<Instruction *, uint32_t>> &Increments) {
+        const DataLayout &DL = F.getParent()->getDataLayout();
+        std::optional<uint32_t> EntryCounter;
+
+        for (BasicBlock &BB : F) {
+            for (Instruction &I : BB) {
+                AllocaInst *AI = dyn_cast<AllocaInst>(&I);
+                if (!AI)
+                    continue;
+
+                std::optional<TypeSize> allocSize = AI->getAllocationSize(DL);
+                if (!allocSize.has_value())
+                    continue;
+
+                uint32_t Counter;
+                if (AI->isStaticAlloca()) {
+                    if (!EntryCounter.has_value()) {
+                        EntryCounter = NumCounters++;
+
+                        // Insert after the leading allocas so they stay static
+                        BasicBlock::iterator IP = F.getEntryBlock().getFirstInsertionPt();
+                        while (isa<AllocaInst>(*IP))
+                            ++IP;
+                        Increments.push_back({&*IP, EntryCounter.value()});
                     }
+                    Counter = EntryCounter.value();
+                } else {
+                    Counter = NumCounters++;
+                    Increments.push_back({AI, Counter});
                 }
+
+                Sites.push_back({Counter, allocSize.value().getFixedValue(),
+                                 AI->getAllocatedType()->getTypeID(), &F});
             }
         }
+    }
+
+    // Side table of { i32 counter, i32 size, i32 typeID, ptr function name }
+    GlobalVariable *AllocTracker::createSiteTable(Module &M) {
+        LLVMContext &Ctx = M.getContext();
+        Type *Int32Ty = Type::getInt32Ty(Ctx);
+        PointerType *PtrTy = PointerType::get(Ctx, 0);
+        StructType *SiteTy = StructType::get(Ctx, {Int32Ty, Int32Ty, Int32Ty, PtrTy});
+
+        std::map<Function *, Constant *> Names;
+        std::vector<Constant *> Entries;
+        for (const AllocSite &Site : Sites) {
+            Constant *&Name = Names[Site.function];
+            if (!Name) {
+                Constant *Str = ConstantDataArray::getString(Ctx, Site.function->getName());
+                auto *GV = new GlobalVariable(M, Str->getType(), true, GlobalValue::PrivateLinkage,
+                                              Str, NOINSTRUMENT_PREFIX "site_name");
+                GV->setUnnamedAddr(GlobalValue::UnnamedAddr::Global);
+                Name = GV;
+            }
+
+            Entries.push_back(ConstantStruct::get(SiteTy, {
+                ConstantInt::get(Int32Ty, Site.counter),
+                ConstantInt::get(Int32Ty, Site.size),
+                ConstantInt::get(Int32Ty, static_cast<int>(Site.type)),
+                Name
+            }));
+        }
+
+        ArrayType *TableTy = ArrayType::get(SiteTy, Entries.size());
+        return new GlobalVariable(M, TableTy, true, GlobalValue::PrivateLinkage,
+                                  ConstantArray::get(TableTy, Entries), NOINSTRUMENT_PREFIX "sites");
+    }
+
+    // Increment a counter in the array of the current thread, which is
+    // requested from the runtime on the first increment of every thread
+    void AllocTracker::createIncrement(Instruction *I, uint32_t Counter, GlobalVariable *ThreadCounts,
+                                       FunctionCallee ThreadCountsFn, GlobalVariable *Table) {
+        LLVMContext &Ctx = I->getContext();
+        Type *Int64Ty = Type::getInt64Ty(Ctx);
+        PointerType *PtrTy = PointerType::get(Ctx, 0);
+
+        IRBuilder<> B(I);
+        LoadInst *Counts = B.CreateLoad(PtrTy, ThreadCounts);
+        Instruction *Then = SplitBlockAndInsertIfThen(B.CreateIsNull(Counts), I, false,
+                                                      MDBuilder(Ctx).createBranchWeights(1, 1 << 20));
+
+        B.SetInsertPoint(Then);
+        CallInst *NewCounts = B.CreateCall(ThreadCountsFn, {Table,
+            ConstantInt::get(Int64Ty, Sites.size()), ConstantInt::get(Int64Ty, NumCounters)});
+        B.CreateStore(NewCounts, ThreadCounts);
+
+        // The split leaves I at the start of the tail block
+        B.SetInsertPoint(I);
+        PHINode *Phi = B.CreatePHI(PtrTy, 2);
+        Phi->addIncoming(Counts, Counts->getParent());
+        Phi->addIncoming(NewCounts, Then->getParent());
+
+        Value *Ptr = B.CreateConstInBoundsGEP1_64(Int64Ty, Phi, Counter);
+        B.CreateStore(B.CreateAdd(B.CreateLoad(Int64Ty, Ptr), ConstantInt::get(Int64Ty, 1)), Ptr);
+    }
+
+    PreservedAnalyses AllocTracker::run(Module &M, ModuleAnalysisManager &) {
+        Sites.clear();
+        NumCounters = 0;
+
+        std::vector<std::pair<Instruction *, uint32_t>> Increments;
+        for (Function &F : M) {
+            if (F.isDeclaration() || F.getName().startswith(NOINSTRUMENT_PREFIX))
+                continue;
+            collectSites(F, Increments);
+        }
+
+        if (Sites.empty())
+            return PreservedAnalyses::all();
+
+        LLVMContext &Ctx = M.getContext();
+        Type *Int64Ty = Type::getInt64Ty(Ctx);
+        PointerType *PtrTy = PointerType::get(Ctx, 0);
+
+        // Every thread counts into its own array, so the increments are plain
+        // adds without atomics or cache lines shared between threads. The
+        // runtime keeps the arrays of all threads and sums them at exit.
+        auto *ThreadCounts = new GlobalVariable(M, PtrTy, false, GlobalValue::InternalLinkage,
+                                                ConstantPointerNull::get(PtrTy),
+                                                NOINSTRUMENT_PREFIX "site_counts", nullptr,
+                                                GlobalValue::GeneralDynamicTLSModel);
+        FunctionCallee ThreadCountsFn = M.getOrInsertFunction(NOINSTRUMENT_PREFIX "thread_counts",
+                                                              PtrTy, PtrTy, Int64Ty, Int64Ty);
+        GlobalVariable *Table = createSiteTable(M);
+
+        for (auto &[I, Counter] : Increments)
+            createIncrement(I, Counter, ThreadCounts, ThreadCountsFn, Table);
+
+        LLVM_DEBUG(dbgs() << "stacktrack: " << Sites.size() << " sites, " << NumCounters << " counters\n");
 
         return PreservedAnalyses::none();
     }
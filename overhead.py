@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Vectorised overhead computations for analysis.py
+
+Results are aligned into a single benchmarks x metrics x instances matrix, with
+NaN for missing values, so that overheads, improvements and summary
+statistics are computed with whole-array operations. None of the functions
+modify their inputs.
+"""
+import warnings
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+
+
+class ResultMatrix:
+    """
+    Results of several instances aligned on benchmark and metric.
+
+    ``values[b, m, i]`` is the value of metric ``metrics[m]`` for benchmark
+    ``benchmarks[b]`` in instance ``instances[i]``.
+    """
+
+    def __init__(self, benchmarks, metrics, instances, values):
+        self.benchmarks = list(benchmarks)
+        self.metrics = list(metrics)
+        self.instances = list(instances)
+        self.values = values
+
+    @classmethod
+    def from_results(cls, results, benchmarks=None, metrics=None):
+        """
+        Build the matrix from ``{instance: {bench: {metric: value}}}`` as
+        returned by the collectors. Values that are not numbers (like the
+        "-" of failed benchmarks) become NaN.
+        """
+        instances = list(results)
+
+        if benchmarks is None:
+            benchmarks = sorted(set(b for res in results.values() for b in res))
+        if metrics is None:
+            metrics = list(dict.fromkeys(m for res in results.values()
+                                         for stats in res.values() for m in stats))
+
+        bench_index = {b: i for i, b in enumerate(benchmarks)}
+        metric_index = {m: i for i, m in enumerate(metrics)}
+
+        values = np.full((len(benchmarks), len(metrics), len(instances)), np.nan)
+        for i, instance in enumerate(instances):
+            for bench, stats in results[instance].items():
+                if bench not in bench_index:
+                    continue
+                b = bench_index[bench]
+                for metric, value in stats.items():
+                    if metric in metric_index and isinstance(value, (int, float)):
+                        values[b, metric_index[metric], i] = value
+
+        return cls(benchmarks, metrics, instances, values)
+
+    def instance(self, name):
+        return self.values[:, :, self.instances.index(name)]
+
+    def to_frame(self, values):
+        return pd.DataFrame(values, index=self.benchmarks, columns=self.metrics)
+
+    def to_dict(self, values, mask=None):
+        """
+        Convert a benchmarks x metrics array back into ``{bench: {metric:
+        value}}``, leaving out entries where ``mask`` is false.
+        """
+        if mask is None:
+            mask = ~np.isnan(values)
+
+        result = {}
+        for b, m in zip(*np.nonzero(mask)):
+            result.setdefault(self.benchmarks[b], {})[self.metrics[m]] = float(values[b, m])
+        return result
+
+
+def relative_overhead(values, baseline):
+    """
+    Overhead of ``values`` over ``baseline`` in percent. Missing baseline
+    values count as zero, and where the baseline is zero the value itself is
+    returned, so that counters which are only non-zero in one of the runs
+    (e.g. major-faults) are still shown.
+    """
+    baseline = np.nan_to_num(baseline, nan=0.0)
+    nonzero = baseline != 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        overhead = (values - baseline) / baseline * 100
+
+    return np.where(nonzero, overhead, values)
+
+
+def improvement(before, after):
+    """
+    Relative improvement in percent of the ``after`` overheads compared to
+    the ``before`` overheads. Missing ``after`` values count as zero.
+    """
+    after = np.nan_to_num(after, nan=0.0)
+    diff = before - after
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative = diff / before * 100
+
+    return np.where(before != 0, relative, 100 - diff)
+
+
+def geomean(values, axis=0):
+    """Geometric mean along ``axis``, ignoring NaN."""
+    with warnings.catch_warnings(), np.errstate(divide='ignore', invalid='ignore'):
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.exp(np.nanmean(np.log(values), axis=axis))
+
+
+def mean_confidence_interval(values, axis=0, level=0.95):
+    """
+    Mean along ``axis`` with a two-sided confidence interval, ignoring NaN.
+
+    :returns: ``(mean, low, high)`` arrays
+    """
+    n = np.sum(~np.isnan(values), axis=axis)
+
+    # Columns with less than two values get a NaN interval
+    with warnings.catch_warnings(), np.errstate(divide='ignore', invalid='ignore'):
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean = np.nanmean(values, axis=axis)
+        sem = np.nanstd(values, axis=axis, ddof=1) / np.sqrt(n)
+
+    try:
+        from scipy.stats import t
+        critical = t.ppf((1 + level) / 2, np.maximum(n - 1, 1))
+    except ImportError:
+        critical = NormalDist().inv_cdf((1 + level) / 2)
+
+    return mean, mean - critical * sem, mean + critical * sem
+
+
+def alloc_frame(allocations):
+    """Flatten ``{size: {count, type}}`` into a DataFrame."""
+    return pd.DataFrame({
+        'size': np.fromiter(allocations.keys(), dtype=np.int64, count=len(allocations)),
+        'count': np.fromiter((v['count'] for v in allocations.values()), dtype=np.float64, count=len(allocations)),
+        'type': [v['type'] for v in allocations.values()],
+    })
+
+
+def alloc_count_overhead(test_a, test_b):
+    """
+    Per-size difference of allocation counts from ``test_a`` to ``test_b``
+    in percent of ``test_a``, or the ``test_a`` count for sizes that do not
+    occur in ``test_b``.
+    """
+    a = alloc_frame(test_a).set_index('size')['count']
+    b = alloc_frame(test_b).set_index('size')['count'].reindex(a.index)
+
+    overhead = np.where(b.isna(), a, (b - a) / a * 100)
+    return pd.Series(overhead, index=a.index)
+
+
+def alloc_type_percentages(results):
+    """
+    Percentage of allocations per type for each benchmark in ``{bench:
+    {size: {count, type}}}``.
+
+    :returns: DataFrame indexed by benchmark with a column per type
+    """
+    frames = [alloc_frame(allocs).assign(bench=bench) for bench, allocs in results.items()]
+    if not frames:
+        return pd.DataFrame()
+
+    df = pd.concat(frames, ignore_index=True)
+    counts = df.pivot_table(index='bench', columns='type', values='count', aggfunc='sum', sort=False)
+    return counts.div(counts.sum(axis=1), axis=0) * 100
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Minimal reader for perf.data files written by ``perf record``
+
+Only the parts needed for per-event totals are decoded: the file header, the
+event attributes with their sample IDs, the event names from the EVENT_DESC
+header feature, and the sample records in the data section. The file is
+memory mapped and the data section is streamed record by record, so neither
+perf nor enough memory to hold the file is needed.
+"""
+import mmap
+import struct
+
+PERF_MAGIC = b"PERFILE2"
+
+# Header feature bit holding the event names
+HEADER_EVENT_DESC = 12
+HEADER_FEAT_BITS = 256
+
+PERF_RECORD_SAMPLE = 9
+PERF_RECORD_COMPRESSED = 81
+
+PERF_SAMPLE_IP = 1 << 0
+PERF_SAMPLE_TID = 1 << 1
+PERF_SAMPLE_TIME = 1 << 2
+PERF_SAMPLE_ADDR = 1 << 3
+PERF_SAMPLE_ID = 1 << 6
+PERF_SAMPLE_CPU = 1 << 7
+PERF_SAMPLE_PERIOD = 1 << 8
+PERF_SAMPLE_STREAM_ID = 1 << 9
+PERF_SAMPLE_IDENTIFIER = 1 << 16
+
+PERF_TYPE_HARDWARE = 0
+PERF_TYPE_SOFTWARE = 1
+PERF_TYPE_HW_CACHE = 3
+
+# Names perf uses for generic events, used when a file has no EVENT_DESC
+HARDWARE_EVENTS = ["cycles", "instructions", "cache-references", "cache-misses",
+                   "branches", "branch-misses", "bus-cycles", "stalled-cycles-frontend",
+                   "stalled-cycles-backend", "ref-cycles"]
+SOFTWARE_EVENTS = ["cpu-clock", "task-clock", "faults", "context-switches",
+                   "cpu-migrations", "minor-faults", "major-faults",
+                   "alignment-faults", "emulation-faults", "dummy"]
+CACHE_NAMES = ["L1-dcache", "L1-icache", "LLC", "dTLB", "iTLB", "branch", "node"]
+CACHE_OPS = ["load", "store", "prefetch"]
+
+
+class PerfDataError(Exception):
+    """Raised for files this reader cannot decode."""
+    pass
+
+
+class EventCounts:
+    """
+    Totals of a single event: the number of samples (what ``perf report
+    --stats`` prints as SAMPLE events) and the sum of the sample periods
+    (an estimate of the total number of events).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.samples = 0
+        self.period = 0
+
+    def __repr__(self):
+        return f"EventCounts({self.name!r}, samples={self.samples}, period={self.period})"
+
+
+def generic_event_name(attr_type, config):
+    if attr_type == PERF_TYPE_HARDWARE and config < len(HARDWARE_EVENTS):
+        return HARDWARE_EVENTS[config]
+
+    if attr_type == PERF_TYPE_SOFTWARE and config < len(SOFTWARE_EVENTS):
+        return SOFTWARE_EVENTS[config]
+
+    if attr_type == PERF_TYPE_HW_CACHE:
+        cache, op, result = config & 0xff, (config >> 8) & 0xff, (config >> 16) & 0xff
+        if cache < len(CACHE_NAMES) and op < len(CACHE_OPS):
+            suffix = "-misses" if result else "s"
+            return f"{CACHE_NAMES[cache]}-{CACHE_OPS[op]}{suffix}"
+
+    return f"raw-{attr_type}-{config:#x}"
+
+
+class PerfData:
+    """
+    A memory-mapped perf.data file. Use as a context manager::
+
+        with PerfData(path) as perf:
+            counts = perf.event_counts()
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise PerfDataError(f"{path} is empty")
+
+        try:
+            self._read_header()
+            self._read_attrs()
+            self._read_event_desc()
+        except struct.error:
+            self.close()
+            raise PerfDataError(f"{path} is truncated")
+        except PerfDataError:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def _unpack(self, fmt, offset):
+        return struct.unpack_from(self.endian + fmt, self._map, offset)
+
+    def _read_header(self):
+        magic = self._map[:8]
+        if magic == PERF_MAGIC:
+            self.endian = "<"
+        elif magic == PERF_MAGIC[::-1]:
+            self.endian = ">"
+        else:
+            raise PerfDataError(f"{self.path} is not a perf.data file (pipe mode output is not supported)")
+
+        (self.header_size, self.attr_size,
+         self.attrs_offset, self.attrs_size,
+         self.data_offset, self.data_size,
+         _, _) = self._unpack("8Q", 8)
+
+        features = self._unpack("4Q", 8 + 8 * 8)
+        self.features = [bit for bit in range(HEADER_FEAT_BITS)
+                         if features[bit // 64] & (1 << (bit % 64))]
+
+    def _read_attrs(self):
+        # Each entry is a perf_event_attr followed by a section of sample IDs
+        self.attrs = []
+        self.id_to_attr = {}
+
+        for i in range(self.attrs_size // self.attr_size):
+            offset = self.attrs_offset + i * self.attr_size
+            attr_type, _, config, _, sample_type = self._unpack("IIQQQ", offset)
+            ids_offset, ids_size = self._unpack("QQ", offset + self.attr_size - 16)
+
+            index = len(self.attrs)
+            self.attrs.append({
+                "type": attr_type,
+                "config": config,
+                "sample_type": sample_type,
+                "name": generic_event_name(attr_type, config),
+            })
+            for sample_id in self._unpack(f"{ids_size // 8}Q", ids_offset):
+                self.id_to_attr[sample_id] = index
+
+        if not self.attrs:
+            raise PerfDataError(f"{self.path} has no events")
+
+    def _feature_section(self, feature):
+        # Feature sections are listed after the data section, in bit order
+        if feature not in self.features:
+            return None
+
+        offset = self.data_offset + self.data_size + 16 * self.features.index(feature)
+        return self._unpack("QQ", offset)
+
+    def _read_event_desc(self):
+        section = self._feature_section(HEADER_EVENT_DESC)
+        if section is None:
+            return
+
+        offset, _ = section
+        nr_events, attr_size = self._unpack("II", offset)
+        offset += 8
+
+        for _ in range(nr_events):
+            nr_ids, = self._unpack("I", offset + attr_size)
+            offset += attr_size + 4
+
+            str_len, = self._unpack("I", offset)
+            name = bytes(self._map[offset + 4:offset + 4 + str_len]).split(b"\0", 1)[0].decode()
+            offset += 4 + str_len
+
+            ids = self._unpack(f"{nr_ids}Q", offset)
+            offset += 8 * nr_ids
+
+            for sample_id in ids:
+                if sample_id in self.id_to_attr:
+                    self.attrs[self.id_to_attr[sample_id]]["name"] = name
+
+    def _sample_layout(self):
+        # Byte offsets of the sample ID and period in a sample record body,
+        # perf requires these to be at the same position for all events
+        sample_type = self.attrs[0]["sample_type"]
+
+        id_offset = None
+        if sample_type & PERF_SAMPLE_IDENTIFIER:
+            id_offset = 0
+        elif sample_type & PERF_SAMPLE_ID:
+            id_offset = 8 * sum(1 for bit in (PERF_SAMPLE_IP, PERF_SAMPLE_TID,
+                                              PERF_SAMPLE_TIME, PERF_SAMPLE_ADDR)
+                                if sample_type & bit)
+
+        period_offset = None
+        if sample_type & PERF_SAMPLE_PERIOD:
+            period_offset = 8 * sum(1 for bit in (PERF_SAMPLE_IDENTIFIER, PERF_SAMPLE_IP,
+                                                  PERF_SAMPLE_TID, PERF_SAMPLE_TIME,
+                                                  PERF_SAMPLE_ADDR, PERF_SAMPLE_ID,
+                                                  PERF_SAMPLE_STREAM_ID, PERF_SAMPLE_CPU)
+                                    if sample_type & bit)
+
+        if id_offset is None and len(self.attrs) > 1:
+            raise PerfDataError(f"{self.path} has multiple events but no sample IDs")
+
+        return id_offset, period_offset
+
+    def event_counts(self):
+        """
+        Stream over all sample records and total them per event.
+
+        :returns: ``{event_name: EventCounts}`` for every recorded event
+        """
+        id_offset, period_offset = self._sample_layout()
+
+        counts = [EventCounts(attr["name"]) for attr in self.attrs]
+        per_id = {sample_id: counts[index] for sample_id, index in self.id_to_attr.items()}
+
+        record_header = struct.Struct(self.endian + "IHH")
+        u64 = struct.Struct(self.endian + "Q")
+        buf = self._map
+
+        offset = self.data_offset
+        end = self.data_offset + self.data_size
+        if end > len(buf):
+            raise PerfDataError(f"{self.path} is truncated")
+
+        while offset + record_header.size <= end:
+            record_type, _, size = record_header.unpack_from(buf, offset)
+            if size == 0:
+                raise PerfDataError(f"{self.path} has a corrupt record at offset {offset}")
+
+            if record_type == PERF_RECORD_SAMPLE:
+                body = offset + record_header.size
+
+                if id_offset is None:
+                    event = counts[0]
+                else:
+                    event = per_id.get(u64.unpack_from(buf, body + id_offset)[0])
+
+                if event is not None:
+                    event.samples += 1
+                    if period_offset is not None:
+                        event.period += u64.unpack_from(buf, body + period_offset)[0]
+            elif record_type == PERF_RECORD_COMPRESSED:
+                raise PerfDataError(f"{self.path} has compressed records (perf record -z)")
+
+            offset += size
+
+        return {event.name: event for event in counts}
+
+
+def read_event_counts(path):
+    """
+    Get ``{event_name: EventCounts}`` for a perf.data file.
+
+    :raises PerfDataError: if the file cannot be decoded
+    """
+    with PerfData(path) as perf:
+        return perf.event_counts()
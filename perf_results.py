@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Summarises perftrack results (perf.data files) into per-event counters
+
+Files are decoded natively by perf_data.py, falling back to perf report for
+formats it does not support. Files are summarised concurrently on a process
+pool, and the extracted counters are kept in a sidecar cache in the result
+directory, keyed by file name, size and modification time. Unchanged perf
+files are therefore never read again.
+"""
+import os
+import json
+import shutil
+import sys
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from perf_data import PerfDataError, read_event_counts
+
+CACHE_FILE = ".perf-summary.json"
+
+# Bump this whenever summarise_perf_file changes its output
+CACHE_VERSION = 2
+
+def parse_perf_stats(output):
+    # perf report --stats prints "<event> stats:" followed by the event counts
+    lines = output.split('\n')
+
+    counters = {}
+    for line, next_line in zip(lines, lines[1:]):
+        if not line.rstrip().endswith('stats:'):
+            continue
+
+        try:
+            counters[line.split(':')[0]] = float(next_line.split(':')[1].strip())
+        except (IndexError, ValueError):
+            pass
+
+    return counters
+
+def summarise_perf_file(path):
+    # Decode the file directly where possible, perf is only needed for
+    # formats the native reader does not support
+    try:
+        counts = read_event_counts(path)
+        # Sample counts, which is what perf report --stats reports per event
+        return {name.split(':')[0]: float(event.samples) for name, event in counts.items()}
+    except PerfDataError as e:
+        if shutil.which("perf") is None:
+            print(f"Cannot summarise {path}: {e}", file=sys.stderr)
+            return {}
+
+    result = subprocess.run(["perf", "report", "--stdio", "--stats", "-i", path],
+                            capture_output=True, check=False)
+    return parse_perf_stats(result.stdout.decode('utf-8'))
+
+def file_key(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def load_cache(result_dir):
+    try:
+        with open(os.path.join(result_dir, CACHE_FILE), 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if cache.get("version") != CACHE_VERSION:
+        return {}
+
+    return cache["files"]
+
+def save_cache(result_dir, files):
+    path = os.path.join(result_dir, CACHE_FILE)
+    tmp_path = path + ".tmp"
+
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"version": CACHE_VERSION, "files": files}, f, indent=1)
+    os.replace(tmp_path, path)
+
+def summarise_perf_files(result_dir, file_names, jobs=None):
+    """
+    Get ``{file_name: {event: count}}`` for perf files in ``result_dir``,
+    only running perf for files that are not in the cache or changed since.
+    """
+    cache = load_cache(result_dir)
+
+    summaries = {}
+    todo = {}
+    for file_name in file_names:
+        key = file_key(os.path.join(result_dir, file_name))
+        entry = cache.get(file_name)
+
+        if entry is not None and entry["size"] == key["size"] and entry["mtime_ns"] == key["mtime_ns"]:
+            summaries[file_name] = entry["counters"]
+        else:
+            todo[file_name] = key
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            paths = [os.path.join(result_dir, file_name) for file_name in todo]
+            for file_name, counters in zip(todo, pool.map(summarise_perf_file, paths)):
+                summaries[file_name] = counters
+                cache[file_name] = {**todo[file_name], "counters": counters}
+
+        # Drop entries of files that no longer exist
+        cache = {name: entry for name, entry in cache.items()
+                 if os.path.exists(os.path.join(result_dir, name))}
+        save_cache(result_dir, cache)
+
+    return summaries
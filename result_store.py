@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Columnar store for the results collected by analysis.py
+
+Raw result directories (stacktrack, heaptrack, perftrack and SPEC rusage runs)
+are parsed once and converted into an Arrow IPC file per source directory. All
+results share a single long-format schema keyed by run, instance, benchmark
+and metric, so collectors only have to memory-map a small file instead of
+re-walking and re-parsing the raw results on every invocation.
+
+The stacktrack and heaptrack runtimes write a result file per process. These
+directories are ingested file by file on a process pool, and only new or
+changed files are parsed again when a directory is updated.
+"""
+import os
+import json
+import hashlib
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import alloc_format
+from perf_results import summarise_perf_files
+
+STORE_DIR = os.path.join(os.getcwd(), "results", "store")
+INDEX_FILE = "index.json"
+
+# Bump this whenever the parsers below change their output
+STORE_VERSION = 2
+
+# file is the result file a row was parsed from, for per-process result files
+COLUMNS = ["run", "instance", "file", "benchmark", "metric", "size", "type", "value"]
+CATEGORY_COLUMNS = ["run", "instance", "file", "benchmark", "metric", "type"]
+
+STACK_METRIC = "stack_allocations"
+HEAP_METRIC = "heap_allocations"
+
+# Per function stack allocations are written next to the totals
+SITES_SUFFIX = ".sites"
+
+def bench_name_from_file(file_name):
+    toks = file_name.split('.')
+    return '.'.join([toks[0], toks[1]])
+
+def run_and_instance(result_dir):
+    # results/<run>/<instance> for the tracking runs, results/<run> for spec
+    result_dir = os.path.normpath(result_dir)
+    parent, base = os.path.split(result_dir)
+
+    if os.path.basename(parent) == "results":
+        return base, ""
+
+    return os.path.basename(parent), base
+
+def list_result_files(result_dir):
+    # Skip hidden files such as the perf summary cache
+    for (_, __, files) in os.walk(result_dir):
+        return [f for f in files if not f.startswith('.')]
+    return []
+
+def parse_stack_file(path):
+    # Binary histograms are the default, text is written with RESULT_OUT_FORMAT=text
+    if alloc_format.is_alloc_file(path):
+        yield from alloc_format.iter_records(path)
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            toks = line.split(',')
+            count = int(toks[0].split(' ')[0].strip())
+            size = int(toks[0].split(':')[1].strip())
+            yield size, toks[1].split(':')[1].strip(), count
+
+def parse_stack_sites_file(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            toks = line.rstrip('\n').split(', ')
+            count = int(toks[0].split(' ')[0].strip())
+            size = int(toks[0].split(':')[1].strip())
+            yield toks[2].split(':', 1)[1].strip(), size, toks[1].split(':')[1].strip(), count
+
+def parse_heap_file(path):
+    if alloc_format.is_alloc_file(path):
+        yield from alloc_format.iter_records(path)
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            toks = line.split(',')
+            count = int(toks[0].split(':')[1].strip())
+            size = int(toks[1].split(':')[1].strip())
+            yield size, toks[2].split(':')[1].strip(), count
+
+def parse_alloc_file(path, metric, parse_file):
+    # Stream a single per-process file and merge its histogram, processes
+    # that share an output file append their own histogram to it
+    bench_name = bench_name_from_file(os.path.basename(path))
+
+    counts = {}
+    for size, alloc_type, count in parse_file(path):
+        counts[(size, alloc_type)] = counts.get((size, alloc_type), 0) + count
+
+    return [(bench_name, metric, size, alloc_type, count)
+            for (size, alloc_type), count in counts.items()]
+
+def parse_stack_function_file(path):
+    # The metric column holds the function name for these rows
+    bench_name = bench_name_from_file(os.path.basename(path))
+
+    counts = {}
+    for function, size, alloc_type, count in parse_stack_sites_file(path):
+        key = (function, size, alloc_type)
+        counts[key] = counts.get(key, 0) + count
+
+    return [(bench_name, function, size, alloc_type, count)
+            for (function, size, alloc_type), count in counts.items()]
+
+def is_sites_file(file_name):
+    return file_name.endswith(SITES_SUFFIX)
+
+def is_alloc_file(file_name):
+    return not is_sites_file(file_name)
+
+def parse_perf_dir(result_dir, stats):
+    files = list_result_files(result_dir)
+    summaries = summarise_perf_files(result_dir, files)
+
+    for test_file in files:
+        bench_name = bench_name_from_file(test_file)
+
+        for stat_name, stat_value in summaries[test_file].items():
+            if stat_name in stats:
+                yield bench_name, stat_name, -1, "", stat_value
+
+def spec_report_context(target_name="spec2006"):
+    # The setup is only needed for its context and target definitions, so
+    # create it once and reuse it for every run directory
+    global _spec_setup
+    if _spec_setup is None:
+        from setup import create_setup
+        _spec_setup = create_setup()
+
+    return _spec_setup.ctx, _spec_setup.targets[target_name]
+
+_spec_setup = None
+
+def parse_spec_dir(result_dir, stats, aggregate):
+    from infra.infra.commands.report import load_aggregated
+
+    ctx, target = spec_report_context()
+    fields = [":".join([stat, aggregate]) for stat in stats]
+
+    aggregated = load_aggregated(ctx, target, [result_dir], fields)
+
+    for bench, instance_values in aggregated.items():
+        if not instance_values:
+            continue
+
+        # Like the first columns of the report table, use the first instance
+        values = instance_values[sorted(instance_values)[0]]
+        for stat, field in zip(stats, fields):
+            value = values[field]
+            # Missing results are stored as NaN
+            yield bench, stat, -1, "", float("nan") if value is None else float(value)
+
+
+class ResultStore:
+    """
+    Arrow IPC backed cache of parsed results, one file per source directory.
+
+    A source is re-ingested only when the size or modification time of one of
+    its files changes, so warm loads only stat the raw files.
+    """
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        self.index_path = os.path.join(store_dir, INDEX_FILE)
+        self.frames = {}
+
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+
+    def _key(self, kind, result_dir, params):
+        return json.dumps([kind, os.path.abspath(result_dir), params])
+
+    def _signature(self, result_dir):
+        sig = hashlib.sha1(str(STORE_VERSION).encode())
+        for root, dirs, files in os.walk(result_dir):
+            # Skip hidden files and directories, like list_result_files, since
+            # parsers write their sidecar caches there while loading
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            for name in sorted(f for f in files if not f.startswith('.')):
+                st = os.stat(os.path.join(root, name))
+                sig.update(f"{os.path.join(root, name)}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+        return sig.hexdigest()
+
+    def _files(self, result_dir, select):
+        files = {}
+        for name in list_result_files(result_dir):
+            if select(name):
+                st = os.stat(os.path.join(result_dir, name))
+                files[name] = [st.st_size, st.st_mtime_ns]
+        return files
+
+    def _read(self, key):
+        from pyarrow import feather
+
+        if key not in self.frames:
+            path = os.path.join(self.store_dir, self.index[key]["file"])
+            self.frames[key] = feather.read_table(path, memory_map=True).to_pandas()
+        return self.frames[key]
+
+    def _write(self, kind, key, df, entry):
+        from pyarrow import feather
+
+        file_name = f"{kind}-{hashlib.sha1(key.encode()).hexdigest()[:16]}.arrow"
+
+        os.makedirs(self.store_dir, exist_ok=True)
+        # Uncompressed so that the file can be memory mapped when loading
+        feather.write_feather(df, os.path.join(self.store_dir, file_name),
+                              compression="uncompressed")
+
+        self.index[key] = {**entry, "file": file_name}
+        self._save_index()
+        self.frames[key] = df
+
+    def _save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    def ingest(self, kind, result_dir, rows, params=None):
+        """
+        Convert parsed ``(benchmark, metric, size, type, value)`` rows from
+        ``result_dir`` into a columnar file and register it in the index.
+        """
+        df = make_frame(result_dir, [("", *row) for row in rows])
+        key = self._key(kind, result_dir, params)
+
+        self._write(kind, key, df, {
+            "source": os.path.abspath(result_dir),
+            "signature": self._signature(result_dir),
+        })
+
+        return df
+
+    def load(self, kind, result_dir, parse_dir, params=None):
+        """
+        Get all results of a source directory as a DataFrame, parsing the raw
+        files with ``parse_dir(result_dir, *params)`` only if they changed.
+        """
+        key = self._key(kind, result_dir, params)
+        entry = self.index.get(key)
+
+        if entry is not None and entry.get("signature") == self._signature(result_dir):
+            return self._read(key)
+
+        return self.ingest(kind, result_dir, parse_dir(result_dir, *(params or [])), params)
+
+    def load_files(self, kind, result_dir, parse_file, select, jobs=None):
+        """
+        Like :meth:`load`, for directories with a result file per process.
+        ``parse_file(path)`` returns the rows of a single file, and is only
+        run (on a process pool) for selected files that are new or changed
+        since the last load.
+        """
+        key = self._key(kind, result_dir, None)
+        entry = self.index.get(key)
+        files = self._files(result_dir, select)
+
+        valid = entry is not None and entry.get("version") == STORE_VERSION
+        if valid and entry["files"] == files:
+            return self._read(key)
+
+        unchanged = [name for name, sig in entry["files"].items()
+                     if files.get(name) == sig] if valid else []
+        todo = [name for name in files if name not in unchanged]
+
+        paths = [os.path.join(result_dir, name) for name in todo]
+        if len(paths) > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                parsed = list(pool.map(parse_file, paths))
+        else:
+            parsed = [parse_file(path) for path in paths]
+
+        df = make_frame(result_dir, [(name, *row) for name, rows in zip(todo, parsed) for row in rows])
+        if unchanged:
+            old = self._read(key)
+            df = concat_frames([old[old["file"].isin(unchanged)], df])
+
+        self._write(kind, key, df, {
+            "source": os.path.abspath(result_dir),
+            "version": STORE_VERSION,
+            "files": files,
+        })
+
+        return df
+
+    def query(self, kind, result_dir, parse_dir, params=None, benchmarks=None, metrics=None):
+        return filter_frame(self.load(kind, result_dir, parse_dir, params), benchmarks, metrics)
+
+    def query_files(self, kind, result_dir, parse_file, select, benchmarks=None):
+        # Per-process histograms summed per benchmark
+        df = filter_frame(self.load_files(kind, result_dir, parse_file, select), benchmarks)
+        return (df.groupby(["benchmark", "metric", "size", "type"], observed=True, sort=False)["value"]
+                .sum().reset_index())
+
+    def stack_results(self, result_dir, valid_benches):
+        df = self.query_files("stack", result_dir, partial(parse_alloc_file, metric=STACK_METRIC,
+                                                           parse_file=parse_stack_file),
+                              is_alloc_file, benchmarks=valid_benches)
+        return alloc_dict(df)
+
+    def stack_function_results(self, result_dir, valid_benches):
+        df = self.query_files("stack-functions", result_dir, parse_stack_function_file,
+                              is_sites_file, benchmarks=valid_benches)
+        return function_dict(df)
+
+    def heap_results(self, result_dir, valid_benches):
+        df = self.query_files("heap", result_dir, partial(parse_alloc_file, metric=HEAP_METRIC,
+                                                          parse_file=parse_heap_file),
+                              is_alloc_file, benchmarks=valid_benches)
+        return alloc_dict(df)
+
+    def perf_results(self, result_dir, stats, valid_benches):
+        df = self.query("perf", result_dir, parse_perf_dir, [list(stats)], benchmarks=valid_benches)
+        return stat_dict(df)
+
+    def spec_results(self, result_dir, stats, aggregate):
+        df = self.query("spec", result_dir, parse_spec_dir, [list(stats), aggregate])
+        res = stat_dict(df)
+
+        # Keep the "-" placeholder of the report table for failed benchmarks
+        for bench, vals in res.items():
+            res[bench] = {stat: "-" if value != value else value for stat, value in vals.items()}
+
+        return res
+
+
+def make_frame(result_dir, rows):
+    # rows are (file, benchmark, metric, size, type, value)
+    run, instance = run_and_instance(result_dir)
+    df = pd.DataFrame.from_records(
+        [(run, instance, *row) for row in rows], columns=COLUMNS)
+    df = df.astype({"size": "int64", "value": "float64"})
+    for col in CATEGORY_COLUMNS:
+        df[col] = df[col].astype("category")
+    return df
+
+def concat_frames(frames):
+    # Concatenating categoricals with different categories gives objects
+    df = pd.concat([frame.astype({col: object for col in CATEGORY_COLUMNS}) for frame in frames],
+                   ignore_index=True)
+    for col in CATEGORY_COLUMNS:
+        df[col] = df[col].astype("category")
+    return df
+
+def filter_frame(df, benchmarks=None, metrics=None):
+    mask = pd.Series(True, index=df.index)
+    if benchmarks is not None:
+        mask &= df["benchmark"].isin(benchmarks)
+    if metrics is not None:
+        mask &= df["metric"].isin(metrics)
+
+    return df[mask]
+
+def alloc_dict(df):
+    # {bench: {size: {count, type}}}, later rows overwrite earlier ones like
+    # the raw file parsers used to do
+    result_dict = {}
+    for bench, size, alloc_type, count in zip(df["benchmark"], df["size"], df["type"], df["value"]):
+        result_dict.setdefault(bench, {})[int(size)] = {
+            'count': int(count),
+            'type': alloc_type
+        }
+    return result_dict
+
+def function_dict(df):
+    # {bench: {function: {type: count}}}
+    counts = df.groupby(["benchmark", "metric", "type"], observed=True)["value"].sum()
+
+    result_dict = {}
+    for (bench, function, alloc_type), count in counts.items():
+        result_dict.setdefault(bench, {}).setdefault(function, {})[alloc_type] = int(count)
+    return result_dict
+
+def stat_dict(df):
+    # {bench: {stat: value}}
+    result_dict = {}
+    for bench, stat, value in zip(df["benchmark"], df["metric"], df["value"]):
+        result_dict.setdefault(bench, {})[stat] = float(value)
+    return result_dict
@@ -0,0 +1,99 @@
+// Binary allocation histogram format shared by the heaptrack (mallocwrapper)
+// and stacktrack (registeralloc) runtimes, read by alloc_format.py
+//
+// A file is a sequence of blocks, one per process that wrote to it. Each
+// block is an alloc_header_t, a table of num_types type names, and
+// num_records fixed size records. Everything is in native (little endian)
+// byte order and 8-byte aligned, so the records can be memory mapped as is.
+#ifndef ALLOC_FORMAT_H
+#define ALLOC_FORMAT_H
+
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/uio.h>
+
+#define ALLOC_FORMAT_MAGIC "ALLOCHST"
+#define ALLOC_FORMAT_VERSION 1
+#define ALLOC_FORMAT_NAME_LEN 64
+
+typedef struct {
+    char magic[8];
+    uint32_t version;
+    uint32_t header_size;   // Bytes from the start of the block to the first record
+    uint32_t record_size;
+    uint32_t num_types;
+    uint64_t num_records;
+    uint64_t pid;
+    char benchmark[ALLOC_FORMAT_NAME_LEN];
+    char instance[ALLOC_FORMAT_NAME_LEN];
+} alloc_header_t;
+
+typedef struct {
+    uint64_t count;
+    int64_t size;
+    uint32_t type;          // Index into the type table
+    uint32_t reserved;
+} alloc_record_t;
+
+// RESULT_OUT_FORMAT=text selects the old human readable output for debugging
+static inline int alloc_format_text(void) {
+    const char *format = getenv("RESULT_OUT_FORMAT");
+    return format != NULL && strcmp(format, "text") == 0;
+}
+
+static inline void alloc_format_copy_env(char *dst, const char *name) {
+    const char *value = getenv(name);
+    if (value != NULL)
+        strncpy(dst, value, ALLOC_FORMAT_NAME_LEN - 1);
+}
+
+// Append a block to path with a single write, so that processes sharing
+// an output file do not interleave their blocks. Missing type names (NULL)
+// are written as empty strings.
+static inline int alloc_format_write(const char *path, const char *const *type_names,
+                                     uint32_t num_types, const alloc_record_t *records,
+                                     uint64_t num_records) {
+    alloc_header_t header;
+    memset(&header, 0, sizeof(header));
+    memcpy(header.magic, ALLOC_FORMAT_MAGIC, sizeof(header.magic));
+    header.version = ALLOC_FORMAT_VERSION;
+    header.header_size = sizeof(header) + num_types * ALLOC_FORMAT_NAME_LEN;
+    header.record_size = sizeof(alloc_record_t);
+    header.num_types = num_types;
+    header.num_records = num_records;
+    header.pid = getpid();
+    alloc_format_copy_env(header.benchmark, "RESULT_BENCHMARK");
+    alloc_format_copy_env(header.instance, "RESULT_INSTANCE");
+
+    char *names = (char *)calloc(num_types ? num_types : 1, ALLOC_FORMAT_NAME_LEN);
+    if (names == NULL)
+        return -1;
+
+    for (uint32_t i = 0; i < num_types; i++) {
+        if (type_names[i] != NULL)
+            strncpy(names + i * ALLOC_FORMAT_NAME_LEN, type_names[i], ALLOC_FORMAT_NAME_LEN - 1);
+    }
+
+    struct iovec iov[3] = {
+        { &header, sizeof(header) },
+        { names, num_types * ALLOC_FORMAT_NAME_LEN },
+        { (void *)records, num_records * sizeof(alloc_record_t) },
+    };
+
+    ssize_t expected = iov[0].iov_len + iov[1].iov_len + iov[2].iov_len;
+    ssize_t written = -1;
+
+    int fd = open(path, O_WRONLY | O_CREAT | O_APPEND, 0644);
+    if (fd >= 0) {
+        written = writev(fd, iov, 3);
+        close(fd);
+    }
+    free(names);
+
+    return written == expected ? 0 : -1;
+}
+
+#endif
@@ -0,0 +1,68 @@
+// Allocation heavy microbenchmark to measure the overhead of the wrapper,
+// run with and without LD_PRELOAD by `make bench`
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+#define LIVE_OBJECTS 4096
+#define ITERATIONS   (1 << 23)
+#define REPETITIONS  5
+
+static double now(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + ts.tv_nsec * 1e-9;
+}
+
+static double run(void) {
+    static void *live[LIVE_OBJECTS];
+    unsigned int rng = 12345;
+    double start = now();
+
+    // Replace random live objects with new ones of mostly small sizes, and
+    // touch the memory like a program would
+    for (int i = 0; i < ITERATIONS; i++) {
+        rng = rng * 1103515245 + 12345;
+        unsigned int slot = (rng >> 8) % LIVE_OBJECTS;
+        size_t size = 8 + ((rng >> 20) % 32) * 8;
+        if ((rng & 0xff) == 0)
+            size *= 64;
+
+        free(live[slot]);
+        switch (rng & 0x3) {
+        case 0:
+            live[slot] = calloc(1, size);
+            break;
+        case 1:
+            live[slot] = realloc(malloc(size / 2), size);
+            break;
+        default:
+            live[slot] = malloc(size);
+            break;
+        }
+        memset(live[slot], i, size);
+    }
+
+    double elapsed = now() - start;
+
+    for (int i = 0; i < LIVE_OBJECTS; i++) {
+        free(live[i]);
+        live[i] = NULL;
+    }
+
+    return elapsed;
+}
+
+int main(void) {
+    double best = run();
+
+    for (int i = 1; i < REPETITIONS; i++) {
+        double t = run();
+        if (t < best)
+            best = t;
+    }
+
+    printf("%f\n", best);
+    return 0;
+}
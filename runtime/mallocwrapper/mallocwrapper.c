@@ -1,9 +1,16 @@
 #include <stdio.h>
 #include <stdlib.h>
+#include <stdint.h>
 #include <dlfcn.h>
 #include <string.h>
+#include "../alloc_format.h"
 
-#define MAX_ALLOCS 1000000
+// Open addressing hash table of (type, size) -> count, must be a power of 2
+#define TABLE_BITS 20
+#define TABLE_SIZE (1UL << TABLE_BITS)
+#define TABLE_MASK (TABLE_SIZE - 1)
+
+#define TYPE_BITS 3
 
 typedef struct allocation_t allocation_t;
 
@@ -12,7 +19,7 @@ enum alloc_type {
     CALLOC,
     MALLOC,
     REALLOC,
-    FREE, 
+    FREE,
 };
 
 static const char *const type_names[] = {
@@ -22,13 +29,112 @@ static const char *const type_names[] = {
     [FREE]      = "Free"
 };
 
+// The key packs the size and the type, types are never EMPTY so a zero key
+// marks a free slot. Slots are claimed with a CAS on the key and counted with
+// atomic adds, so no locks are taken on the allocation path.
 struct allocation_t {
-    enum alloc_type type;
-    size_t size;
-    size_t count;
+    uint64_t key;
+    uint64_t count;
+    uint64_t order; // Insertion order + 1, 0 while being claimed
 };
 
-static allocation_t allocs[MAX_ALLOCS] = {0};
+// Each thread counts into a small direct mapped cache of table slots, so
+// repeated allocations of the same size do not contend on the shared
+// counters. Pending counts are added to the table when an entry is evicted
+// and when the program exits. Caches live in a static pool so that they
+// outlive their threads, threads beyond the pool count in the table directly.
+#define CACHE_BITS 10
+#define CACHE_SIZE (1UL << CACHE_BITS)
+#define MAX_CACHES 256
+
+typedef struct {
+    uint64_t key;
+    uint64_t pending;
+    allocation_t *slot;
+} cache_entry_t;
+
+static allocation_t allocs[TABLE_SIZE] = {0};
+static uint64_t next_order = 0;
+static uint64_t dropped = 0;
+
+static cache_entry_t caches[MAX_CACHES][CACHE_SIZE] = {0};
+static uint64_t next_cache = 0;
+static __thread cache_entry_t *thread_cache
+    __attribute__((tls_model("initial-exec"))) = NULL;
+static __thread int thread_uncached
+    __attribute__((tls_model("initial-exec"))) = 0;
+
+extern void *__libc_calloc(size_t, size_t);
+extern void __libc_free(void *);
+
+static inline uint64_t alloc_key(size_t size, enum alloc_type type) {
+    return ((uint64_t)size << TYPE_BITS) | type;
+}
+
+static inline size_t hash_key(uint64_t key) {
+    // Fibonacci hashing, the top bits of the product are the best mixed
+    return (size_t)((key * 0x9e3779b97f4a7c15ULL) >> (64 - TABLE_BITS));
+}
+
+static void flush_entry(cache_entry_t *entry) {
+    if (entry->pending == 0)
+        return;
+
+    if (entry->slot == NULL)
+        __atomic_fetch_add(&dropped, entry->pending, __ATOMIC_RELAXED);
+    else
+        __atomic_fetch_add(&entry->slot->count, entry->pending, __ATOMIC_RELAXED);
+    entry->pending = 0;
+}
+
+static void flush_caches(void) {
+    uint64_t n = __atomic_load_n(&next_cache, __ATOMIC_ACQUIRE);
+
+    for (uint64_t c = 0; c < n && c < MAX_CACHES; c++)
+        for (size_t i = 0; i < CACHE_SIZE; i++)
+            flush_entry(&caches[c][i]);
+}
+
+static void write_text(const char *out_file, allocation_t **ordered, uint64_t n) {
+    FILE *out = fopen(out_file, "a+");
+
+    for (uint64_t i = 0; i < n; i++) {
+        allocation_t *alloc = ordered[i];
+        if (alloc == NULL)
+            continue;
+
+        fprintf(out, "Count:\t%ld, Size:\t%ld, Type:\t%s\n",
+                __atomic_load_n(&alloc->count, __ATOMIC_RELAXED),
+                (size_t)(alloc->key >> TYPE_BITS),
+                type_names[alloc->key & ((1 << TYPE_BITS) - 1)]);
+    }
+
+    fclose(out);
+}
+
+static void write_binary(const char *out_file, allocation_t **ordered, uint64_t n) {
+    alloc_record_t *records = __libc_calloc(n ? n : 1, sizeof(*records));
+    if (records == NULL)
+        return;
+
+    uint64_t num_records = 0;
+    for (uint64_t i = 0; i < n; i++) {
+        allocation_t *alloc = ordered[i];
+        if (alloc == NULL)
+            continue;
+
+        records[num_records].count = __atomic_load_n(&alloc->count, __ATOMIC_RELAXED);
+        records[num_records].size = (int64_t)(alloc->key >> TYPE_BITS);
+        records[num_records].type = alloc->key & ((1 << TYPE_BITS) - 1);
+        num_records++;
+    }
+
+    if (alloc_format_write(out_file, type_names, sizeof(type_names) / sizeof(type_names[0]),
+                           records, num_records) != 0)
+        fprintf(stderr, "Failed to write heap allocations to %s\n", out_file);
+
+    __libc_free(records);
+}
 
 __attribute__((destructor))
 static void write_to_file(void) {
@@ -38,34 +144,90 @@ static void write_to_file(void) {
         return;
 
     fprintf(stderr, "Writing tracked heap allocations to file %s\n", out_file);
-    FILE *out = fopen(out_file, "a+");
 
-    for (int i = 0; i < MAX_ALLOCS; i++) {
-        allocation_t alloc = allocs[i];
-        if (alloc.type == EMPTY)
-            break;
+    flush_caches();
+
+    // Write in order of first occurrence, like the sequential array did
+    uint64_t n = __atomic_load_n(&next_order, __ATOMIC_ACQUIRE);
+    allocation_t **ordered = __libc_calloc(n ? n : 1, sizeof(*ordered));
+    if (ordered == NULL)
+        return;
 
-        fprintf(out, "Count:\t%ld, Size:\t%ld, Type:\t%s\n", alloc.count, alloc.size, type_names[alloc.type]);
+    for (size_t i = 0; i < TABLE_SIZE; i++) {
+        uint64_t order = __atomic_load_n(&allocs[i].order, __ATOMIC_ACQUIRE);
+        if (order != 0 && order <= n)
+            ordered[order - 1] = &allocs[i];
     }
 
-    fclose(out);
+    if (alloc_format_text())
+        write_text(out_file, ordered, n);
+    else
+        write_binary(out_file, ordered, n);
+
+    __libc_free(ordered);
+
+    if (dropped)
+        fprintf(stderr, "Allocation table full, %ld allocations were not tracked\n", dropped);
+}
+
+static allocation_t *find_slot(uint64_t key) {
+    size_t i = hash_key(key);
+
+    for (size_t probes = 0; probes < TABLE_SIZE; probes++, i = (i + 1) & TABLE_MASK) {
+        uint64_t cur = __atomic_load_n(&allocs[i].key, __ATOMIC_ACQUIRE);
+
+        if (cur == EMPTY) {
+            // Claim the slot, if another thread beat us to it check whether
+            // it inserted the same key
+            if (__atomic_compare_exchange_n(&allocs[i].key, &cur, key, 0,
+                                            __ATOMIC_ACQ_REL, __ATOMIC_ACQUIRE)) {
+                uint64_t order = __atomic_add_fetch(&next_order, 1, __ATOMIC_RELAXED);
+                __atomic_store_n(&allocs[i].order, order, __ATOMIC_RELEASE);
+                return &allocs[i];
+            }
+        }
+
+        if (cur == key)
+            return &allocs[i];
+    }
+
+    return NULL;
+}
+
+static cache_entry_t *get_thread_cache(void) {
+    if (thread_cache == NULL && !thread_uncached) {
+        uint64_t c = __atomic_fetch_add(&next_cache, 1, __ATOMIC_ACQ_REL);
+        if (c < MAX_CACHES)
+            thread_cache = caches[c];
+        else
+            thread_uncached = 1;
+    }
+
+    return thread_cache;
 }
 
 static void register_alloc(size_t size, enum alloc_type type) {
-    int i = 0;
-
-    while(  allocs[i].type != EMPTY &&
-            (allocs[i].type != type || 
-            allocs[i].size != size))
-        i += 1;
-
-    if (allocs[i].type == EMPTY) {
-        allocs[i].type = type;
-        allocs[i].size = size;
-        allocs[i].count = 1;
-    } else {
-        allocs[i].count += 1;
+    uint64_t key = alloc_key(size, type);
+    cache_entry_t *cache = get_thread_cache();
+
+    if (cache == NULL) {
+        allocation_t *slot = find_slot(key);
+        if (slot == NULL)
+            __atomic_fetch_add(&dropped, 1, __ATOMIC_RELAXED);
+        else
+            __atomic_fetch_add(&slot->count, 1, __ATOMIC_RELAXED);
+        return;
+    }
+
+    cache_entry_t *entry = &cache[hash_key(key) & (CACHE_SIZE - 1)];
+
+    if (entry->key != key) {
+        flush_entry(entry);
+        entry->key = key;
+        entry->slot = find_slot(key);
     }
+
+    entry->pending++;
 }
 
 void *malloc(size_t size) {
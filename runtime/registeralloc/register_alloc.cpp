@@ -1,21 +1,25 @@
 #include <map>
+#include <mutex>
+#include <vector>
 #include <cstring>
 #include <iostream>
 #include <fstream>
 #include <iomanip>
 #include <cstdlib>
+#include <cstdint>
+#include <string>
+#include <tuple>
 #include <llvm/IR/Type.h>
+#include "../alloc_format.h"
 
 #define NOINSTRUMENT(name) __noinstrument_##name
 #define NOINSTRUMENT_PREFIX "__noinstrument_"
 #define DEFAULT_OUTFILE "stacktrack.txt"
+#define SITES_SUFFIX ".sites"
 
 using namespace std;
 
 namespace {
-    // Maps type ID and size to their count
-    static map<pair<long long int, int>, long long int> allocations;
-    
     const char *const type_names[] = {
         [llvm::Type::TypeID::HalfTyID]      = "16-bit floating point",
         [llvm::Type::TypeID::BFloatTyID]    = "16-bit floating point (7-bit significand)",
@@ -41,12 +45,73 @@ namespace {
         // [llvm::Type::TypeID::TargetExtTyID]         = "Target extension"
     };
 
-    
+
+    const int num_types = sizeof(type_names) / sizeof(type_names[0]);
+
+    // Alloca site as described by the side table of the AllocTracker pass
+    struct Site {
+        uint32_t counter;
+        uint32_t size;
+        uint32_t typeID;
+        const char *function;
+    };
+
+    // Sites of an instrumented module and the counters of every thread that
+    // executed it. Counters are never freed so that counts of exited threads
+    // are kept until they are merged in save_allocs.
+    struct SiteModule {
+        const Site *sites;
+        uint64_t num_sites;
+        vector<const uint64_t *> thread_counters;
+    };
+
+    static mutex sites_lock;
+    static map<const Site *, SiteModule> *site_modules;
+
+    // Called by code instrumented by the pass on the first increment of every
+    // thread, the returned counters are then incremented inline by that
+    // thread only
     extern "C" __attribute__((nothrow))
-    void NOINSTRUMENT(register_alloc)(int alloc_size, int typeID) {
-        allocations[make_pair(alloc_size, typeID)] += 1;
+    uint64_t *NOINSTRUMENT(thread_counts)(const Site *sites, uint64_t num_sites, uint64_t num_counters) {
+        uint64_t *counters = new uint64_t[num_counters]();
+
+        lock_guard<mutex> guard(sites_lock);
+        if (site_modules == nullptr)
+            site_modules = new map<const Site *, SiteModule>();
+
+        SiteModule &module = (*site_modules)[sites];
+        module.sites = sites;
+        module.num_sites = num_sites;
+        module.thread_counters.push_back(counters);
+
+        return counters;
+    }
+
+    // Maps function, size and type ID to their count
+    typedef map<tuple<string, long long int, int>, long long int> function_allocs_t;
+
+    static function_allocs_t NOINSTRUMENT(merge_sites)() {
+        function_allocs_t function_allocs;
+
+        lock_guard<mutex> guard(sites_lock);
+        if (site_modules == nullptr)
+            return function_allocs;
+
+        for (const auto& [sites, module]: *site_modules) {
+            for (const uint64_t *counters : module.thread_counters) {
+                for (uint64_t i = 0; i < module.num_sites; i++) {
+                    const Site &site = module.sites[i];
+                    long long int count = counters[site.counter];
+
+                    if (count)
+                        function_allocs[make_tuple(string(site.function), site.size, site.typeID)] += count;
+                }
+            }
+        }
+
+        return function_allocs;
     }
-    
+
     __attribute__((destructor))
     static void NOINSTRUMENT(save_allocs)() {
         char *out_file = getenv("RESULT_OUT_FILE");
@@ -54,20 +119,50 @@ namespace {
         if (out_file == NULL)
             return;
 
+        function_allocs_t function_allocs = NOINSTRUMENT(merge_sites)();
+
+        // Maps size and type ID to their count, summed over all functions
+        map<pair<long long int, int>, long long int> allocations;
+        for (const auto& [key, val]: function_allocs)
+            allocations[make_pair(get<1>(key), get<2>(key))] += val;
+
         if (allocations.size() == 0) {
             cerr << "No Allocations to store "  << endl;
             return;
         }
 
-        ofstream file;
-        file.open(out_file, ofstream::out | ofstream::app);
-
         cerr << "Storing " << allocations.size() << " allocation sizes to file " << out_file << endl;
 
-        for (const auto& [key, val]: allocations) {
-            file << val << " allocations size: " << key.first << ", type: " << type_names[key.second] << endl;
+        if (alloc_format_text()) {
+            ofstream file;
+            file.open(out_file, ofstream::out | ofstream::app);
+
+            for (const auto& [key, val]: allocations) {
+                file << val << " allocations size: " << key.first << ", type: " << type_names[key.second] << endl;
+            }
+
+            file.close();
+        } else {
+            vector<alloc_record_t> records;
+            for (const auto& [key, val]: allocations)
+                records.push_back({(uint64_t)val, key.first, (uint32_t)key.second, 0});
+
+            if (alloc_format_write(out_file, type_names, num_types, records.data(), records.size()) != 0)
+                cerr << "Failed to write allocations to " << out_file << endl;
+        }
+
+        if (function_allocs.size() == 0)
+            return;
+
+        // Per function counts go to a separate file next to the totals
+        ofstream sites_file;
+        sites_file.open(string(out_file) + SITES_SUFFIX, ofstream::out | ofstream::app);
+
+        for (const auto& [key, val]: function_allocs) {
+            sites_file << val << " allocations size: " << get<1>(key) << ", type: " << type_names[get<2>(key)]
+                       << ", function: " << get<0>(key) << endl;
         }
 
-        file.close();
+        sites_file.close();
     }
 }
\ No newline at end of file
@@ -144,7 +144,8 @@ class LibMallocTrack(inf.Instance):
         result_dir = os.path.join(ctx.paths.root, "results", datestr, self.name)
 
         ctx.target_pre_bench = f"mkdir -p {result_dir}"
-        ctx.target_specrun_wrapper = f"""RESULT_OUT_FILE={result_dir}/$benchmark.txt.\$\$ \
+        ctx.target_specrun_wrapper = f"""RESULT_OUT_FILE={result_dir}/$benchmark.alloc.\$\$ \
+                                 RESULT_BENCHMARK=$benchmark RESULT_INSTANCE={self.name} \
                                  LD_PRELOAD={libpath}/{self.so_name} $command"""
 
         self.san_instance.configure(ctx)
@@ -181,7 +182,8 @@ class LibStackTrack(inf.Instance):
         # Set some context values for result collection for perf
         ctx.target_pre_bench = f"mkdir -p {result_dir}"
 
-        ctx.target_specrun_wrapper = f"""RESULT_OUT_FILE={result_dir}/$benchmark.txt.\$\$ \
+        ctx.target_specrun_wrapper = f"""RESULT_OUT_FILE={result_dir}/$benchmark.alloc.\$\$ \
+                                  RESULT_BENCHMARK=$benchmark RESULT_INSTANCE={self.name} \
                                   LD_PRELOAD={libpath}/libstacktrack.so $command"""
 
         # Configure all used classes
@@ -262,7 +264,11 @@ class LibMallocwrapperRuntime(inf.Package):
     def configure(self, ctx):
         pass
 
-if __name__ == "__main__":
+def create_setup():
+    """
+    Register all instances and targets, shared by the command line and by
+    analysis scripts that load results in-process.
+    """
     setup = inf.Setup(__file__)
 
     # Basic Instances with no sanitizers
@@ -317,5 +323,8 @@ if __name__ == "__main__":
         patches=['asan', 'msan']
     ))
 
-    setup.main()
-    
\ No newline at end of file
+    return setup
+
+
+if __name__ == "__main__":
+    create_setup().main()